@@ -0,0 +1,232 @@
+# benchmarks/cold_start.py
+#
+# Cold-start benchmark of the API: every run starts a fresh server process, as a scale-to-zero
+# host would, and measures the import of main.py, the time until the server answers, the time to
+# the first /chat answer and the time until GET /ready reports the warm-up as done. The LLM and
+# embedding backends are the offline fakes of benchmarks.load_test (see benchmarks.cold_start_server).
+#
+#   python -m benchmarks.cold_start [--runs 5] [--json results.json]
+#   python -m benchmarks.cold_start --after-warm          # first /chat only once /ready is 200
+#   python -m benchmarks.cold_start --import-profile 15   # slowest modules imported by main.py
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import httpx
+import numpy as np
+
+from benchmarks.cold_start_server import IMPORT_FILE
+from benchmarks.load_test import (
+    MODEL_NAME,
+    REPO_ROOT,
+    app_environment,
+    free_port,
+    git_commit,
+    load_questions,
+    log,
+    prepare_app,
+)
+
+USERNAME = "coldstart"
+TOKEN_FILE = "cold_start_token.txt"
+
+
+def prepare(workdir: str, docs: str) -> None:
+    """Index the public PDFs and create the benchmark user in workdir (run in its own process)."""
+    app_output = io.StringIO()
+    with contextlib.redirect_stdout(app_output):
+        prepare_app(workdir, docs, llm_latency=0, embed_latency=0)
+        from database import auth, database, models
+
+        with database.SessionLocal() as db:
+            if db.query(models.User).filter(models.User.username == USERNAME).first() is None:
+                db.add(models.User(
+                    username=USERNAME, email=f"{USERNAME}@example.com", hashed_password=auth.hash_password(USERNAME)
+                ))
+                db.commit()
+        token = auth.create_access_token({"sub": USERNAME})
+    with open(os.path.join(workdir, TOKEN_FILE), "w") as f:
+        f.write(token)
+
+
+def wait_for(client: httpx.Client, path: str, deadline: float, expect: int = 200) -> float:
+    """Poll path until it returns expect; return the time it did (perf_counter)."""
+    while True:
+        try:
+            if client.get(path).status_code == expect:
+                return time.perf_counter()
+        except httpx.HTTPError:
+            pass
+        if time.perf_counter() > deadline:
+            raise SystemExit(f"Timed out waiting for {path}")
+        time.sleep(0.01)
+
+
+def run_once(workdir: str, args, question: Dict[str, str], run: int) -> Dict[str, Any]:
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(os.path.join(workdir, IMPORT_FILE))
+    with open(os.path.join(workdir, TOKEN_FILE)) as f:
+        headers = {"Authorization": f"Bearer {f.read().strip()}"}
+
+    port = free_port()
+    command = [
+        sys.executable, "-m", "benchmarks.cold_start_server", workdir, str(port),
+        "--llm-latency", str(args.llm_latency), "--embed-latency", str(args.embed_latency),
+    ]
+    env = dict(os.environ, **app_environment(workdir), PYTHONPATH=REPO_ROOT)
+    env["WARMUP_MODELS"] = MODEL_NAME
+    output = None if args.verbose else subprocess.DEVNULL
+
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=output, stderr=output)
+    try:
+        deadline = start + args.timeout
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=args.timeout) as client:
+            serving = wait_for(client, "/health", deadline)
+            warm = wait_for(client, "/ready", deadline) if args.after_warm else None
+
+            # A new question every run, so the query embedding is never already cached
+            message = f"{question['question']} (run {run})"
+            payload = {"model_name": MODEL_NAME, "pdf_name": question["pdf_name"], "messages": [message]}
+            chat_start = time.perf_counter()
+            response = client.post("/chat", json=payload, headers=headers)
+            chat_end = time.perf_counter()
+            if response.status_code != 200:
+                raise SystemExit(f"/chat failed with {response.status_code}: {response.text}")
+
+            if warm is None:
+                warm = wait_for(client, "/ready", deadline)
+            steps = client.get("/ready").json()["steps"]
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    with open(os.path.join(workdir, IMPORT_FILE)) as f:
+        import_seconds = json.load(f)["import_seconds"]
+    return {
+        "import_s": round(import_seconds, 3),
+        "serving_s": round(serving - start, 3),
+        "first_chat_s": round(chat_end - start, 3),
+        "first_chat_ms": round((chat_end - chat_start) * 1000, 1),
+        "warm_s": round(warm - start, 3),
+        "warmup_steps": {name: step["seconds"] for name, step in steps.items()},
+    }
+
+
+def import_profile(workdir: str, top: int) -> List[Dict[str, Any]]:
+    """Modules imported directly by main.py, slowest first (python -X importtime)."""
+    env = dict(os.environ, **app_environment(workdir), PYTHONPATH=REPO_ROOT)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=workdir, env=env, capture_output=True, text=True, check=True,
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # main itself has no indent, the modules it imports have two spaces
+        if cumulative.strip().isdigit() and name.startswith("   ") and not name.startswith("    "):
+            modules.append({"module": name.strip(), "cumulative_ms": round(int(cumulative) / 1000, 1)})
+    return sorted(modules, key=lambda m: m["cumulative_ms"], reverse=True)[:top]
+
+
+def print_results(runs: List[Dict[str, Any]], summary: Dict[str, float]) -> None:
+    header = f"{'run':>4} {'import s':>9} {'serving s':>10} {'first chat s':>13} {'chat ms':>9} {'warm s':>8}"
+    print(header)
+    print("-" * len(header))
+    for i, run in enumerate(runs, 1):
+        print(
+            f"{i:>4} {run['import_s']:>9.3f} {run['serving_s']:>10.3f} {run['first_chat_s']:>13.3f} "
+            f"{run['first_chat_ms']:>9.1f} {run['warm_s']:>8.3f}"
+        )
+    print(
+        f"{'p50':>4} {summary['import_s']:>9.3f} {summary['serving_s']:>10.3f} {summary['first_chat_s']:>13.3f} "
+        f"{summary['first_chat_ms']:>9.1f} {summary['warm_s']:>8.3f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start benchmark: import time and time to the first /chat")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh server processes to start")
+    parser.add_argument("--after-warm", action="store_true", help="Send the first /chat only once /ready is 200")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds per fake LLM call")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="Seconds per fake embeddings request")
+    parser.add_argument("--import-profile", type=int, default=0, metavar="N", help="Also list the N slowest imports of main.py")
+    parser.add_argument("--docs", default=os.path.join(REPO_ROOT, "uploaded_docs"), help="PDFs indexed as public documents")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds to wait for each server")
+    parser.add_argument("--workdir", help="Scratch directory for the app's files (default: a temporary directory)")
+    parser.add_argument("--keep", action="store_true", help="Do not delete the scratch directory")
+    parser.add_argument("--verbose", action="store_true", help="Show the servers' own output")
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this JSON file")
+    # Internal: the process that indexes the documents before the runs
+    parser.add_argument("--prepare", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.prepare:
+        return prepare(args.prepare, args.docs)
+
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="clausewise-cold-")
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        log(f"Preparing the app in {workdir}")
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.cold_start", "--prepare", workdir, "--docs", os.path.abspath(args.docs)],
+            cwd=REPO_ROOT, env=dict(os.environ, PYTHONPATH=REPO_ROOT), check=True,
+        )
+        questions = load_questions()
+        public = {os.path.splitext(name)[0] for name in os.listdir(os.path.join(workdir, "uploaded_docs"))}
+        question = next((q for q in questions if q["pdf_name"] in public), None)
+        if question is None:
+            raise SystemExit("No evaluation question matches the public documents")
+
+        runs = []
+        for i in range(args.runs):
+            log(f"Run {i + 1}/{args.runs}")
+            runs.append(run_once(workdir, args, question, i))
+        profile = import_profile(workdir, args.import_profile) if args.import_profile else []
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    metrics = ("import_s", "serving_s", "first_chat_s", "first_chat_ms", "warm_s")
+    summary = {metric: round(float(np.median([run[metric] for run in runs])), 3) for metric in metrics}
+    print(
+        f"{args.runs} cold starts, first /chat {'after warm-up' if args.after_warm else 'as soon as serving'}, "
+        f"fake LLM {args.llm_latency}s, fake embeddings {args.embed_latency}s\n"
+    )
+    print_results(runs, summary)
+    if profile:
+        print("\nSlowest imports of main.py:")
+        for module in profile:
+            print(f"{module['cumulative_ms']:>9.1f} ms  {module['module']}")
+
+    if args.json_path:
+        report = {
+            "commit": git_commit(),
+            "settings": {
+                "after_warm": args.after_warm,
+                "llm_latency": args.llm_latency,
+                "embed_latency": args.embed_latency,
+                "cpu_count": os.cpu_count(),
+            },
+            "summary": summary,
+            "runs": runs,
+            "import_profile": profile,
+        }
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
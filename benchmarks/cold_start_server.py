@@ -0,0 +1,53 @@
+# benchmarks/cold_start_server.py
+#
+# Server process started by benchmarks.cold_start for each run. Only the standard library is
+# imported before main.py, so the measured import is as cold as in the container.
+#
+#   python -m benchmarks.cold_start_server WORKDIR PORT [--llm-latency 0.5] [--embed-latency 0.05]
+
+import argparse
+import json
+import os
+import time
+
+IMPORT_FILE = "cold_start_import.json"
+
+
+def serve(workdir: str, port: int, llm_latency: float, embed_latency: float) -> None:
+    os.chdir(workdir)
+    start = time.perf_counter()
+    import main
+    import_seconds = time.perf_counter() - start
+
+    import llms.registry
+    from benchmarks.load_test import FakeChatModel, FakeEmbeddings
+    from vectorstore import faiss_db
+    from vectorstore.embedding_cache import LazyEmbeddings
+
+    # The fakes are built through the same lazy paths as the real clients, and import their SDKs,
+    # so the first request (or the warm-up) still pays what it pays in production
+    def load_llm(model_name, **kwargs):
+        import langchain_openai  # noqa: F401
+        return FakeChatModel(latency=llm_latency)
+
+    def embeddings():
+        from langchain_community.embeddings import OpenAIEmbeddings  # noqa: F401
+        return FakeEmbeddings(embed_latency)
+
+    llms.registry.load_llm = load_llm
+    faiss_db.embedding_model.embeddings = LazyEmbeddings(embeddings)
+    with open(IMPORT_FILE, "w") as f:
+        json.dump({"import_seconds": import_seconds}, f)
+
+    import uvicorn
+    uvicorn.run(main.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the app for one cold-start run")
+    parser.add_argument("workdir")
+    parser.add_argument("port", type=int)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    args = parser.parse_args()
+    serve(args.workdir, args.port, args.llm_latency, args.embed_latency)
@@ -0,0 +1,130 @@
+# benchmarks/collection_updates.py
+#
+# Cost of collection writes against the collection size: adding a document, replacing it and
+# deleting it go through the same path as uploads and DELETE /documents (faiss_db._update), on
+# collections of growing size. Compaction is disabled while timing, so the numbers are what a
+# request pays; the compaction itself (the background merge) is timed separately.
+#
+#   python -m benchmarks.collection_updates [--sizes 10000,50000,200000] [--dim 1536] [--doc-chunks 200]
+#   python -m benchmarks.collection_updates --index-type hnsw --json results.json
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.index_types import synthetic_vectors
+from vectorstore import document_collection, faiss_db
+from vectorstore.document_collection import DocumentCollection
+
+OWNER = "benchmark"
+
+
+def chunk_rows(prefix: str, vectors: np.ndarray):
+    return [(f"{prefix} chunk {i}", vector) for i, vector in enumerate(vectors)], [{} for _ in vectors]
+
+
+def build(vectors: np.ndarray, docs: int, index_type: str) -> None:
+    """Write a compacted collection of the given vectors, split into docs documents."""
+
+    def create(collection, staging):
+        collection = DocumentCollection.create(staging, vectors.shape[1], faiss_db.embedding_model.namespace)
+        for doc, part in enumerate(np.array_split(vectors, docs)):
+            collection.add(f"doc{doc}", *chunk_rows(f"doc{doc}", part))
+        return collection
+
+    faiss_db._update(OWNER, create)
+    staging = tempfile.mkdtemp(dir=faiss_db.COLLECTIONS_DIR)
+    current = DocumentCollection.open(faiss_db.get_collection_path(OWNER), writable=True)
+    compacted = current.compact(staging, configured=index_type)
+    compacted.save(staging)
+    compacted.close()
+    current.close()
+    faiss_db._swap(OWNER, staging)
+
+
+def timed_update(change) -> float:
+    start = time.perf_counter()
+    faiss_db._update(OWNER, change)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark collection update cost against collection size")
+    parser.add_argument("--sizes", default="10000,50000,200000", help="Collection sizes (vectors) to try")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--doc-chunks", type=int, default=200, help="Chunks of the document added, replaced and deleted")
+    parser.add_argument("--docs", type=int, default=100, help="Documents the collection is split into")
+    parser.add_argument("--index-type", default="auto", help="Base index type: auto, flat, hnsw or ivfpq")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="collection-updates-")
+    faiss_db.COLLECTIONS_DIR = workdir
+    # Timed writes must not trigger (or wait for) a compaction
+    document_collection.COLLECTION_MAX_DELTAS = 10 ** 9
+    document_collection.COLLECTION_COMPACT_MIN_VECTORS = 10 ** 12
+    faiss_db._compacting.add(OWNER)
+
+    rows = []
+    try:
+        for size in [int(size) for size in args.sizes.split(",")]:
+            shutil.rmtree(workdir)
+            os.makedirs(workdir)
+            vectors = synthetic_vectors(size, args.dim)
+            build(vectors, args.docs, args.index_type)
+            update = synthetic_vectors(args.doc_chunks, args.dim, seed=size)
+
+            def add(collection, staging):
+                collection.remove("added")
+                collection.add("added", *chunk_rows("added", update))
+                return collection
+
+            def delete(collection, staging):
+                collection.remove("added")
+                return collection
+
+            add_ms, replace_ms, delete_ms = [], [], []
+            for _ in range(args.repeat):
+                add_ms.append(timed_update(add))
+                replace_ms.append(timed_update(add))
+                delete_ms.append(timed_update(delete))
+
+            start = time.perf_counter()
+            faiss_db.compact_collection(OWNER, force=True)
+            compact_ms = (time.perf_counter() - start) * 1000
+            collection = faiss_db.load_collection(OWNER)
+            rows.append({
+                "vectors": size,
+                "index": collection.index_type,
+                "add_ms": round(float(np.median(add_ms)), 1),
+                "replace_ms": round(float(np.median(replace_ms)), 1),
+                "delete_ms": round(float(np.median(delete_ms)), 1),
+                "compact_ms": round(compact_ms, 1),
+            })
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"dim {args.dim}, {args.doc_chunks}-chunk document, median of {args.repeat} runs\n")
+    header = f"{'vectors':>9} {'index':<6} {'add ms':>8} {'replace ms':>11} {'delete ms':>10} {'compact ms':>11}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(
+            f"{row['vectors']:>9} {row['index']:<6} {row['add_ms']:>8.1f} {row['replace_ms']:>11.1f} "
+            f"{row['delete_ms']:>10.1f} {row['compact_ms']:>11.1f}"
+        )
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"dim": args.dim, "doc_chunks": args.doc_chunks, "results": rows}, f, indent=2)
+        print(f"Results written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
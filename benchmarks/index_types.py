@@ -0,0 +1,122 @@
+# benchmarks/index_types.py
+#
+# Recall vs latency of the FAISS index types against the exact (flat) baseline.
+#
+#   python -m benchmarks.index_types [--vectors 50000] [--dim 1536] [--queries 200] [--k 5] [--json results.json]
+#   python -m benchmarks.index_types --collection public    # use the vectors of a real collection
+
+import argparse
+import json
+import time
+
+import faiss
+import numpy as np
+
+from vectorstore import index_types
+
+
+def synthetic_vectors(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    """Clustered vectors, closer to real embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, n // 500), dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), n)] + 0.3 * rng.normal(size=(n, dim)).astype(np.float32)
+    return vectors.astype(np.float32)
+
+
+def collection_vectors(owner: str) -> np.ndarray:
+    from vectorstore.faiss_db import load_collection
+
+    collection = load_collection(owner)
+    if collection is None:
+        raise SystemExit(f"No collection found for {owner}")
+    return collection.vectors(collection.labels())
+
+
+def timed_search(index, queries: np.ndarray, k: int, params) -> tuple:
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], k, params=params)
+        latencies.append(time.perf_counter() - start)
+        results.append(ids[0])
+    return np.array(results), np.array(latencies) * 1000
+
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FAISS index types (recall vs latency)")
+    parser.add_argument("--vectors", type=int, default=50000, help="Synthetic corpus size")
+    parser.add_argument("--dim", type=int, default=1536, help="Synthetic vector dimension")
+    parser.add_argument("--collection", help="Benchmark the vectors of this owner's collection instead")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--ef-search", default="16,32,64,128,256", help="HNSW efSearch values to try")
+    parser.add_argument("--nprobe", default="1,4,16,64", help="IVF nprobe values to try")
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    vectors = collection_vectors(args.collection) if args.collection else synthetic_vectors(args.vectors, args.dim)
+    rng = np.random.default_rng(1)
+    # Queries are perturbed corpus vectors, like questions about text that is in the documents
+    queries = vectors[rng.integers(0, len(vectors), args.queries)]
+    queries = (queries + 0.1 * rng.normal(size=queries.shape)).astype(np.float32)
+    faiss.omp_set_num_threads(1)  # per-query latency as seen by one request
+
+    rows = []
+    truth = None
+    for kind in index_types.INDEX_TYPES:
+        if kind == "ivfpq" and len(vectors) < index_types.min_ivfpq_vectors(len(vectors)):
+            print(f"Skipping ivfpq: {len(vectors)} vectors are too few to train it")
+            continue
+        start = time.perf_counter()
+        index = index_types.build_index(kind, vectors)
+        build_seconds = time.perf_counter() - start
+        size = index_types.bytes_per_vector(index)
+
+        if kind == "hnsw":
+            settings = [("efSearch", int(v)) for v in args.ef_search.split(",")]
+        elif kind == "ivfpq":
+            settings = [("nprobe", int(v)) for v in args.nprobe.split(",")]
+        else:
+            settings = [(None, None)]
+
+        for name, value in settings:
+            params = index_types.search_params(
+                index, k=args.k,
+                ef_search=value if name == "efSearch" else None,
+                nprobe=value if name == "nprobe" else None,
+            )
+            found, latencies = timed_search(index, queries, args.k, params)
+            if truth is None:
+                truth = found  # flat comes first and is exact
+            rows.append({
+                "index": kind,
+                "param": f"{name}={value}" if name else "-",
+                "recall": round(recall(found, truth), 4),
+                "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+                "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+                "bytes_per_vector": round(size, 1),
+                "build_seconds": round(build_seconds, 2),
+            })
+
+    print(f"{len(vectors)} vectors, dim {vectors.shape[1]}, {len(queries)} queries, recall@{args.k} vs flat\n")
+    header = f"{'index':<7} {'param':<14} {'recall':>7} {'p50 ms':>8} {'p95 ms':>8} {'bytes/vec':>10} {'build s':>8}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(
+            f"{row['index']:<7} {row['param']:<14} {row['recall']:>7.4f} {row['p50_ms']:>8.3f} "
+            f"{row['p95_ms']:>8.3f} {row['bytes_per_vector']:>10.1f} {row['build_seconds']:>8.2f}"
+        )
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"vectors": len(vectors), "dim": int(vectors.shape[1]), "k": args.k, "results": rows}, f, indent=2)
+        print(f"Results written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,448 @@
+# benchmarks/load_test.py
+#
+# Offline load test of the API. The app runs in-process (uvicorn on localhost) in a scratch
+# directory, with deterministic fake LLM and embedding backends of configurable latency, so no
+# network or API keys are needed. The PDFs in uploaded_docs/ are indexed as the public documents.
+#
+#   python -m benchmarks.load_test [--requests 100] [--concurrency 16] [--json results.json]
+#   python -m benchmarks.load_test --llm-latency 0.8 --embed-latency 0.1 --endpoints chat,available_pdfs
+#   python -m benchmarks.load_test --json after.json --compare before.json    # compare with an earlier run
+#   LOCAL_EMBEDDING_MODEL=/models/all-MiniLM-L6-v2 python -m benchmarks.load_test --local-embeddings
+
+import argparse
+import asyncio
+import contextlib
+import glob
+import io
+import itertools
+import json
+import os
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINTS = ("login", "available_pdfs", "chat", "upload_pdf")
+MODEL_NAME = "gpt-4o"
+PASSWORD = "load-test-password"
+
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic hash-based vectors; each call sleeps latency seconds like a remote API request."""
+
+    def __init__(self, latency: float, size: int = 1536):
+        self.latency = latency
+        self._fake = DeterministicFakeEmbedding(size=size)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency)
+        return self._fake.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency)
+        return self._fake.embed_query(text)
+
+
+class FakeChatModel(BaseChatModel):
+    """Returns a fixed answer after latency seconds."""
+
+    latency: float = 0.5
+    answer: str = "The notice period is thirty (30) days, as stated in the termination clause."
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-latency"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer))])
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def peak_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    return round(resource.getrusage(who).ru_maxrss / 1024, 1)  # ru_maxrss is in KB on Linux
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def log(message: str) -> None:
+    # stdout belongs to the app (and is silenced unless --verbose)
+    print(message, file=sys.stderr, flush=True)
+
+
+def load_questions() -> List[Dict[str, str]]:
+    with open(os.path.join(REPO_ROOT, "evaluation_data.json")) as f:
+        data = json.load(f)
+    return [{"pdf_name": item["pdf_name"], "question": qa["question"]} for item in data for qa in item["qa_pairs"]]
+
+
+def app_environment(workdir: str) -> Dict[str, str]:
+    """Environment that keeps the app's caches in workdir and needs no real API keys."""
+    return {
+        "OPENAI_API_KEY": "load-test",
+        "TAVILY_API_KEY": "load-test",
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embedding_cache.sqlite3"),
+        "EXTRACTED_TEXT_CACHE_DIR": os.path.join(workdir, "extracted_text_cache"),
+        "WARMUP_MODELS": "",
+        "EMBEDDING_BACKEND": "openai",
+    }
+
+
+def prepare_app(workdir: str, docs: str, llm_latency: float, embed_latency: float, local_embeddings: bool = False):
+    """
+    Import the app inside workdir (database, indexes and caches all live there), swap in the
+    fake backends and index the public PDFs. Returns the FastAPI app.
+    With local_embeddings the real local embedding backend (LOCAL_EMBEDDING_MODEL) is used instead of the fake one.
+    """
+    public_dir = os.path.join(workdir, "uploaded_docs")
+    os.makedirs(public_dir, exist_ok=True)
+    pdfs = sorted(glob.glob(os.path.join(docs, "*.pdf")))
+    if not pdfs:
+        raise SystemExit(f"No PDFs found in {docs}")
+    for pdf in pdfs:
+        shutil.copy(pdf, public_dir)
+
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    os.chdir(workdir)
+    os.environ.update(app_environment(workdir))
+    if local_embeddings:
+        os.environ["EMBEDDING_BACKEND"] = "local"
+
+    from vectorstore import faiss_db
+    if not local_embeddings:
+        faiss_db.embedding_model.embeddings = FakeEmbeddings(embed_latency)
+
+    import main
+    main.llm_registry._llms[MODEL_NAME] = FakeChatModel(latency=llm_latency)
+    from parsers.file_parser import parse_and_chunk
+
+    documents: Dict[str, list] = {}
+    paths = [os.path.join("uploaded_docs", os.path.basename(pdf)) for pdf in pdfs]
+    for chunk in parse_and_chunk(paths, username="public"):
+        documents.setdefault(os.path.splitext(os.path.basename(chunk.metadata["source"]))[0], []).append(chunk)
+    faiss_db.add_documents("public", documents)
+    return main.app
+
+
+class ServerThread:
+    """uvicorn serving the app on localhost from a background thread."""
+
+    def __init__(self, app, port: int):
+        import uvicorn
+
+        self.url = f"http://127.0.0.1:{port}"
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self) -> "ServerThread":
+        self.thread.start()
+        while not self.server.started:
+            if not self.thread.is_alive():
+                raise SystemExit("The API server failed to start")
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=30)
+
+
+async def run_phase(
+    name: str,
+    send: Callable[[httpx.AsyncClient, int], Any],
+    ok: Callable[[httpx.Response], bool],
+    client: httpx.AsyncClient,
+    total: int,
+    concurrency: int,
+) -> Dict[str, Any]:
+    """Send total requests from concurrency workers and summarize their latencies."""
+    latencies, statuses = [], Counter()
+    errors = 0
+    counter = itertools.count()
+
+    async def worker():
+        nonlocal errors
+        while (i := next(counter)) < total:
+            start = time.perf_counter()
+            try:
+                response = await send(client, i)
+                statuses[str(response.status_code)] += 1
+                errors += 0 if ok(response) else 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    ms = np.array(latencies) * 1000
+    return {
+        "endpoint": name,
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "statuses": dict(statuses),
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(float(ms.mean()), 2),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        "max_ms": round(float(ms.max()), 2),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+async def wait_for_jobs(client: httpx.AsyncClient, jobs: List[tuple], timeout: float) -> Dict[str, Any]:
+    """Poll the accepted uploads until they finish; report end-to-end ingestion times."""
+    deadline = time.monotonic() + timeout
+    pending, finished = list(jobs), []
+    while pending and time.monotonic() < deadline:
+        still_pending = []
+        for job_id, headers in pending:
+            job = (await client.get(f"/jobs/{job_id}", headers=headers)).json()
+            if job.get("status") in ("completed", "failed"):
+                finished.append(job)
+            else:
+                still_pending.append((job_id, headers))
+        pending = still_pending
+        if pending:
+            await asyncio.sleep(0.2)
+
+    seconds = np.array([job["finished_at"] - job["created_at"] for job in finished if job["status"] == "completed"])
+    return {
+        "jobs_completed": int(len(seconds)),
+        "jobs_failed": sum(job["status"] == "failed" for job in finished),
+        "jobs_timed_out": len(pending),
+        "ingest_p50_s": round(float(np.percentile(seconds, 50)), 3) if len(seconds) else None,
+        "ingest_p95_s": round(float(np.percentile(seconds, 95)), 3) if len(seconds) else None,
+    }
+
+
+async def run_load(base_url: str, args, public_pdfs: List[str]) -> List[Dict[str, Any]]:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        # Accounts and tokens are set up first and not measured
+        users = [f"loaduser{i}" for i in range(args.users)]
+        for username in users:
+            await client.post("/signup", json={"username": username, "email": f"{username}@example.com", "password": PASSWORD})
+        tokens = []
+        for username in users:
+            response = await client.post("/login", data={"username": username, "password": PASSWORD})
+            response.raise_for_status()
+            tokens.append({"Authorization": f"Bearer {response.json()['access_token']}"})
+
+        available = {os.path.splitext(name)[0] for name in public_pdfs}
+        fallback = sorted(available)[0]
+        questions = load_questions()
+        pdf_bytes = [(name, open(os.path.join("uploaded_docs", name), "rb").read()) for name in public_pdfs]
+        upload_jobs = []
+
+        def headers(i: int) -> dict:
+            return tokens[i % len(tokens)]
+
+        async def login(client, i):
+            return await client.post("/login", data={"username": users[i % len(users)], "password": PASSWORD})
+
+        async def available_pdfs(client, i):
+            return await client.get("/available_pdfs", headers=headers(i))
+
+        async def chat(client, i):
+            item = questions[i % len(questions)]
+            question = item["question"]
+            if not args.repeat_questions:
+                question = f"{question} (request {i})"  # every request takes the full retrieval + LLM path
+            payload = {
+                "model_name": MODEL_NAME,
+                "pdf_name": item["pdf_name"] if item["pdf_name"] in available else fallback,
+                "messages": [question],
+            }
+            return await client.post("/chat", json=payload, headers=headers(i))
+
+        async def upload_pdf(client, i):
+            name, content = pdf_bytes[i % len(pdf_bytes)]
+            files = {"file": (f"load_{i}_{name}", content, "application/pdf")}
+            response = await client.post("/upload_pdf", files=files, headers=headers(i))
+            if response.status_code == 202:
+                upload_jobs.append((response.json()["job_id"], headers(i)))
+            return response
+
+        def chat_ok(response):
+            return response.status_code == 200 and "error" not in response.json()
+
+        def status_ok(response):
+            return response.is_success
+
+        phases = {
+            "login": (login, status_ok, args.requests),
+            "available_pdfs": (available_pdfs, status_ok, args.requests),
+            "chat": (chat, chat_ok, args.requests),
+            "upload_pdf": (upload_pdf, status_ok, args.uploads),
+        }
+        results = []
+        for name in args.endpoints:
+            send, ok, total = phases[name]
+            log(f"Running {name}: {total} requests, concurrency {args.concurrency}")
+            result = await run_phase(name, send, ok, client, total, args.concurrency)
+            if name == "upload_pdf":
+                result.update(await wait_for_jobs(client, upload_jobs, args.timeout))
+                result["peak_rss_mb"] = peak_rss_mb()
+                result["peak_rss_children_mb"] = peak_rss_mb(resource.RUSAGE_CHILDREN)
+            results.append(result)
+        return results
+
+
+def print_results(results: List[Dict[str, Any]]) -> None:
+    header = (
+        f"{'endpoint':<15} {'reqs':>6} {'errors':>6} {'req/s':>8} {'p50 ms':>9} "
+        f"{'p95 ms':>9} {'p99 ms':>9} {'peak RSS MB':>12}"
+    )
+    print(header)
+    print("-" * len(header))
+    for row in results:
+        print(
+            f"{row['endpoint']:<15} {row['requests']:>6} {row['errors']:>6} {row['throughput_rps']:>8.1f} "
+            f"{row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f} {row['peak_rss_mb']:>12.1f}"
+        )
+        if "jobs_completed" in row:
+            print(
+                f"{'':<15} ingestion: {row['jobs_completed']} completed, {row['jobs_failed']} failed, "
+                f"{row['jobs_timed_out']} timed out, p50 {row['ingest_p50_s']} s, p95 {row['ingest_p95_s']} s"
+            )
+
+
+def print_comparison(results: List[Dict[str, Any]], baseline_path: str) -> None:
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    before = {row["endpoint"]: row for row in baseline["results"]}
+    print(f"\nCompared with {baseline_path} (commit {baseline.get('commit')}):")
+    header = f"{'endpoint':<15} {'p50':>16} {'p95':>16} {'p99':>16} {'req/s':>14}"
+    print(header)
+    print("-" * len(header))
+
+    def change(metric: str, old: Dict[str, Any], new: Dict[str, Any]) -> str:
+        if not old[metric]:
+            return "-"
+        return f"{new[metric]:.1f} ({(new[metric] / old[metric] - 1) * 100:+.0f}%)"
+
+    for row in results:
+        old = before.get(row["endpoint"])
+        if old is None:
+            continue
+        print(
+            f"{row['endpoint']:<15} {change('p50_ms', old, row):>16} {change('p95_ms', old, row):>16} "
+            f"{change('p99_ms', old, row):>16} {change('throughput_rps', old, row):>14}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test of the API with fake LLM and embedding backends")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help=f"Comma separated, from: {', '.join(ENDPOINTS)}")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per endpoint (except uploads)")
+    parser.add_argument("--uploads", type=int, default=20, help="Requests for upload_pdf")
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight at once")
+    parser.add_argument("--users", type=int, default=8, help="Accounts the requests are spread over")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds per fake LLM call")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="Seconds per fake embeddings request")
+    parser.add_argument("--local-embeddings", action="store_true", help="Use the local embedding model (LOCAL_EMBEDDING_MODEL) instead of the fake")
+    parser.add_argument("--repeat-questions", action="store_true", help="Send questions verbatim, so repeats hit the answer cache")
+    parser.add_argument("--docs", default=os.path.join(REPO_ROOT, "uploaded_docs"), help="PDFs indexed as public documents")
+    parser.add_argument("--timeout", type=float, default=300, help="Per-request and ingestion timeout in seconds")
+    parser.add_argument("--workdir", help="Scratch directory for the app's files (default: a temporary directory)")
+    parser.add_argument("--keep", action="store_true", help="Do not delete the scratch directory")
+    parser.add_argument("--verbose", action="store_true", help="Show the app's own output")
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON file of an earlier run to compare against")
+    args = parser.parse_args()
+    args.endpoints = [name.strip() for name in args.endpoints.split(",") if name.strip()]
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+    json_path = os.path.abspath(args.json_path) if args.json_path else None
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+    docs = os.path.abspath(args.docs)
+
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix="clausewise-load-")
+    os.makedirs(workdir, exist_ok=True)
+    cwd = os.getcwd()
+    app_output = sys.stdout if args.verbose else io.StringIO()
+    try:
+        log(f"Preparing the app in {workdir}")
+        with contextlib.redirect_stdout(app_output):
+            setup_start = time.perf_counter()
+            app = prepare_app(workdir, docs, args.llm_latency, args.embed_latency, args.local_embeddings)
+            setup_seconds = time.perf_counter() - setup_start
+            public_pdfs = sorted(name for name in os.listdir("uploaded_docs") if name.endswith(".pdf"))
+            with ServerThread(app, free_port()) as server:
+                results = asyncio.run(run_load(server.url, args, public_pdfs))
+            from parsers.file_parser import shutdown_pool
+            shutdown_pool()
+    finally:
+        os.chdir(cwd)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "commit": git_commit(),
+        "settings": {
+            "concurrency": args.concurrency,
+            "users": args.users,
+            "llm_latency": args.llm_latency,
+            "embed_latency": args.embed_latency,
+            "local_embeddings": args.local_embeddings,
+            "repeat_questions": args.repeat_questions,
+            "public_documents": len(public_pdfs),
+            "cpu_count": os.cpu_count(),
+        },
+        "setup_seconds": round(setup_seconds, 2),
+        "peak_rss_mb": peak_rss_mb(),
+        "results": results,
+    }
+    print(
+        f"{len(public_pdfs)} public documents, concurrency {args.concurrency}, "
+        f"fake LLM {args.llm_latency}s, "
+        f"{'local embeddings' if args.local_embeddings else f'fake embeddings {args.embed_latency}s'}\n"
+    )
+    print_results(results)
+    if compare_path:
+        print_comparison(results, compare_path)
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# benchmarks/pdf_backends.py
+#
+# Compare PDF text extraction backends on the PDFs in uploaded_docs/.
+#
+#   python -m benchmarks.pdf_backends [--docs uploaded_docs] [--repeat 3] [--json results.json]
+
+import argparse
+import glob
+import json
+import os
+import tempfile
+import time
+
+from parsers import pdf_backends, text_cache
+from parsers.file_parser import load_file
+
+
+def extract_all(file_path: str, backend: str) -> int:
+    _, labels = pdf_backends.read_info(file_path, backend)
+    texts = pdf_backends.extract_texts(file_path, 0, len(labels), backend)
+    return sum(len(text) for text in texts)
+
+
+def best_of(repeat: int, func, *args) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PDF extraction backends")
+    parser.add_argument("--docs", default="uploaded_docs", help="Directory searched recursively for PDFs")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement (best is reported)")
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    pdfs = sorted(glob.glob(os.path.join(args.docs, "**", "*.pdf"), recursive=True))
+    if not pdfs:
+        raise SystemExit(f"No PDFs found under {args.docs}")
+
+    backends = [b for b in pdf_backends.BACKENDS if pdf_backends.resolve_backend(b) == b]
+    results = []
+
+    # Use a throwaway cache directory so the "cached" column measures a warm cache only
+    with tempfile.TemporaryDirectory() as cache_dir:
+        text_cache.EXTRACTED_TEXT_CACHE_DIR = cache_dir
+        for pdf in pdfs:
+            pages = pdf_backends.read_info(pdf, backends[0])[0]["total_pages"]
+            row = {"file": os.path.relpath(pdf, args.docs), "pages": pages}
+            for backend in backends:
+                chars = extract_all(pdf, backend)
+                seconds = best_of(args.repeat, extract_all, pdf, backend)
+                row[backend] = {"seconds": round(seconds, 4), "pages_per_second": round(pages / seconds, 1), "chars": chars}
+
+            # Warm the cache with the default backend, then time cached loads
+            pdf_backends.PDF_BACKEND = backends[0]
+            load_file(pdf)
+            row["cached_seconds"] = round(best_of(args.repeat, load_file, pdf), 4)
+            results.append(row)
+
+    header = f"{'file':<45} {'pages':>5} " + " ".join(f"{b + ' s':>12}" for b in backends) + f" {'cached s':>10}"
+    print(header)
+    print("-" * len(header))
+    for row in results:
+        timings = " ".join(f"{row[b]['seconds']:>12.4f}" for b in backends)
+        print(f"{row['file']:<45} {row['pages']:>5} {timings} {row['cached_seconds']:>10.4f}")
+
+    totals = {b: sum(row[b]["seconds"] for row in results) for b in backends}
+    print("\nTotal: " + ", ".join(f"{b} {t:.3f}s" for b, t in totals.items()))
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"results": results, "totals": totals}, f, indent=2)
+        print(f"Results written to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+# database/catalog.py
+
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import func, inspect, text
+from sqlalchemy.exc import IntegrityError
+
+from database.database import SessionLocal
+from database.models import Document
+
+STATUS_INDEXING = "indexing"
+STATUS_READY = "ready"
+STATUS_FAILED = "failed"
+# Found on disk (e.g. a public PDF copied into uploaded_docs/) but not in any index
+STATUS_NOT_INDEXED = "not_indexed"
+
+# Identifies this API process on the rows of the jobs it runs; every worker process has its own
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+# Each process refreshes the heartbeat of its rows still indexing this often; rows whose heartbeat is older
+# than INDEXING_STALE_SECONDS belong to a process that died and are marked failed by the others
+INDEXING_HEARTBEAT_SECONDS = float(os.getenv("INDEXING_HEARTBEAT_SECONDS", "30"))
+INDEXING_STALE_SECONDS = float(os.getenv("INDEXING_STALE_SECONDS", "300"))
+
+_heartbeat_stop = threading.Event()
+_heartbeat_thread: Optional[threading.Thread] = None
+
+_FIELDS = (
+    "owner", "pdf_name", "filename", "content_hash", "size_bytes", "page_count", "chunk_count",
+    "index_path", "index_type", "index_bytes", "status", "error",
+)
+
+
+def _as_dict(document: Document) -> dict:
+    fields = {name: getattr(document, name) for name in _FIELDS}
+    fields["updated_at"] = document.updated_at.isoformat() if document.updated_at else None
+    return fields
+
+
+def _upsert(owner: str, pdf_name: str, **fields) -> None:
+    """Create or update the catalog row of (owner, pdf_name)."""
+    for attempt in range(2):
+        with SessionLocal() as db:
+            document = db.query(Document).filter(Document.owner == owner, Document.pdf_name == pdf_name).first()
+            if document is None:
+                document = Document(owner=owner, pdf_name=pdf_name)
+                db.add(document)
+            for name, value in fields.items():
+                setattr(document, name, value)
+            try:
+                db.commit()
+                return
+            except IntegrityError:
+                # Another upload of the same document inserted the row first; update it instead
+                db.rollback()
+                if attempt:
+                    raise
+
+
+def upgrade_schema(engine) -> None:
+    """Add the documents columns introduced after the table was first created (create_all only creates tables)."""
+    columns = {column["name"] for column in inspect(engine).get_columns(Document.__tablename__)}
+    with engine.begin() as connection:
+        for name, column_type in (("worker_id", "VARCHAR"), ("heartbeat_at", "DATETIME")):
+            if name not in columns:
+                connection.execute(text(f"ALTER TABLE {Document.__tablename__} ADD COLUMN {name} {column_type}"))
+
+
+def record_upload(owner: str, filename: str, content_hash: str, size_bytes: int) -> None:
+    """Register a new or replaced upload, indexed by this process; it stays out of listings until its index is written."""
+    _upsert(
+        owner, os.path.splitext(filename)[0],
+        filename=filename, content_hash=content_hash, size_bytes=size_bytes, status=STATUS_INDEXING,
+        page_count=None, chunk_count=None, index_bytes=None, error=None,
+        worker_id=WORKER_ID, heartbeat_at=datetime.utcnow(),
+    )
+
+
+def mark_ready(owner: str, pdf_name: str, **fields) -> None:
+    """Record the indexed document (page_count, chunk_count, index_path, index_type, index_bytes)."""
+    _upsert(owner, pdf_name, status=STATUS_READY, error=None, worker_id=None, heartbeat_at=None, **fields)
+
+
+def mark_failed(owner: str, pdf_name: str, error: str) -> None:
+    _upsert(owner, pdf_name, status=STATUS_FAILED, error=error, worker_id=None, heartbeat_at=None)
+
+
+def heartbeat() -> int:
+    """Refresh the heartbeat of the rows this process is indexing; returns how many there are."""
+    with SessionLocal() as db:
+        alive = (
+            db.query(Document)
+            .filter(Document.status == STATUS_INDEXING, Document.worker_id == WORKER_ID)
+            .update(
+                {Document.heartbeat_at: datetime.utcnow(), Document.updated_at: Document.updated_at},
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+    return alive
+
+
+def reclaim_stale() -> int:
+    """
+    Mark failed the rows left "indexing" by processes that stopped (no heartbeat for INDEXING_STALE_SECONDS,
+    or none at all: rows from before heartbeats existed). Jobs of live processes are left alone.
+    """
+    stale_before = datetime.utcnow() - timedelta(seconds=INDEXING_STALE_SECONDS)
+    with SessionLocal() as db:
+        reclaimed = (
+            db.query(Document)
+            .filter(
+                Document.status == STATUS_INDEXING,
+                Document.worker_id.is_distinct_from(WORKER_ID),
+                (Document.heartbeat_at == None) | (Document.heartbeat_at < stale_before),  # noqa: E711
+            )
+            .update(
+                {
+                    Document.status: STATUS_FAILED,
+                    Document.error: "Indexing was interrupted, please upload it again.",
+                    Document.worker_id: None,
+                    Document.heartbeat_at: None,
+                },
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+    if reclaimed:
+        print(f"Marked {reclaimed} documents left indexing by a stopped process as failed.")
+    return reclaimed
+
+
+def start_heartbeat() -> None:
+    """Refresh this process's heartbeats and reclaim stale rows every INDEXING_HEARTBEAT_SECONDS, in a background thread."""
+    global _heartbeat_thread
+    if _heartbeat_thread is not None:
+        return
+
+    def run():
+        while not _heartbeat_stop.wait(INDEXING_HEARTBEAT_SECONDS):
+            try:
+                heartbeat()
+                reclaim_stale()
+            except Exception as e:
+                print(f"Catalog heartbeat failed: {e}")
+
+    _heartbeat_stop.clear()
+    _heartbeat_thread = threading.Thread(target=run, name="catalog-heartbeat", daemon=True)
+    _heartbeat_thread.start()
+
+
+def stop_heartbeat() -> None:
+    global _heartbeat_thread
+    _heartbeat_stop.set()
+    _heartbeat_thread = None
+
+
+def revert_upload(owner: str, pdf_name: str, previous: Optional[dict], error: str) -> None:
+    """
+    Undo record_upload for an upload whose indexing job was never queued, so it is not left "indexing".
+    A replaced document that was ready goes back to its previous row, anything else is marked failed.
+    """
+    if previous is not None and previous["status"] == STATUS_READY:
+        _upsert(owner, pdf_name, worker_id=None, heartbeat_at=None, **{
+            name: value for name, value in previous.items() if name not in ("owner", "pdf_name", "updated_at")
+        })
+    else:
+        mark_failed(owner, pdf_name, error)
+
+
+def remove(owner: str, pdf_names: List[str]) -> int:
+    """Delete the catalog rows of the given documents, returning how many existed."""
+    with SessionLocal() as db:
+        removed = (
+            db.query(Document)
+            .filter(Document.owner == owner, Document.pdf_name.in_(pdf_names))
+            .delete(synchronize_session=False)
+        )
+        db.commit()
+    return removed
+
+
+def ready_filenames(owners: List[str]) -> Dict[str, List[str]]:
+    """Return the filenames of the ready documents of each owner, in one query."""
+    with SessionLocal() as db:
+        rows = (
+            db.query(Document.owner, Document.filename)
+            .filter(Document.owner.in_(owners), Document.status == STATUS_READY)
+            .order_by(Document.filename)
+            .all()
+        )
+    filenames: Dict[str, List[str]] = {owner: [] for owner in owners}
+    for owner, filename in rows:
+        filenames[owner].append(filename)
+    return filenames
+
+
+def find(owners: List[str], pdf_name: str) -> Dict[str, str]:
+    """Return {owner: status} for the owners that have a document called pdf_name."""
+    with SessionLocal() as db:
+        rows = (
+            db.query(Document.owner, Document.status)
+            .filter(Document.owner.in_(owners), Document.pdf_name == pdf_name)
+            .all()
+        )
+    return dict(rows)
+
+
+def get(owner: str, pdf_name: str) -> Optional[dict]:
+    with SessionLocal() as db:
+        document = db.query(Document).filter(Document.owner == owner, Document.pdf_name == pdf_name).first()
+        return _as_dict(document) if document is not None else None
+
+
+def find_indexed(content_hash: str, owner: Optional[str] = None) -> Optional[dict]:
+    """
+    Return a ready document with this content whose chunks can be reused: owner's own copy if there is one,
+    else one of any owner. Which one was found is for internal use only, never tell the uploader about another owner's.
+    """
+    with SessionLocal() as db:
+        document = (
+            db.query(Document)
+            .filter(Document.content_hash == content_hash, Document.status == STATUS_READY)
+            .order_by((Document.owner == owner).desc(), Document.updated_at.desc())
+            .first()
+        )
+        return _as_dict(document) if document is not None else None
+
+
+def has_content(content_hash: str) -> bool:
+    """Whether any document, of any owner and status, has this content."""
+    with SessionLocal() as db:
+        return db.query(Document.id).filter(Document.content_hash == content_hash).first() is not None
+
+
+def list_documents(owners: List[str]) -> List[dict]:
+    with SessionLocal() as db:
+        documents = (
+            db.query(Document)
+            .filter(Document.owner.in_(owners))
+            .order_by(Document.owner, Document.filename)
+            .all()
+        )
+        return [_as_dict(document) for document in documents]
+
+
+def stats(owners: Optional[List[str]] = None) -> List[dict]:
+    """Per owner and status: documents, pages, chunks and index bytes, for capacity planning (only owners, if given)."""
+    with SessionLocal() as db:
+        query = db.query(
+            Document.owner,
+            Document.status,
+            func.count(Document.id),
+            func.coalesce(func.sum(Document.page_count), 0),
+            func.coalesce(func.sum(Document.chunk_count), 0),
+            func.coalesce(func.sum(Document.index_bytes), 0),
+            func.coalesce(func.sum(Document.size_bytes), 0),
+        )
+        if owners is not None:
+            query = query.filter(Document.owner.in_(owners))
+        rows = (
+            query.group_by(Document.owner, Document.status)
+            .order_by(Document.owner, Document.status)
+            .all()
+        )
+    return [
+        {
+            "owner": owner, "status": status, "documents": documents, "pages": pages,
+            "chunks": chunks, "index_bytes": index_bytes, "pdf_bytes": pdf_bytes,
+        }
+        for owner, status, documents, pages, chunks, index_bytes, pdf_bytes in rows
+    ]
+
+
+def sync_from_disk(
+    upload_folder: str,
+    describe: Callable[[str], Dict[str, dict]],
+    file_hash: Callable[[str], str],
+    page_count: Callable[[str, str], Optional[int]],
+) -> int:
+    """
+    Add catalog rows for PDFs that are on disk but not catalogued yet (public documents
+    copied into upload_folder, uploads from before the catalog existed). Run once at startup.
+
+    - describe(owner) returns {pdf_name: index fields} for the documents in the owner's index
+    - page_count(file_path, content_hash) returns the PDF's pages (None if it cannot be read)
+    - Rows still "indexing" whose process stopped sending heartbeats are marked failed (see reclaim_stale);
+      those of other live workers (several uvicorn workers, a rolling restart) keep indexing
+    - Returns the number of rows added
+    """
+    reclaim_stale()
+
+    owners = {"public": upload_folder}
+    for name in os.listdir(upload_folder):
+        if os.path.isdir(os.path.join(upload_folder, name)):
+            owners[name] = os.path.join(upload_folder, name)
+
+    with SessionLocal() as db:
+        known = set(db.query(Document.owner, Document.filename).all())
+
+    added = 0
+    for owner, folder in owners.items():
+        missing = [
+            filename for filename in sorted(os.listdir(folder))
+            if filename.endswith(".pdf") and (owner, filename) not in known
+        ]
+        if not missing:
+            continue
+        indexed = describe(owner)
+        for filename in missing:
+            file_path = os.path.join(folder, filename)
+            pdf_name = os.path.splitext(filename)[0]
+            index_fields: Optional[dict] = indexed.get(pdf_name)
+            content_hash = file_hash(file_path)
+            _upsert(
+                owner, pdf_name,
+                filename=filename,
+                content_hash=content_hash,
+                size_bytes=os.path.getsize(file_path),
+                page_count=page_count(file_path, content_hash),
+                status=STATUS_READY if index_fields is not None else STATUS_NOT_INDEXED,
+                **(index_fields or {}),
+            )
+            added += 1
+    return added
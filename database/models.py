@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, String, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -10,3 +12,28 @@ class User(Base):
     username = Column(String, unique=True, index=True, nullable=False)
     email = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
+
+class Document(Base):
+    """Catalog entry for an uploaded PDF and the collection index holding its chunks."""
+    __tablename__ = "documents"
+    # Also the index for "documents of these owners" and "this document of these owners" lookups
+    __table_args__ = (UniqueConstraint("owner", "pdf_name", name="uq_documents_owner_pdf_name"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    owner = Column(String, nullable=False)  # username, or "public"
+    pdf_name = Column(String, nullable=False)  # filename without extension, as stored in the index
+    filename = Column(String, nullable=False)
+    content_hash = Column(String, index=True)
+    size_bytes = Column(Integer)
+    page_count = Column(Integer)
+    chunk_count = Column(Integer)
+    index_path = Column(String)
+    index_type = Column(String)
+    index_bytes = Column(Integer)  # this document's share of its collection's index file
+    status = Column(String, nullable=False, default="indexing")  # indexing, ready, failed, not_indexed
+    error = Column(String)
+    # While indexing: the API process running the job, and when it last reported that the job is alive
+    worker_id = Column(String)
+    heartbeat_at = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
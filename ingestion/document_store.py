@@ -0,0 +1,101 @@
+# ingestion/document_store.py
+
+import hashlib
+import os
+import shutil
+import tempfile
+import uuid
+from typing import BinaryIO, List, Tuple
+
+# Uploaded files are stored once per distinct content, as objects/<sha256[:2]>/<sha256>; the users' copies under
+# uploaded_docs/ carry the file name and extension
+DOCUMENT_STORE_DIR = os.getenv("DOCUMENT_STORE_DIR", "document_store")
+# Largest accepted upload (defaults to 50 MB)
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds MAX_UPLOAD_BYTES."""
+
+
+def object_path(content_hash: str) -> str:
+    path = os.path.join(DOCUMENT_STORE_DIR, "objects", content_hash[:2], content_hash)
+    # Stores written before objects lost their extension saved every upload as <sha256>.pdf
+    legacy_path = f"{path}.pdf"
+    return legacy_path if not os.path.exists(path) and os.path.exists(legacy_path) else path
+
+
+def store_upload(stream: BinaryIO, max_bytes: int = MAX_UPLOAD_BYTES) -> Tuple[str, int, str, bool]:
+    """
+    Copy an upload into the content-addressed store in fixed-size chunks, hashing as it goes,
+    and return (sha256, size, object path, whether this call created the object).
+
+    - Memory use is one chunk, whatever the upload size
+    - Raises UploadTooLargeError as soon as more than max_bytes have been read
+    - Content that is already stored is not written twice
+    """
+    objects_dir = os.path.join(DOCUMENT_STORE_DIR, "objects")
+    os.makedirs(objects_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(prefix=".upload.", dir=objects_dir)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for block in iter(lambda: stream.read(UPLOAD_CHUNK_BYTES), b""):
+                size += len(block)
+                if size > max_bytes:
+                    raise UploadTooLargeError(f"File is larger than the upload limit of {max_bytes} bytes.")
+                digest.update(block)
+                f.write(block)
+
+        content_hash = digest.hexdigest()
+        path = object_path(content_hash)
+        created = not os.path.exists(path)
+        if created:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_path, path)
+        else:
+            os.remove(temp_path)
+        return content_hash, size, path, created
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def discard_objects(paths: List[str]) -> None:
+    """Remove stored objects that nothing links to, e.g. those of a batch rejected part way through."""
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def release_object(content_hash: str) -> bool:
+    """
+    Remove the stored object of content_hash once no user's copy links to it any more (its link count is 1).
+    The caller checks that no catalog entry has this content: copies made where hard links fail are not counted.
+    """
+    path = object_path(content_hash)
+    try:
+        if os.stat(path).st_nlink > 1:
+            return False
+        os.remove(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def link_object(path: str, destination: str) -> None:
+    """
+    Make destination (a user's copy under uploaded_docs/) point at a stored object.
+    Hard links share the bytes on disk; a plain copy is the fallback across filesystems.
+    Replaces any earlier file at destination atomically.
+    """
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    temp_path = f"{destination}.{uuid.uuid4().hex}.tmp"
+    try:
+        os.link(path, temp_path)
+    except OSError:
+        shutil.copyfile(path, temp_path)
+    os.replace(temp_path, destination)
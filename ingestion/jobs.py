@@ -0,0 +1,167 @@
+# ingestion/jobs.py
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from monitoring.metrics import INGESTION_JOBS, timed_pipeline
+
+# Number of uploads parsed/embedded at the same time
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+# Queued + running uploads allowed before new ones are rejected
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", "20"))
+# Finished jobs kept around for /jobs/{id}
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", "1000"))
+
+
+class QueueFullError(Exception):
+    """Raised when the ingestion queue has no room for another upload."""
+
+
+class IngestionJob:
+    """Status and progress of one uploaded document, or of a batch of documents indexed together."""
+
+    def __init__(self, username: str, filename: str, files: Optional[List[str]] = None):
+        self.id = uuid.uuid4().hex
+        self.username = username
+        self.filename = filename
+        self.files = files or [filename]
+        self.status = "queued"
+        self.pages_parsed = 0
+        self.chunks_total = 0
+        self.chunks_embedded = 0
+        self.index_written = False
+        self.error: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def update(self, **fields: Any) -> None:
+        """Progress callback handed to the parser and the vectorstore."""
+        with self._lock:
+            for name, value in fields.items():
+                setattr(self, name, value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "filename": self.filename,
+                "files": self.files,
+                "status": self.status,
+                "pages_parsed": self.pages_parsed,
+                "chunks_total": self.chunks_total,
+                "chunks_embedded": self.chunks_embedded,
+                "index_written": self.index_written,
+                "error": self.error,
+                "timings": self.timings,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+
+
+class IngestionQueue:
+    """
+    Bounded background worker pool for document ingestion.
+
+    - At most max_workers jobs run at once, on threads separate from the request threadpool
+    - At most max_pending jobs may be queued or running; submit raises QueueFullError beyond that
+    """
+
+    def __init__(
+        self,
+        max_workers: int = INGEST_WORKERS,
+        max_pending: int = INGEST_MAX_PENDING,
+        history: int = INGEST_JOB_HISTORY,
+    ):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.history = history
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def has_capacity(self) -> bool:
+        with self._lock:
+            return self._pending < self.max_pending
+
+    def submit(
+        self,
+        username: str,
+        filename: str,
+        task: Callable[[IngestionJob], None],
+        files: Optional[List[str]] = None,
+    ) -> IngestionJob:
+        """Queue task(job) in the background and return the job immediately (a batch counts as one job)."""
+        job = IngestionJob(username, filename, files)
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFullError(f"Ingestion queue is full ({self.max_pending} pending uploads).")
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ingest")
+            self._pending += 1
+            self._jobs[job.id] = job
+            self._trim_history()
+            self._executor.submit(self._run, job, task)
+        return job
+
+    def completed(self, username: str, filename: str, **fields: Any) -> IngestionJob:
+        """Record a job that needed no work (e.g. the same file is already indexed), for /jobs/{id}."""
+        job = IngestionJob(username, filename)
+        now = time.time()
+        job.update(status="completed", started_at=now, finished_at=now, **fields)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._trim_history()
+        INGESTION_JOBS.labels("deduplicated").inc()
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job: IngestionJob, task: Callable[[IngestionJob], None]) -> None:
+        job.update(status="running", started_at=time.time())
+        try:
+            # Stages (parse, chunk, embed, index_write) go to the metrics and to the job's timings
+            with timed_pipeline("ingest") as timer:
+                try:
+                    task(job)
+                finally:
+                    job.update(timings={name: round(seconds, 3) for name, seconds in timer.stages.items()})
+            job.update(status="completed", finished_at=time.time())
+            INGESTION_JOBS.labels("completed").inc()
+        except Exception as e:
+            print(f"Ingestion job {job.id} ({job.filename}) failed: {e}")
+            job.update(status="failed", error=str(e), finished_at=time.time())
+            INGESTION_JOBS.labels("failed").inc()
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _trim_history(self) -> None:
+        # Drop the oldest finished jobs once the history is full
+        excess = len(self._jobs) - self.history
+        for job_id in list(self._jobs):
+            if excess <= 0:
+                break
+            if self._jobs[job_id].status in ("completed", "failed"):
+                del self._jobs[job_id]
+                excess -= 1
+
+
+ingestion_queue = IngestionQueue()
@@ -0,0 +1,133 @@
+# llms/answer_cache.py
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from itertools import count
+from typing import Any, Dict, Hashable, List, Optional
+
+import numpy as np
+
+# Minimum cosine similarity between two queries for a stored answer to be reused
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+
+
+class _Entry:
+    __slots__ = ("scope", "vector", "answer", "version", "created_at")
+
+    def __init__(self, scope: Hashable, vector: np.ndarray, answer: str, version: Any):
+        self.scope = scope
+        self.vector = vector
+        self.answer = answer
+        self.version = version
+        self.created_at = time.monotonic()
+
+
+def _normalize(embedding: List[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticAnswerCache:
+    """
+    Reuses answers for queries that are semantically close to one already answered.
+
+    - Entries are grouped by scope, e.g. (documents searched, model_name)
+    - A lookup returns the best stored answer in the scope whose query embedding
+      has cosine similarity >= threshold
+    - Each entry records the index version it was answered from; once the document
+      is re-indexed the version changes and the entry is discarded
+    - Entries expire after ttl_seconds and the cache keeps at most max_entries (LRU)
+    """
+
+    def __init__(
+        self,
+        threshold: float = ANSWER_CACHE_SIMILARITY,
+        ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+    ):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._scopes: Dict[Hashable, List[int]] = {}
+        self._ids = count()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def lookup(self, scope: Hashable, embedding: List[float], version: Any = None) -> Optional[str]:
+        query = _normalize(embedding)
+        now = time.monotonic()
+
+        with self._lock:
+            live_ids, vectors = [], []
+            for entry_id in list(self._scopes.get(scope, [])):
+                entry = self._entries[entry_id]
+                if entry.version != version:
+                    self._remove(entry_id)
+                    self.invalidations += 1
+                elif now - entry.created_at > self.ttl_seconds:
+                    self._remove(entry_id)
+                    self.expirations += 1
+                else:
+                    live_ids.append(entry_id)
+                    vectors.append(entry.vector)
+
+            if vectors:
+                similarities = np.stack(vectors) @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self._entries.move_to_end(live_ids[best])
+                    self.hits += 1
+                    return self._entries[live_ids[best]].answer
+
+            self.misses += 1
+            return None
+
+    def store(self, scope: Hashable, embedding: List[float], answer: str, version: Any = None) -> None:
+        with self._lock:
+            entry_id = next(self._ids)
+            self._entries[entry_id] = _Entry(scope, _normalize(embedding), answer, version)
+            self._scopes.setdefault(scope, []).append(entry_id)
+
+            while len(self._entries) > self.max_entries:
+                oldest_id = next(iter(self._entries))
+                self._remove(oldest_id)
+                self.evictions += 1
+
+    def invalidate(self, scope: Hashable) -> None:
+        with self._lock:
+            for entry_id in list(self._scopes.get(scope, [])):
+                self._remove(entry_id)
+                self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+            }
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        scope_ids = self._scopes[entry.scope]
+        scope_ids.remove(entry_id)
+        if not scope_ids:
+            del self._scopes[entry.scope]
+
+
+answer_cache = SemanticAnswerCache()
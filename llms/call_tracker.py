@@ -0,0 +1,81 @@
+# llms/call_tracker.py
+
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from monitoring.metrics import LLM_CALL_SECONDS, LLM_CALLS, LLM_TOKENS
+
+
+def _token_usage(response) -> Dict[str, int]:
+    """Prompt/completion tokens of an LLMResult, from usage_metadata or the provider's llm_output."""
+    usage = {"prompt": 0, "completion": 0}
+    for generations in response.generations:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if metadata:
+                usage["prompt"] += metadata.get("input_tokens", 0)
+                usage["completion"] += metadata.get("output_tokens", 0)
+    if not any(usage.values()):
+        token_usage = (response.llm_output or {}).get("token_usage") or {}
+        usage["prompt"] = token_usage.get("prompt_tokens", 0)
+        usage["completion"] = token_usage.get("completion_tokens", 0)
+    return usage
+
+
+class LLMCallTracker(BaseCallbackHandler):
+    """
+    Callback handler that counts the model calls made while answering one chat,
+    how long each took (agent runs can make several: tool decision, final answer)
+    and the tokens the provider reported. Calls are also recorded in the Prometheus metrics.
+    Pass it in the run config: {"callbacks": [tracker]}.
+    """
+
+    def __init__(self, model_name: Optional[str] = None):
+        self.model_name = (model_name or "unknown").lower()
+        self._started: Dict[UUID, float] = {}
+        self._seconds: List[float] = []
+        self._tokens = {"prompt": 0, "completion": 0}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id: UUID) -> None:
+        with self._lock:
+            self._started[run_id] = time.perf_counter()
+
+    def _end(self, run_id: UUID, status: str) -> None:
+        with self._lock:
+            started = self._started.pop(run_id, None)
+            if started is None:
+                return
+            seconds = time.perf_counter() - started
+            self._seconds.append(seconds)
+        LLM_CALLS.labels(self.model_name, status).inc()
+        LLM_CALL_SECONDS.labels(self.model_name).observe(seconds)
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages, *, run_id: UUID, **kwargs: Any) -> None:
+        self._start(run_id)
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts, *, run_id: UUID, **kwargs: Any) -> None:
+        self._start(run_id)
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any) -> None:
+        usage = _token_usage(response)
+        with self._lock:
+            for kind, tokens in usage.items():
+                self._tokens[kind] += tokens
+        for kind, tokens in usage.items():
+            if tokens:
+                LLM_TOKENS.labels(self.model_name, kind).inc(tokens)
+        self._end(run_id, "ok")
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, "error")
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            seconds = [round(s, 3) for s in self._seconds]
+            tokens = dict(self._tokens)
+        return {"llm_calls": len(seconds), "llm_call_seconds": seconds, "llm_tokens": tokens}
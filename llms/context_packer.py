@@ -0,0 +1,238 @@
+# llms/context_packer.py
+
+import os
+from typing import Dict, List, Optional, Tuple
+
+from langchain.docstore.document import Document
+
+from vectorstore.embedding_pipeline import count_tokens
+
+# Token budget for the retrieved context in a prompt; 0 uses the per-model defaults below
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "0"))
+# Model name prefix -> context budget (Groq-hosted models get smaller windows and stricter TPM limits)
+MODEL_CONTEXT_BUDGETS = (
+    ("gpt", 6000),
+    ("openai", 6000),
+    ("gemini", 6000),
+    ("llama", 3000),
+    ("mistral", 3000),
+    ("deepseek", 3000),
+    ("groq", 3000),
+)
+DEFAULT_CONTEXT_BUDGET = 3000
+
+# Shortest suffix/prefix match treated as chunk overlap when chunks carry no start_index
+_MIN_OVERLAP_CHARS = 20
+_SEPARATOR = "\n\n"
+
+
+def context_budget(model_name: str) -> int:
+    if CONTEXT_TOKEN_BUDGET:
+        return CONTEXT_TOKEN_BUDGET
+    name = model_name.lower()
+    for prefix, budget in MODEL_CONTEXT_BUDGETS:
+        if name.startswith(prefix):
+            return budget
+    return DEFAULT_CONTEXT_BUDGET
+
+
+class PackedContext:
+    """Context text for a prompt plus what packing saved compared with joining every chunk."""
+
+    def __init__(self, text: str, tokens: int, raw_tokens: int, budget: int, chunks_used: int, chunks_total: int):
+        self.text = text
+        self.tokens = tokens
+        self.raw_tokens = raw_tokens
+        self.budget = budget
+        self.chunks_used = chunks_used
+        self.chunks_total = chunks_total
+
+    @property
+    def saved_tokens(self) -> int:
+        return max(0, self.raw_tokens - self.tokens)
+
+    def to_dict(self) -> Dict[str, int]:
+        return {
+            "tokens": self.tokens,
+            "saved_tokens": self.saved_tokens,
+            "budget": self.budget,
+            "chunks_used": self.chunks_used,
+            "chunks_total": self.chunks_total,
+        }
+
+
+class _Segment:
+    """A run of text from one page, built from one or more overlapping chunks."""
+
+    def __init__(self, doc: Document, rank: int):
+        self.key = _page_key(doc)
+        self.label = doc.metadata.get("pdf_name")
+        self.rank = rank
+        self.start = doc.metadata.get("start_index")
+        self.text = doc.page_content
+        self.chunks = 1
+
+    @property
+    def end(self) -> Optional[int]:
+        return None if self.start is None else self.start + len(self.text)
+
+    def merge(self, doc: Document, rank: int) -> bool:
+        """Fold doc into this segment if it overlaps or touches it; return whether it did."""
+        text = doc.page_content
+        start = doc.metadata.get("start_index")
+        if text in self.text:
+            merged = self.text
+        elif self.start is not None and start is not None:
+            if start > self.end or start + len(text) < self.start:
+                return False
+            if start >= self.start:
+                merged = self.text + text[self.end - start:]
+            else:
+                merged = text + self.text[start + len(text) - self.start:]
+                self.start = start
+        elif self.text in text:
+            merged = text
+        else:
+            overlap = _overlap(self.text, text)
+            if overlap:
+                merged = self.text + text[overlap:]
+            else:
+                overlap = _overlap(text, self.text)
+                if not overlap:
+                    return False
+                merged = text + self.text[overlap:]
+        self.text = merged
+        self.rank = min(self.rank, rank)
+        self.chunks += 1
+        return True
+
+
+def _page_key(doc: Document):
+    metadata = doc.metadata
+    return (metadata.get("pdf_name") or metadata.get("source"), metadata.get("page"))
+
+
+def _overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of left that is a prefix of right (at least _MIN_OVERLAP_CHARS)."""
+    for size in range(min(len(left), len(right)), _MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    tokens = count_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    return text[:max(0, int(len(text) * max_tokens / tokens))]
+
+
+def pack_context(
+    docs: List[Document], model_name: str, label_documents: bool = False, budget: Optional[int] = None
+) -> PackedContext:
+    """
+    Build the context for a prompt from retrieved chunks (most relevant first).
+
+    - Chunks from the same page that overlap or touch (by start_index, or by matching text
+      for chunks indexed without offsets) are merged, so the splitter's overlap is sent once
+    - Chunks whose text is already included are dropped
+    - Merged segments are added in relevance order until the model's token budget is used;
+      a segment that does not fit is skipped in favour of smaller ones after it
+    - label_documents prefixes each segment with [pdf_name] (used when several documents are searched)
+    """
+    budget = budget or context_budget(model_name)
+    raw_tokens = count_tokens(_SEPARATOR.join(doc.page_content for doc in docs)) if docs else 0
+
+    segments: List[_Segment] = []
+    for rank, doc in enumerate(docs):
+        key = _page_key(doc)
+        # A new chunk can bridge two segments of the same page, so merge until nothing changes
+        merged_into = None
+        for segment in segments:
+            if segment.key == key and segment.merge(doc, rank):
+                merged_into = segment
+                break
+        if merged_into is None:
+            segments.append(_Segment(doc, rank))
+            continue
+        for segment in list(segments):
+            if segment is not merged_into and segment.key == key:
+                as_doc = Document(page_content=segment.text, metadata={"start_index": segment.start})
+                if merged_into.merge(as_doc, segment.rank):
+                    merged_into.chunks += segment.chunks - 1
+                    segments.remove(segment)
+
+    parts, used_tokens, chunks_used = [], 0, 0
+    separator_tokens = count_tokens(_SEPARATOR)
+    for segment in sorted(segments, key=lambda s: s.rank):
+        text = f"[{segment.label}]\n{segment.text}" if label_documents else segment.text
+        tokens = count_tokens(text) + (separator_tokens if parts else 0)
+        if used_tokens + tokens > budget:
+            if parts:
+                continue
+            # Never send an empty context: cut the best segment down to the budget
+            text = _truncate(text, budget)
+            tokens = count_tokens(text)
+        parts.append(text)
+        used_tokens += tokens
+        chunks_used += segment.chunks
+
+    text = _SEPARATOR.join(parts)
+    return PackedContext(text, count_tokens(text) if parts else 0, raw_tokens, budget, chunks_used, len(docs))
+
+
+def _chunk_key(doc: Document):
+    return _page_key(doc), doc.metadata.get("start_index"), doc.page_content
+
+
+def share_contexts(
+    doc_lists: List[List[Document]], model_name: str, label_documents: bool = False, budget: Optional[int] = None
+) -> List[Tuple[List[int], PackedContext]]:
+    """
+    Pack one context per group of questions whose retrieved chunks fit in the token budget together
+    (doc_lists holds each question's chunks, most relevant first). Returns [(question indices, context)].
+
+    - Every question of a group gets all of its own chunks; nothing is dropped to make room for sharing
+    - Questions of a group send the same context, i.e. the same prompt prefix, which providers with
+      prompt caching serve faster and bill less after the first call
+    - Questions are visited in the order of their best chunk, so questions about the same clause end up together
+    """
+    budget = budget or context_budget(model_name)
+    separator_tokens = count_tokens(_SEPARATOR)
+    chunk_tokens: Dict[tuple, int] = {}
+    for docs in doc_lists:
+        for doc in docs:
+            key = _chunk_key(doc)
+            if key not in chunk_tokens:
+                label_tokens = count_tokens(f"[{doc.metadata.get('pdf_name')}]\n") if label_documents else 0
+                chunk_tokens[key] = count_tokens(doc.page_content) + label_tokens + separator_tokens
+
+    def best_chunk(i: int):
+        docs = doc_lists[i]
+        if not docs:
+            return (1, "", 0, 0)
+        name, page = _page_key(docs[0])
+        return (0, str(name or ""), page or 0, docs[0].metadata.get("start_index") or 0)
+
+    groups: List[Tuple[List[int], set]] = []
+    for i in sorted(range(len(doc_lists)), key=best_chunk):
+        keys = {_chunk_key(doc) for doc in doc_lists[i]}
+        if groups:
+            indices, group_keys = groups[-1]
+            if sum(chunk_tokens[key] for key in group_keys | keys) <= budget:
+                indices.append(i)
+                group_keys.update(keys)
+                continue
+        groups.append(([i], keys))
+
+    packed = []
+    for indices, _ in groups:
+        # Rank r of every question before rank r + 1 of any, each chunk once
+        docs, seen = [], set()
+        for rank in range(max((len(doc_lists[i]) for i in indices), default=0)):
+            for i in indices:
+                if rank < len(doc_lists[i]) and _chunk_key(doc_lists[i][rank]) not in seen:
+                    seen.add(_chunk_key(doc_lists[i][rank]))
+                    docs.append(doc_lists[i][rank])
+        packed.append((sorted(indices), pack_context(docs, model_name, label_documents=label_documents, budget=budget)))
+    return packed
@@ -1,28 +1,40 @@
 # llms/load_llm.py
 
 import os
-from typing import Any
+from typing import Any, Optional
 
-from langchain_openai import ChatOpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_groq import ChatGroq
+import httpx
 
 
-def load_llm(model_name: str) -> Any:
+def load_llm(
+    model_name: str,
+    http_client: Optional[httpx.Client] = None,
+    http_async_client: Optional[httpx.AsyncClient] = None,
+) -> Any:
     """
     Dynamically load the appropriate LLM client based on the model name.
+
+    - http_client / http_async_client let callers share one keep-alive connection
+      pool between clients (used by OpenAI and Groq; Gemini manages its own transport)
+    - Each provider SDK is imported on first use, so unused providers cost nothing at startup
     """
     model_name = model_name.lower()
 
     if model_name.startswith("gpt") or model_name.startswith("openai"):
+        from langchain_openai import ChatOpenAI
+
         print("Using OpenAI model:", model_name)
         return ChatOpenAI(
             temperature=0,
             model_name=model_name,  # use exact model name like "gpt-4o"
-            openai_api_key=os.environ.get("OPENAI_API_KEY")
+            openai_api_key=os.environ.get("OPENAI_API_KEY"),
+            http_client=http_client,
+            http_async_client=http_async_client,
         )
 
     elif model_name.startswith("gemini"):
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
         print("Using Google Gemini model:", model_name)
         return ChatGoogleGenerativeAI(
             model=model_name,
@@ -31,10 +43,14 @@ def load_llm(model_name: str) -> Any:
         )
 
     elif model_name.startswith(("groq", "llama", "mistral", "deepseek")):
+        from langchain_groq import ChatGroq
+
         print("Using Groq-based model:", model_name)
         return ChatGroq(
             groq_api_key=os.environ.get("GROQ_API_KEY"),
-            model_name=model_name
+            model_name=model_name,
+            http_client=http_client,
+            http_async_client=http_async_client,
         )
     
     else:
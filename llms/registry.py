@@ -0,0 +1,120 @@
+# llms/registry.py
+
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from llms.load_llm import load_llm
+
+# Connection pool shared by every OpenAI / Groq client in the process
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_HTTP_TIMEOUT = float(os.getenv("LLM_HTTP_TIMEOUT", "120"))
+
+# Comma separated list of models to build at startup, e.g. "gpt-4o,llama3-70b-8192"
+WARMUP_MODELS = [m.strip() for m in os.getenv("WARMUP_MODELS", "").split(",") if m.strip()]
+
+
+class LLMRegistry:
+    """
+    Builds each model's chat client and ReAct agent once and reuses them across requests.
+
+    - One httpx connection pool (sync + async) is shared by all clients, so
+      keep-alive connections survive between chats
+    - The Tavily tool and the compiled agent graph are built on first use per model
+    - Provider SDKs, langgraph and the Tavily tool are imported on first use, not at startup
+    """
+
+    def __init__(self):
+        self._llms: Dict[str, Any] = {}
+        self._agents: Dict[str, Any] = {}
+        self._tools: Optional[List[Any]] = None
+        self._lock = threading.Lock()
+        self._http_client: Optional[httpx.Client] = None
+        self._http_async_client: Optional[httpx.AsyncClient] = None
+
+    def get_llm(self, model_name: str) -> Any:
+        key = model_name.lower()
+        llm = self._llms.get(key)
+        if llm is not None:
+            return llm
+
+        with self._lock:
+            llm = self._llms.get(key)
+            if llm is None:
+                http_client, http_async_client = self._http_clients()
+                llm = load_llm(key, http_client=http_client, http_async_client=http_async_client)
+                self._llms[key] = llm
+            return llm
+
+    def get_agent(self, model_name: str) -> Any:
+        key = model_name.lower()
+        agent = self._agents.get(key)
+        if agent is not None:
+            return agent
+
+        llm = self.get_llm(key)
+        with self._lock:
+            agent = self._agents.get(key)
+            if agent is None:
+                from langgraph.prebuilt import create_react_agent
+
+                agent = create_react_agent(llm, self._get_tools())
+                self._agents[key] = agent
+            return agent
+
+    def warm_up(self, model_names: Optional[List[str]] = None, agents: bool = True) -> Dict[str, str]:
+        """
+        Build clients (and agents, unless agents is False) ahead of the first request.
+        Failures are logged and skipped so one missing API key does not block startup;
+        returns {model_name: error} for the models that failed.
+        """
+        failed = {}
+        for model_name in model_names if model_names is not None else WARMUP_MODELS:
+            try:
+                if agents:
+                    self.get_agent(model_name)
+                else:
+                    self.get_llm(model_name)
+                print(f"Warmed up model: {model_name}")
+            except Exception as e:
+                print(f"Warm-up failed for {model_name}: {e}")
+                failed[model_name] = str(e)
+        return failed
+
+    async def aclose(self) -> None:
+        """Drop cached clients and close the shared connection pools (called on shutdown)."""
+        with self._lock:
+            http_client, self._http_client = self._http_client, None
+            http_async_client, self._http_async_client = self._http_async_client, None
+            self._llms.clear()
+            self._agents.clear()
+        if http_client is not None:
+            http_client.close()
+        if http_async_client is not None:
+            await http_async_client.aclose()
+
+    def _get_tools(self) -> List[Any]:
+        if self._tools is None:
+            from langchain_community.tools.tavily_search import TavilySearchResults
+
+            self._tools = [TavilySearchResults(max_results=2)]
+        return self._tools
+
+    def _http_clients(self):
+        if self._http_client is None:
+            limits = httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+            )
+            timeout = httpx.Timeout(LLM_HTTP_TIMEOUT, connect=10.0)
+            self._http_client = httpx.Client(limits=limits, timeout=timeout)
+            self._http_async_client = httpx.AsyncClient(limits=limits, timeout=timeout)
+        return self._http_client, self._http_async_client
+
+
+llm_registry = LLMRegistry()
@@ -0,0 +1,152 @@
+# llms/sessions.py
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+# Question/answer pairs kept per session and sent back to the model as history
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "6"))
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "7200"))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+# Rewrite follow-up questions into standalone ones (one short model call) before retrieval
+SESSION_REWRITE_QUERIES = os.getenv("SESSION_REWRITE_QUERIES", "true").lower() in ("1", "true", "yes")
+# Reuse a session's earlier retrieval when the (rewritten) query is at least this similar
+SESSION_RETRIEVAL_SIMILARITY = float(os.getenv("SESSION_RETRIEVAL_SIMILARITY", "0.92"))
+SESSION_RETRIEVAL_CACHE_SIZE = 16
+
+REWRITE_PROMPT = (
+    "Given the conversation so far and a follow-up question, rewrite the follow-up as a single "
+    "standalone question that can be understood without the conversation. Keep names, clause "
+    "numbers and document references. If it is already standalone, return it unchanged. "
+    "Reply with the question only."
+)
+
+
+def _normalize(embedding: List[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class ChatSession:
+    """
+    One conversation: a bounded window of recent turns plus the retrievals made for it.
+    Clients send only the new message; the server supplies the history.
+    """
+
+    def __init__(self, username: str, max_turns: int = SESSION_MAX_TURNS):
+        self.id = uuid.uuid4().hex
+        self.username = username
+        self.turns: deque = deque(maxlen=max_turns)
+        self.created_at = time.time()
+        self.last_used = time.monotonic()
+        self._retrievals: deque = deque(maxlen=SESSION_RETRIEVAL_CACHE_SIZE)
+        self._lock = threading.Lock()
+        self.retrieval_hits = 0
+
+    def history(self) -> List[Tuple[str, str]]:
+        with self._lock:
+            return list(self.turns)
+
+    def add_turn(self, question: str, answer: str) -> None:
+        with self._lock:
+            self.turns.append((question, answer))
+
+    def cached_retrieval(self, scope: Hashable, embedding: List[float], version: Any) -> Optional[Any]:
+        """Return the stored retrieval for a similar query in the same scope and index version."""
+        query = _normalize(embedding)
+        with self._lock:
+            best, best_score = None, SESSION_RETRIEVAL_SIMILARITY
+            for entry_scope, entry_version, vector, value in self._retrievals:
+                if entry_scope != scope or entry_version != version:
+                    continue
+                score = float(np.dot(query, vector))
+                if score >= best_score:
+                    best, best_score = value, score
+            if best is not None:
+                self.retrieval_hits += 1
+            return best
+
+    def store_retrieval(self, scope: Hashable, embedding: List[float], version: Any, value: Any) -> None:
+        with self._lock:
+            self._retrievals.append((scope, version, _normalize(embedding), value))
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "session_id": self.id,
+                "turns": [{"question": q, "answer": a} for q, a in self.turns],
+                "max_turns": self.turns.maxlen,
+                "retrieval_hits": self.retrieval_hits,
+                "created_at": self.created_at,
+            }
+
+
+class SessionStore:
+    """
+    In-memory chat sessions of this process.
+
+    - Sessions idle for longer than ttl_seconds expire
+    - At most max_sessions are kept, least recently used first out
+    """
+
+    def __init__(self, ttl_seconds: float = SESSION_TTL_SECONDS, max_sessions: int = SESSION_MAX_SESSIONS):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, username: str) -> ChatSession:
+        session = ChatSession(username)
+        with self._lock:
+            self._sessions[session.id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session
+
+    def get(self, session_id: str, username: str) -> Optional[ChatSession]:
+        """Return the user's session, or None if it does not exist, expired or belongs to someone else."""
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session.username != username:
+                return None
+            if now - session.last_used > self.ttl_seconds:
+                del self._sessions[session_id]
+                return None
+            session.last_used = now
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id: str, username: str) -> bool:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session.username != username:
+                return False
+            del self._sessions[session_id]
+            return True
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"sessions": len(self._sessions), "max_sessions": self.max_sessions}
+
+
+def rewrite_query(llm: Any, history: List[Tuple[str, str]], query: str, config: Optional[dict] = None) -> str:
+    """Turn a follow-up question into a standalone one using the recent turns."""
+    conversation = "\n".join(f"User: {q}\nAssistant: {a}" for q, a in history)
+    messages = [
+        {"type": "system", "content": REWRITE_PROMPT},
+        {"type": "human", "content": f"Conversation:\n{conversation}\n\nFollow-up question: {query}"},
+    ]
+    result = llm.invoke(messages, config=config)
+    content = getattr(result, "content", result)
+    rewritten = content.strip() if isinstance(content, str) else ""
+    return rewritten or query
+
+
+session_store = SessionStore()
@@ -1,9 +1,16 @@
 import os
-from typing import List, Optional
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File
+import json
+import time
+import asyncio
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 import uvicorn
 import warnings
@@ -11,15 +18,33 @@ warnings.filterwarnings("ignore", category=DeprecationWarning)
 warnings.filterwarnings("ignore", category=UserWarning)
 
 # Auth & DB modules
-from database import models, schemas, auth, database
+from database import models, schemas, auth, database, catalog
 from database.schemas import PDFListResponse
+from database.user_cache import user_cache
 
 # Chat & PDF RAG
-from llms.load_llm import load_llm
-from vectorstore.faiss_db import load_faiss_index, save_to_faiss
-from parsers.file_parser import parse_and_chunk
-from langchain_community.tools.tavily_search import TavilySearchResults
-from langgraph.prebuilt import create_react_agent
+from llms.registry import llm_registry
+from llms.answer_cache import answer_cache
+from llms.context_packer import pack_context, share_contexts
+from llms.call_tracker import LLMCallTracker
+from llms.sessions import SESSION_REWRITE_QUERIES, ChatSession, rewrite_query, session_store
+from vectorstore.faiss_db import (
+    INDEX_FLUSH_CHUNKS, add_documents, remove_from_faiss, embed_query, embed_queries, collection_version, search_documents,
+    search_documents_batch, describe_documents, document_chunks, warm_up_collections, warm_up_embeddings,
+)
+from vectorstore.index_cache import index_cache
+from vectorstore.embedding_backends import EmbeddingMismatchError
+from parsers.file_parser import UPLOAD_DIR, FileEnd, iter_chunks, page_count, shutdown_pool
+from parsers.text_cache import file_hash
+from ingestion.jobs import IngestionJob, QueueFullError, ingestion_queue
+from ingestion.document_store import (
+    MAX_UPLOAD_BYTES, UploadTooLargeError, discard_objects, link_object, object_path, release_object,
+    store_upload,
+)
+from monitoring.metrics import MetricsMiddleware, render_metrics, stage
+from monitoring.readiness import readiness
+from langchain.docstore.document import Document
+from langchain_core.messages import AIMessageChunk
 from pydantic import BaseModel
 
 # --- App Initialization ---
@@ -32,50 +57,115 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Error-Code"],
 )
 
+# --- Request metrics and Server-Timing headers (outermost, so it sees every response) ---
+app.add_middleware(MetricsMiddleware)
+
+# --- A collection built with another embedding backend than EMBEDDING_BACKEND cannot be searched ---
+@app.exception_handler(EmbeddingMismatchError)
+async def embedding_mismatch_handler(request: Request, exc: EmbeddingMismatchError):
+    return JSONResponse(status_code=status.HTTP_409_CONFLICT, content={"detail": str(exc)})
+
 # --- Mount uploaded PDFs as static folder ---
 UPLOAD_FOLDER = os.path.abspath("uploaded_docs")
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.mount("/uploaded_docs", StaticFiles(directory=UPLOAD_FOLDER), name="uploaded_docs")
 
+# --- Warm-up: model clients, the embeddings client and hot collections load in the background ---
+# Owners whose collections are loaded at startup, e.g. "public,acme"
+WARMUP_INDEXES = [owner.strip() for owner in os.getenv("WARMUP_INDEXES", "public").split(",") if owner.strip()]
+
+@app.on_event("startup")
+async def start_warm_up():
+    # Requests are served right away; GET /ready reports when warm-up has finished
+    readiness.run("models", llm_registry.warm_up, agents=CHAT_MODE == "agent")
+    readiness.run("embeddings", warm_up_embeddings)
+    readiness.run("indexes", warm_up_collections, WARMUP_INDEXES)
+
+# --- LLM clients: close pools on shutdown ---
+
+@app.on_event("shutdown")
+async def close_llm_clients():
+    await llm_registry.aclose()
+    ingestion_queue.shutdown()
+    shutdown_pool()
+    catalog.stop_heartbeat()
+
 # --- DB Init ---
 models.Base.metadata.create_all(bind=database.engine)
+catalog.upgrade_schema(database.engine)
+
+# --- Document catalog: pick up PDFs placed in uploaded_docs/ outside of /upload_pdf ---
+@app.on_event("startup")
+async def sync_document_catalog():
+    added = await run_in_threadpool(catalog.sync_from_disk, UPLOAD_FOLDER, describe_documents, file_hash, page_count)
+    if added:
+        print(f"Added {added} documents found in {UPLOAD_FOLDER} to the catalog.")
+    # Keeps this process's indexing jobs alive in the catalog and fails those of workers that stopped
+    catalog.start_heartbeat()
 
 # --- Dependencies ---
-def get_db():
-    return next(database.get_db())
+# Request-scoped session: FastAPI closes it after the response has been sent
+get_db = database.get_db
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    username = auth.verify_token(token)
+def get_current_user(token: str = Depends(oauth2_scheme)):
+    # Repeat calls with the same token skip the JWT decode and the users query
+    user = user_cache.get(token)
+    if user is not None:
+        return user
+    payload = auth.decode_token(token)
+    username = payload.get("sub") if payload else None
     if username is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid authentication credentials")
-    user = db.query(models.User).filter(models.User.username == username).first()
-    if user is None:
-        raise HTTPException(status_code=404, detail="User not found")
+    with database.SessionLocal() as db:
+        user = db.query(models.User).filter(models.User.username == username).first()
+        if user is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        db.expunge(user)
+    user_cache.put(token, user, payload.get("exp"))
     return user
 
 # --- Auth Routes ---
+# Owner names of shared collections: an account with one of these names would own their documents
+RESERVED_USERNAMES = {"public"}
+
+def reject_reserved_owner(username: str) -> None:
+    # Accounts created before the names were reserved must not write to the shared collection either
+    if username.lower() in RESERVED_USERNAMES:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="This account cannot change shared documents.")
+
 @app.post("/signup", response_model=schemas.UserResponse)
-def signup(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    existing_user = db.query(models.User).filter(
-        (models.User.username == user.username) | (models.User.email == user.email)
-    ).first()
-    if existing_user:
+async def signup(user: schemas.UserCreate, db: Session = Depends(get_db)):
+    def find_existing():
+        return db.query(models.User).filter(
+            (models.User.username == user.username) | (models.User.email == user.email)
+        ).first()
+
+    if user.username.lower() in RESERVED_USERNAMES:
+        raise HTTPException(status_code=400, detail="This username is reserved")
+    if await run_in_threadpool(find_existing):
         raise HTTPException(status_code=400, detail="Username or email already registered")
-    hashed_password = auth.hash_password(user.password)
-    db_user = models.User(username=user.username, email=user.email, hashed_password=hashed_password)
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    return db_user
+    hashed_password = await auth.hash_password_async(user.password)
+
+    def create_user():
+        db_user = models.User(username=user.username, email=user.email, hashed_password=hashed_password)
+        db.add(db_user)
+        db.commit()
+        db.refresh(db_user)
+        return db_user
+
+    return await run_in_threadpool(create_user)
 
 @app.post("/login", response_model=schemas.Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.username == form_data.username).first()
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+    user = await run_in_threadpool(
+        lambda: db.query(models.User).filter(models.User.username == form_data.username).first()
+    )
+    if not user or not await auth.verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect username or password")
     access_token = auth.create_access_token(data={"sub": user.username})
     return {"access_token": access_token, "token_type": "bearer"}
@@ -88,40 +178,371 @@ def read_users_me(current_user: models.User = Depends(get_current_user)):
 @app.get("/available_pdfs", response_model=PDFListResponse)
 def get_available_pdfs(current_user: models.User = Depends(get_current_user)):
     username = current_user.username
-    user_dir = os.path.join(UPLOAD_FOLDER, username)
-
     try:
-        public_pdfs = [f for f in os.listdir(UPLOAD_FOLDER) if f.endswith(".pdf")]
-        user_pdfs = [f for f in os.listdir(user_dir) if f.endswith(".pdf")] if os.path.exists(user_dir) else []
-        return {"public": public_pdfs,"user": user_pdfs}
+        filenames = catalog.ready_filenames([username, "public"])
+        return {"public": filenames["public"], "user": filenames[username]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error listing PDFs: {str(e)}")
-    
-    
 
-# --- Upload PDF and build user-specific FAISS index ---
-@app.post("/upload_pdf")
-def upload_pdf(file: UploadFile = File(...), current_user: models.User = Depends(get_current_user)):
+@app.get("/documents")
+def get_documents(current_user: models.User = Depends(get_current_user)):
+    """Catalog entries (status, pages, chunks, index type and size) of the user's and the public documents."""
+    return {"documents": catalog.list_documents([current_user.username, "public"])}
+
+# --- Upload PDFs and build user-specific FAISS index in the background ---
+# Multipart framing on top of the file itself, allowed when checking Content-Length
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+# Files accepted by one /upload_batch request
+UPLOAD_BATCH_MAX_FILES = int(os.getenv("UPLOAD_BATCH_MAX_FILES", "200"))
+
+def reject_when_busy() -> None:
+    # Reject early instead of accepting bytes we cannot process soon
+    if not ingestion_queue.has_capacity():
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many documents are being processed, please retry shortly.",
+            headers={"Retry-After": "30"},
+        )
+
+def upload_filename(file: UploadFile) -> str:
+    filename = os.path.basename(file.filename or "")
+    if not filename:
+        raise HTTPException(status_code=400, detail="A file name is required.")
+    return filename
+
+def reject_when_indexing(username: str, filenames: List[str]) -> None:
+    # A second job for a document still being indexed would race the first on its index and catalog row
+    indexing = [
+        filename for filename in filenames
+        if (catalog.get(username, os.path.splitext(filename)[0]) or {}).get("status") == catalog.STATUS_INDEXING
+    ]
+    if indexing:
+        raise HTTPException(status_code=409, detail=f"Still being indexed, retry once it is done: {', '.join(indexing)}.")
+
+def indexed_copy(username: str, filename: str, content_hash: str) -> Optional[dict]:
+    """The catalog entry of this exact file if it is already indexed under the same name."""
+    existing = catalog.get(username, os.path.splitext(filename)[0])
+    if existing and existing["status"] == catalog.STATUS_READY and existing["content_hash"] == content_hash:
+        return existing
+    return None
+
+def revert_uploads(username: str, previous: Dict[str, Optional[dict]], error: str) -> None:
+    """
+    Undo catalog.record_upload for uploads whose job could not be queued ({filename: catalog row before the upload}).
+    A replaced document that was ready is searchable again, with its previous file back in uploaded_docs/.
+    """
+    for filename, document in previous.items():
+        catalog.revert_upload(username, os.path.splitext(filename)[0], document, error)
+        if document and document["status"] == catalog.STATUS_READY and os.path.exists(object_path(document["content_hash"])):
+            link_object(object_path(document["content_hash"]), os.path.join(UPLOAD_FOLDER, username, filename))
+
+def reused_chunks(source: dict, username: str, filename: str) -> List[Document]:
+    """Chunks of an identical document already indexed under another name or owner, re-labelled for this upload."""
+    source_path = os.path.join(UPLOAD_DIR, username, filename)
+    return [
+        Document(page_content=chunk.page_content, metadata=dict(chunk.metadata, source=source_path))
+        for chunk in document_chunks(source["owner"], source["pdf_name"])
+    ]
+
+def ingest_pdfs(job: IngestionJob, username: str, uploads: Dict[str, Optional[dict]]) -> None:
+    """
+    Index uploaded PDFs ({filename: source}) into the user's collection with one parse pass,
+    reading chunks as they are parsed (see iter_chunks) rather than parsing everything first.
+
+    - With a source (a catalog entry with the same content hash) a document's chunks are reused:
+      no parsing, and the embeddings come from the embedding cache
+    - Finished documents wait until INDEX_FLUSH_CHUNKS of their chunks are pending, then go to
+      add_documents together; a document longer than that is written in parts while it is parsed,
+      so memory does not grow with the document or the batch
+    - A document that fails part way has its parts removed again and is marked failed, as are documents
+      without any extractable text; the others are still indexed
+    """
+    pdf_names = {filename: os.path.splitext(filename)[0] for filename in uploads}
+    # Finished documents not written yet, and the chunks of the document being parsed
+    waiting: Dict[str, List[Document]] = {}
+    current: List[Document] = []
+    page_counts: Dict[str, Optional[int]] = {}
+    ready = set()
+    failed = set()
+    # Documents whose first parts are indexed: later parts are appended, a failure removes them
+    partial = set()
+    state = {"chunks_total": 0, "chunks_embedded": 0, "writing_part": None}
+
+    def mark_ready(index_fields: Dict[str, dict]) -> None:
+        for pdf_name, fields in index_fields.items():
+            if pdf_name == state["writing_part"]:
+                continue
+            catalog.mark_ready(username, pdf_name, page_count=page_counts.get(pdf_name), **fields)
+            ready.add(pdf_name)
+            partial.discard(pdf_name)
+
+    def count(chunks: List[Document]) -> None:
+        state["chunks_total"] += len(chunks)
+        job.update(chunks_total=state["chunks_total"])
+
+    def write(documents: Dict[str, List[Document]], part: Optional[str] = None) -> None:
+        for pdf_name, chunks in documents.items():
+            page_counts.setdefault(pdf_name, chunks[0].metadata.get("total_pages"))
+        embedded = state["chunks_embedded"]
+
+        def progress(chunks_embedded: Optional[int] = None, **fields) -> None:
+            # add_documents counts from 0 on every call; its last call only reports index_written
+            if chunks_embedded is not None:
+                fields["chunks_embedded"] = embedded + chunks_embedded
+            job.update(**fields)
+
+        state["writing_part"] = part
+        try:
+            add_documents(username, documents, progress=progress, written=mark_ready, append=set(partial))
+        finally:
+            state["writing_part"] = None
+        state["chunks_embedded"] = embedded + sum(len(chunks) for chunks in documents.values())
+        job.update(chunks_embedded=state["chunks_embedded"])
+
+    def write_part(chunks: List[Document]) -> None:
+        pdf_name = os.path.splitext(os.path.basename(chunks[0].metadata["source"]))[0]
+        count(chunks)
+        write({pdf_name: chunks}, part=pdf_name)
+        partial.add(pdf_name)
+
+    def finished(pdf_name: str, chunks: List[Document]) -> None:
+        count(chunks)
+        waiting[pdf_name] = chunks
+        if sum(len(docs) for docs in waiting.values()) >= INDEX_FLUSH_CHUNKS:
+            write(dict(waiting))
+            waiting.clear()
+
+    def discard(pdf_name: str, error: str) -> None:
+        waiting.pop(pdf_name, None)
+        failed.add(pdf_name)
+        try:
+            if pdf_name in partial:
+                remove_from_faiss(username, pdf_name)
+                partial.discard(pdf_name)
+        finally:
+            catalog.mark_failed(username, pdf_name, error)
+
+    try:
+        to_parse = []
+        reused_pages = 0
+        for filename, source in uploads.items():
+            docs = reused_chunks(source, username, filename) if source is not None else []
+            if docs:
+                reused_pages += docs[0].metadata.get("total_pages", 0)
+                finished(pdf_names[filename], docs)
+            else:
+                to_parse.append(filename)
+        job.update(pages_parsed=reused_pages)
+
+        if to_parse:
+            progress = lambda pages_parsed=0, **fields: job.update(pages_parsed=reused_pages + pages_parsed, **fields)
+            for item in iter_chunks(to_parse, username=username, progress=progress):
+                if isinstance(item, FileEnd):
+                    chunks, current = current, []
+                    pdf_name = os.path.splitext(os.path.basename(item.file_path))[0]
+                    if item.error is not None:
+                        discard(pdf_name, f"The document could not be read: {item.error}")
+                    elif chunks:
+                        finished(pdf_name, chunks)
+                    continue
+                if len(current) >= INDEX_FLUSH_CHUNKS:
+                    # Too long to hold at once: write this part now, the rest of the document is appended to it
+                    write_part(current)
+                    current = []
+                current.append(item)
+        if waiting:
+            write(dict(waiting))
+            waiting.clear()
+
+        empty = [filename for filename, pdf_name in pdf_names.items() if pdf_name not in ready | failed]
+        for filename in empty:
+            catalog.mark_failed(username, pdf_names[filename], "No text could be extracted from the document.")
+        if empty:
+            job.update(error=f"No text could be extracted from: {', '.join(empty)}")
+        if not ready:
+            raise ValueError("No text could be extracted from the document.")
+        job.update(index_written=True)
+    except Exception as e:
+        # Documents written before the failure stay indexed and ready, the parts of unfinished ones are removed
+        for pdf_name in pdf_names.values():
+            if pdf_name in ready or pdf_name in failed:
+                continue
+            try:
+                discard(pdf_name, str(e))
+            except Exception as cleanup_error:
+                print(f"Could not remove the parts of {pdf_name} indexed before the failure: {cleanup_error}")
+        raise
+
+@app.post("/upload_pdf", status_code=status.HTTP_202_ACCEPTED)
+def upload_pdf(
+    request: Request,
+    response: Response,
+    file: UploadFile = File(...),
+    current_user: models.User = Depends(get_current_user),
+):
+    reject_when_busy()
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="File is too large.")
+
+    username = current_user.username
+    reject_reserved_owner(username)
+    filename = upload_filename(file)
+    reject_when_indexing(username, [filename])
+    # Catalog rows replaced by this upload, restored if its job cannot be queued
+    previous: Dict[str, Optional[dict]] = {}
+
     try:
-        username = current_user.username
-        user_upload_path = os.path.join(UPLOAD_FOLDER, username)
-        os.makedirs(user_upload_path, exist_ok=True)
+        # Streamed in fixed-size chunks and hashed on the way; identical content is stored once
+        content_hash, size, stored_path, _ = store_upload(file.file)
+        link_object(stored_path, os.path.join(UPLOAD_FOLDER, username, filename))
 
-        file_location = os.path.join(user_upload_path, file.filename)
-        with open(file_location, "wb") as f:
-            f.write(file.file.read())
+        existing = indexed_copy(username, filename, content_hash)
+        if existing:
+            # Same bytes already indexed under this name: nothing to do
+            chunks = existing["chunk_count"] or 0
+            job = ingestion_queue.completed(
+                username, filename, pages_parsed=existing["page_count"] or 0,
+                chunks_total=chunks, chunks_embedded=chunks, index_written=True,
+            )
+            response.status_code = status.HTTP_200_OK
+            return {"message": "PDF already indexed.", "job_id": job.id, "status": job.status, "deduplicated": True}
 
-        docs = parse_and_chunk([file.filename], username=username)
-        save_to_faiss(docs, username=username, pdf_name=os.path.splitext(file.filename)[0])
-        return {"message": "PDF uploaded and indexed successfully."}
+        previous[filename] = catalog.get(username, os.path.splitext(filename)[0])
+        catalog.record_upload(username, filename, content_hash, size)
+        source = catalog.find_indexed(content_hash, username)
+        job = ingestion_queue.submit(
+            username, filename, lambda job: ingest_pdfs(job, username, {filename: source})
+        )
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except QueueFullError as e:
+        revert_uploads(username, previous, str(e))
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e), headers={"Retry-After": "30"})
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to upload and process PDF: {str(e)}")
+        revert_uploads(username, previous, str(e))
+        raise HTTPException(status_code=500, detail=f"Failed to upload PDF: {str(e)}")
+
+    # Reusing another owner's copy is not reported: the answer would tell whether someone else has this file
+    own_copy = source is not None and source["owner"] == username
+    message = "PDF uploaded, reusing an indexed copy." if own_copy else "PDF uploaded, indexing started."
+    return {"message": message, "job_id": job.id, "status": job.status, "deduplicated": own_copy}
+
+@app.post("/upload_batch", status_code=status.HTTP_202_ACCEPTED)
+def upload_batch(
+    response: Response,
+    files: List[UploadFile] = File(...),
+    current_user: models.User = Depends(get_current_user),
+):
+    """
+    Upload many PDFs (e.g. a client's data room) as one background job: one parse pass and
+    one embedding run for the whole batch, written to the index in groups of finished documents.
+    Files already indexed with the same name and content are skipped.
+    """
+    reject_when_busy()
+    if len(files) > UPLOAD_BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {UPLOAD_BATCH_MAX_FILES} files per batch.")
+
+    username = current_user.username
+    reject_reserved_owner(username)
+    filenames = [upload_filename(file) for file in files]
+    # Files are catalogued by name without extension, so "a.pdf" and "a.PDF" would be the same document
+    pdf_names = Counter(os.path.splitext(filename)[0] for filename in filenames)
+    duplicates = sorted(pdf_name for pdf_name, count in pdf_names.items() if count > 1)
+    if duplicates:
+        raise HTTPException(status_code=400, detail=f"Duplicate file names in the batch: {', '.join(duplicates)}.")
+    reject_when_indexing(username, filenames)
+    previous: Dict[str, Optional[dict]] = {}
+    created: List[str] = []
+
+    try:
+        # Store every file before touching uploaded_docs/ or the catalog, so an oversized file fails the whole batch
+        stored = []
+        for file in files:
+            content_hash, size, stored_path, is_new = store_upload(file.file)
+            stored.append((content_hash, size, stored_path))
+            if is_new:
+                created.append(stored_path)
+
+        uploads: Dict[str, Optional[dict]] = {}
+        unchanged = []
+        for filename, (content_hash, size, stored_path) in zip(filenames, stored):
+            link_object(stored_path, os.path.join(UPLOAD_FOLDER, username, filename))
+            if indexed_copy(username, filename, content_hash):
+                unchanged.append(filename)
+                continue
+            previous[filename] = catalog.get(username, os.path.splitext(filename)[0])
+            catalog.record_upload(username, filename, content_hash, size)
+            uploads[filename] = catalog.find_indexed(content_hash, username)
+
+        if not uploads:
+            response.status_code = status.HTTP_200_OK
+            return {"message": "All PDFs already indexed.", "job_id": None, "status": "completed",
+                    "files": [], "unchanged": unchanged}
+
+        job = ingestion_queue.submit(
+            username, f"{len(uploads)} files", lambda job: ingest_pdfs(job, username, uploads), files=list(uploads)
+        )
+    except UploadTooLargeError as e:
+        # Nothing was linked or catalogued yet: drop the objects stored for the earlier files of the batch
+        discard_objects(created)
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except QueueFullError as e:
+        revert_uploads(username, previous, str(e))
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e), headers={"Retry-After": "30"})
+    except Exception as e:
+        revert_uploads(username, previous, str(e))
+        raise HTTPException(status_code=500, detail=f"Failed to upload PDFs: {str(e)}")
+
+    return {"message": f"{len(uploads)} PDFs uploaded, indexing started.", "job_id": job.id, "status": job.status,
+            "files": list(uploads), "unchanged": unchanged}
+
+@app.delete("/documents/{pdf_name}")
+def delete_document(pdf_name: str, current_user: models.User = Depends(get_current_user)):
+    """Remove one of the user's documents from their index, the catalog and uploaded_docs/."""
+    username = current_user.username
+    reject_reserved_owner(username)
+    document = catalog.get(username, pdf_name)
+    if document is None:
+        raise HTTPException(status_code=404, detail="Document not found.")
+    if document["status"] == catalog.STATUS_INDEXING:
+        raise HTTPException(status_code=409, detail="Document is still being indexed.")
+
+    removed = remove_from_faiss(username, pdf_name)
+    catalog.remove(username, [pdf_name])
+    file_path = os.path.join(UPLOAD_FOLDER, username, document["filename"])
+    if os.path.exists(file_path):
+        os.remove(file_path)
+    # The stored bytes go with the last document that had them
+    if document["content_hash"] and not catalog.has_content(document["content_hash"]):
+        release_object(document["content_hash"])
+    return {"message": "Document deleted.", "chunks_removed": removed}
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str, current_user: models.User = Depends(get_current_user)):
+    job = ingestion_queue.get(job_id)
+    if job is None or job.username != current_user.username:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job.to_dict()
 
 # --- Chat Endpoint ---
 class ChatRequest(BaseModel):
     model_name: str
     messages: List[str]
     pdf_name: Optional[str] = None
+    # Search several documents at once, or every document the user can see
+    pdf_names: Optional[List[str]] = None
+    all_documents: bool = False
+    # "direct" (one model call) or "agent" (ReAct agent that may also search the web); defaults to CHAT_MODE
+    mode: Optional[str] = None
+    # With a session (POST /sessions) only the new message needs to be sent, the server keeps the history
+    session_id: Optional[str] = None
+
+    def has_documents(self) -> bool:
+        return bool(self.pdf_name or self.pdf_names or self.all_documents)
+
+CHAT_MODES = ("direct", "agent")
+CHAT_MODE = os.getenv("CHAT_MODE", "direct").lower()
 
 DYNAMIC_RAG_PROMPT = (
     "You are a helpful assistant. Use ONLY the context provided below to answer or summarize. "
@@ -129,64 +550,577 @@ DYNAMIC_RAG_PROMPT = (
     "Never use external knowledge or make assumptions."
 )
 
+def resolve_owner(username: str, pdf_name: str) -> str:
+    """Return who owns the PDF the user asked about: the user first, then the public docs."""
+    statuses = catalog.find([username, "public"], pdf_name)
+    for owner in (username, "public"):
+        if statuses.get(owner) == catalog.STATUS_READY:
+            return owner
+    if statuses:
+        status_text = statuses.get(username) or statuses.get("public")
+        raise HTTPException(status_code=409, detail=f"{pdf_name} cannot be searched yet (status: {status_text}).")
+    raise HTTPException(status_code=404, detail="PDF file not found.")
+
+def resolve_mode(request: ChatRequest) -> str:
+    mode = (request.mode or CHAT_MODE).lower()
+    if mode not in CHAT_MODES:
+        raise HTTPException(status_code=400, detail=f"Unsupported chat mode: {mode}. Use one of {', '.join(CHAT_MODES)}.")
+    return mode
+
+# Sent with the 404 of an unknown or expired session, so clients can tell it from other 404s (e.g. an unknown PDF)
+SESSION_NOT_FOUND_CODE = "session_not_found"
+
+def session_not_found() -> HTTPException:
+    return HTTPException(
+        status_code=404, detail="Session not found or expired.", headers={"X-Error-Code": SESSION_NOT_FOUND_CODE}
+    )
+
+def resolve_session(username: str, request: ChatRequest) -> Optional[ChatSession]:
+    if request.session_id is None:
+        return None
+    session = session_store.get(request.session_id, username)
+    if session is None:
+        raise session_not_found()
+    return session
+
+def resolve_documents(username: str, request: ChatRequest) -> Dict[str, Optional[List[str]]]:
+    """
+    Return the documents to search, grouped by owner: {owner: [pdf_name, ...]}.
+    In all_documents mode every document of the user and every public document is searched ({owner: None}).
+    """
+    if request.all_documents:
+        return {username: None, "public": None}
+
+    documents: Dict[str, Optional[List[str]]] = {}
+    for name in request.pdf_names or [request.pdf_name]:
+        pdf_name = os.path.splitext(name)[0]
+        names = documents.setdefault(resolve_owner(username, pdf_name), [])
+        if pdf_name not in names:
+            names.append(pdf_name)
+    return documents
+
+class PreparedChat:
+    """Everything /chat needs before calling the model: a cached answer or the retrieved context."""
+
+    def __init__(
+        self, scope, version, query_embedding, query, search_query, session=None,
+        cached_answer=None, context=None, context_stats=None,
+    ):
+        self.scope = scope
+        self.version = version
+        self.query_embedding = query_embedding
+        self.query = query
+        self.search_query = search_query
+        self.session = session
+        self.history = session.history() if session is not None else []
+        self.cached_answer = cached_answer
+        self.context = context
+        self.context_stats = context_stats
+
+    def remember(self, answer: str) -> None:
+        """Cache a newly generated answer and record the turn in the session."""
+        if self.cached_answer is None:
+            answer_cache.store(self.scope, self.query_embedding, answer, self.version)
+        if self.session is not None:
+            self.session.add_turn(self.query, answer)
+
+    def response_fields(self) -> dict:
+        fields = {}
+        if self.session is not None:
+            fields["session_id"] = self.session.id
+            if self.search_query != self.query:
+                fields["rewritten_query"] = self.search_query
+        return fields
+
+def chat_scope(documents: Dict[str, Optional[List[str]]], model_name: str):
+    """Answer-cache scope (documents searched + model) and the version of the collections involved."""
+    owners = sorted(documents)
+    scope = (
+        tuple((owner, tuple(sorted(documents[owner])) if documents[owner] is not None else None) for owner in owners),
+        model_name.lower(),
+    )
+    return scope, tuple(collection_version(owner) for owner in owners)
+
+def searches_several(documents: Dict[str, Optional[List[str]]]) -> bool:
+    return len(documents) > 1 or any(names is None or len(names) > 1 for names in documents.values())
+
+def prepare_chat(
+    username: str,
+    documents: Dict[str, Optional[List[str]]],
+    model_name: str,
+    query: str,
+    k: int = 5,
+    session: Optional[ChatSession] = None,
+    tracker: Optional[LLMCallTracker] = None,
+) -> PreparedChat:
+    """
+    Embed the query once, answer from the semantic cache when possible,
+    otherwise run the top-k similarity search over the requested documents with the same embedding.
+
+    - In a session, a follow-up is first rewritten into a standalone question from the recent turns,
+      and a retrieval made earlier in the session for a similar question is reused
+    """
+    search_query = query
+    if session is not None and SESSION_REWRITE_QUERIES and session.history():
+        config = {"callbacks": [tracker]} if tracker is not None else None
+        with stage("rewrite"):
+            search_query = rewrite_query(llm_registry.get_llm(model_name), session.history(), query, config)
+        print(f"Rewrote follow-up query: {query!r} -> {search_query!r}")
+
+    with stage("embed_query"):
+        query_embedding = embed_query(search_query)
+    scope, version = chat_scope(documents, model_name)
+
+    def prepared(**fields) -> PreparedChat:
+        return PreparedChat(scope, version, query_embedding, query, search_query, session, **fields)
+
+    with stage("cache_lookup"):
+        cached_answer = answer_cache.lookup(scope, query_embedding, version)
+        retrieval = None
+        if cached_answer is None and session is not None:
+            retrieval = session.cached_retrieval(scope, query_embedding, version)
+    if cached_answer is not None:
+        return prepared(cached_answer=cached_answer)
+    if retrieval is not None:
+        context, context_stats = retrieval
+        return prepared(context=context, context_stats=dict(context_stats, reused=True))
+
+    docs = search_documents(documents, query_embedding, k=k)
+    multiple = searches_several(documents)
+    if not docs and not multiple:
+        raise HTTPException(status_code=404, detail="FAISS index not found for this document.")
+    # Merge overlapping chunks and fit the model's context budget; label chunks when several documents are searched
+    with stage("pack_context"):
+        packed = pack_context(docs, model_name, label_documents=multiple)
+    print(f"Context: {packed.tokens} tokens from {packed.chunks_used}/{packed.chunks_total} chunks ({packed.saved_tokens} saved)")
+    if session is not None:
+        session.store_retrieval(scope, query_embedding, version, (packed.text, packed.to_dict()))
+    return prepared(context=packed.text, context_stats=packed.to_dict())
+
+def build_rag_messages(context: str, query: str, history: Optional[List[tuple]] = None) -> List[dict]:
+    messages = [
+        {"type": "system", "content": DYNAMIC_RAG_PROMPT},
+        {"type": "human", "content": f"Here is some context from your document:\n\n{context}"},
+    ]
+    for question, answer in history or []:
+        messages.append({"type": "human", "content": question})
+        messages.append({"type": "ai", "content": answer})
+    messages.append({"type": "human", "content": query})
+    return messages
+
+def message_text(message) -> str:
+    content = getattr(message, "content", "")
+    if isinstance(content, str):
+        return content
+    # Some providers (e.g. Gemini) return a list of content parts
+    return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+
+def extract_answer(result) -> str:
+    if isinstance(result, dict):
+        if "output" in result:
+            return result["output"]
+        elif "messages" in result and result["messages"]:
+            last_msg = result["messages"][-1]
+            return getattr(last_msg, "content", str(last_msg))
+    return str(result)
+
+def generate_answer(model_name: str, mode: str, messages: List[dict], tracker: LLMCallTracker) -> str:
+    """Answer with one direct model call, or through the ReAct agent when mode is "agent"."""
+    config = {"callbacks": [tracker]}
+    if mode == "agent":
+        agent = llm_registry.get_agent(model_name)
+        return extract_answer(agent.invoke({"messages": messages}, config=config))
+    return message_text(llm_registry.get_llm(model_name).invoke(messages, config=config))
+
+@contextmanager
+def provider_errors(step: str):
+    """
+    Map failures of the model or embeddings provider (timeout, rate limit, outage) while preparing
+    a chat (query rewrite, query embedding) to 502, like those of the answer itself.
+    HTTP errors and embedding backend mismatches keep their own status.
+    """
+    try:
+        yield
+    except (HTTPException, EmbeddingMismatchError):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"{step} failed: {str(e)}")
+
+def resolve_model(model_name: str) -> None:
+    """Build (or reuse) the model's client up front, so an unknown model is a 400 and not a failed chat."""
+    try:
+        llm_registry.get_llm(model_name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.post("/chat")
 def chat_endpoint(request: ChatRequest, current_user: models.User = Depends(get_current_user)):
-    if not request.model_name or not request.pdf_name:
+    if not request.model_name or not request.has_documents():
         raise HTTPException(status_code=400, detail="Model name and PDF name are required.")
+    mode = resolve_mode(request)
+    resolve_model(request.model_name)
+    username = current_user.username
+    session = resolve_session(username, request)
+    documents = resolve_documents(username, request)
+
+    query = request.messages[-1]
+    tracker = LLMCallTracker(request.model_name)
+    with provider_errors("Retrieval"):
+        prepared = prepare_chat(username, documents, request.model_name, query, session=session, tracker=tracker)
+    if prepared.cached_answer is not None:
+        prepared.remember(prepared.cached_answer)
+        return {"answer": prepared.cached_answer, "cached": True, **prepared.response_fields()}
 
     try:
-        llm = load_llm(request.model_name)
-        tools = [TavilySearchResults(max_results=2)]
-        agent = create_react_agent(llm, tools)
+        with stage("llm"):
+            response = generate_answer(
+                request.model_name, mode, build_rag_messages(prepared.context, query, prepared.history), tracker
+            )
+    except Exception as e:
+        # The model provider failed (timeout, rate limit, outage), not the request
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail=f"Agent execution failed: {str(e)}")
+    prepared.remember(response)
+    return {
+        "answer": response,
+        "cached": False,
+        "mode": mode,
+        "context": prepared.context_stats,
+        **prepared.response_fields(),
+        **tracker.to_dict(),
+    }
 
-        username = current_user.username
-        pdf_name = os.path.splitext(request.pdf_name)[0]
+# --- Streaming Chat Endpoint (Server-Sent Events) ---
+# How often to check for a disconnected client while waiting on the model
+DISCONNECT_POLL_SECONDS = 0.5
 
-        #vectorstore = load_faiss_index(username=username, pdf_name=pdf_name)
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-        user_pdf_path = os.path.join(UPLOAD_FOLDER, username, f"{pdf_name}.pdf")
-        public_pdf_path = os.path.join(UPLOAD_FOLDER, f"{pdf_name}.pdf")
+async def agent_tokens(agent, messages: List[dict], config: dict):
+    """Tokens of the agent's answer; only the model node is relayed (tool results are skipped)."""
+    async for chunk, metadata in agent.astream({"messages": messages}, config=config, stream_mode="messages"):
+        if not isinstance(chunk, AIMessageChunk) or metadata.get("langgraph_node") != "agent":
+            continue
+        text = message_text(chunk)
+        if text:
+            yield text
 
-        if os.path.exists(user_pdf_path):
-            vectorstore = load_faiss_index(username=username, pdf_name=pdf_name)
-        elif os.path.exists(public_pdf_path):
-            vectorstore = load_faiss_index(username="public", pdf_name=pdf_name)
-        else:
-            raise HTTPException(status_code=404, detail="PDF file not found.")
+async def llm_tokens(llm, messages: List[dict], config: dict):
+    """Tokens of a single direct model call."""
+    async for chunk in llm.astream(messages, config=config):
+        text = message_text(chunk)
+        if text:
+            yield text
 
-        if vectorstore is None:
-            raise HTTPException(status_code=404, detail="FAISS index not found for this document.")
+async def stream_answer(tokens, http_request: Request, on_done=None, done_fields=None):
+    """
+    Consume an async token iterator in a background task and relay the tokens as SSE events.
 
-        query = request.messages[-1]
-        docs = vectorstore.similarity_search(query, k=5)
-        context = "\n\n".join([doc.page_content for doc in docs])
+    - If the client goes away the producer task is cancelled, which aborts the upstream LLM call
+    - on_done(answer) is called once the full answer has been streamed
+    - done_fields, if given, is called for extra fields of the final "done" event
+    """
+    queue: asyncio.Queue = asyncio.Queue()
 
-        messages = [
-            {"type": "system", "content": DYNAMIC_RAG_PROMPT},
-            {"type": "human", "content": f"Here is some context from your document:\n\n{context}"},
-            {"type": "human", "content": query},
-        ]
+    async def produce():
+        try:
+            with stage("llm"):
+                async for text in tokens:
+                    await queue.put(("token", text))
+            await queue.put(("done", None))
+        except Exception as e:
+            await queue.put(("error", f"Agent execution failed: {str(e)}"))
 
-        state = {"messages": messages}
-        result = agent.invoke(state)
-        #print("Agent result:", result)
+    producer = asyncio.create_task(produce())
+    answer = []
+    try:
+        while True:
+            try:
+                kind, value = await asyncio.wait_for(queue.get(), timeout=DISCONNECT_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                if await http_request.is_disconnected():
+                    print("Client disconnected, cancelling chat stream.")
+                    break
+                continue
 
-        if isinstance(result, dict):
-            if "output" in result:
-                response = result["output"]
-            elif "messages" in result and result["messages"]:
-                last_msg = result["messages"][-1]
-                response = getattr(last_msg, "content", str(last_msg))
+            if kind == "token":
+                answer.append(value)
+                yield _sse("token", {"token": value})
+            elif kind == "done":
+                full_answer = "".join(answer)
+                if on_done is not None:
+                    on_done(full_answer)
+                yield _sse("done", {"answer": full_answer, "cached": False, **(done_fields() if done_fields else {})})
+                break
             else:
-                response = str(result)
+                yield _sse("error", {"error": value})
+                break
+    finally:
+        producer.cancel()
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(
+    request: ChatRequest,
+    http_request: Request,
+    current_user: models.User = Depends(get_current_user),
+):
+    if not request.model_name or not request.has_documents():
+        raise HTTPException(status_code=400, detail="Model name and PDF name are required.")
+
+    mode = resolve_mode(request)
+    username = current_user.username
+    session = resolve_session(username, request)
+    documents = await run_in_threadpool(resolve_documents, username, request)
+    query = request.messages[-1]
+    tracker = LLMCallTracker(request.model_name)
+
+    # Query rewriting, index loading, query embedding and search are blocking, keep them off the event loop
+    with provider_errors("Retrieval"):
+        prepared = await run_in_threadpool(
+            prepare_chat, username, documents, request.model_name, query, session=session, tracker=tracker
+        )
+
+    if prepared.cached_answer is not None:
+        prepared.remember(prepared.cached_answer)
+
+        async def replay_cached():
+            yield _sse("token", {"token": prepared.cached_answer})
+            yield _sse("done", {"answer": prepared.cached_answer, "cached": True, **prepared.response_fields()})
+        stream = replay_cached()
+    else:
+        messages = build_rag_messages(prepared.context, query, prepared.history)
+        config = {"callbacks": [tracker]}
+        try:
+            if mode == "agent":
+                agent = await run_in_threadpool(llm_registry.get_agent, request.model_name)
+                tokens = agent_tokens(agent, messages, config)
+            else:
+                llm = await run_in_threadpool(llm_registry.get_llm, request.model_name)
+                tokens = llm_tokens(llm, messages, config)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        stream = stream_answer(
+            tokens,
+            http_request,
+            on_done=prepared.remember,
+            done_fields=lambda: {
+                "mode": mode, "context": prepared.context_stats, **prepared.response_fields(), **tracker.to_dict()
+            },
+        )
+
+    return StreamingResponse(
+        stream,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# --- Batch Chat Endpoint: a checklist of questions against the same documents (Server-Sent Events) ---
+# Questions accepted by one /chat/batch request, and model calls in flight for one batch
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "100"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+
+class BatchChatRequest(BaseModel):
+    model_name: str
+    questions: List[str]
+    pdf_name: Optional[str] = None
+    pdf_names: Optional[List[str]] = None
+    all_documents: bool = False
+    mode: Optional[str] = None
+    # Questions whose retrieved chunks fit in one context budget together send the same context
+    share_context: bool = True
+
+    def has_documents(self) -> bool:
+        return bool(self.pdf_name or self.pdf_names or self.all_documents)
+
+def prepare_batch(
+    documents: Dict[str, Optional[List[str]]],
+    model_name: str,
+    questions: List[str],
+    k: int = 5,
+    share_context: bool = True,
+) -> List[PreparedChat]:
+    """
+    prepare_chat for many questions: one embeddings request for the uncached questions, one matrix
+    search per collection, and (with share_context) one packed context per group of questions
+    whose chunks fit in the budget together.
+    """
+    with stage("embed_query"):
+        query_embeddings = embed_queries(questions)
+    scope, version = chat_scope(documents, model_name)
+    with stage("cache_lookup"):
+        cached_answers = [answer_cache.lookup(scope, embedding, version) for embedding in query_embeddings]
+    prepared = [
+        PreparedChat(scope, version, embedding, question, question, cached_answer=cached_answer)
+        for question, embedding, cached_answer in zip(questions, query_embeddings, cached_answers)
+    ]
+
+    pending = [i for i, cached_answer in enumerate(cached_answers) if cached_answer is None]
+    if not pending:
+        return prepared
+    results = search_documents_batch(documents, [query_embeddings[i] for i in pending], k=k)
+    multiple = searches_several(documents)
+    if not any(results) and not multiple:
+        raise HTTPException(status_code=404, detail="FAISS index not found for this document.")
+
+    with stage("pack_context"):
+        if share_context:
+            groups = share_contexts(results, model_name, label_documents=multiple)
         else:
-            response = str(result)
+            groups = [([j], pack_context(docs, model_name, label_documents=multiple)) for j, docs in enumerate(results)]
+    for indices, packed in groups:
+        for j in indices:
+            chat = prepared[pending[j]]
+            chat.context = packed.text
+            chat.context_stats = dict(packed.to_dict(), shared_by=len(indices))
+    print(f"Batch of {len(questions)} questions: {len(questions) - len(pending)} cached, {len(groups)} contexts")
+    return prepared
 
-        return {"answer": response}
+async def agenerate_answer(model_name: str, mode: str, messages: List[dict], tracker: LLMCallTracker) -> str:
+    """generate_answer without blocking the event loop."""
+    config = {"callbacks": [tracker]}
+    if mode == "agent":
+        agent = await run_in_threadpool(llm_registry.get_agent, model_name)
+        return extract_answer(await agent.ainvoke({"messages": messages}, config=config))
+    llm = await run_in_threadpool(llm_registry.get_llm, model_name)
+    return message_text(await llm.ainvoke(messages, config=config))
 
-    except Exception as e:
-        import traceback
-        return {"error": f"Agent execution failed: {str(e)}"}
+@app.post("/chat/batch")
+async def chat_batch_endpoint(
+    request: BatchChatRequest,
+    http_request: Request,
+    current_user: models.User = Depends(get_current_user),
+):
+    """
+    Answer many questions about the same documents. Events are sent as each question finishes:
+    "answer" ({index, question, answer, ...}) or "error" ({index, question, error}), then "done".
+
+    - Cached answers come first, the others are generated with at most BATCH_LLM_CONCURRENCY model calls at once
+    - If the client goes away the remaining model calls are cancelled
+    """
+    if not request.model_name or not request.has_documents() or not request.questions:
+        raise HTTPException(status_code=400, detail="Model name, PDF name and questions are required.")
+    if len(request.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch.")
+    mode = resolve_mode(request)
+    await run_in_threadpool(resolve_model, request.model_name)
+    username = current_user.username
+    documents = await run_in_threadpool(resolve_documents, username, request)
+    with provider_errors("Retrieval"):
+        prepared = await run_in_threadpool(
+            prepare_batch, documents, request.model_name, request.questions, share_context=request.share_context
+        )
+
+    async def answer(index: int, chat: PreparedChat, semaphore: asyncio.Semaphore):
+        tracker = LLMCallTracker(request.model_name)
+        async with semaphore:
+            try:
+                with stage("llm"):
+                    text = await agenerate_answer(
+                        request.model_name, mode, build_rag_messages(chat.context, chat.query), tracker
+                    )
+            except Exception as e:
+                return index, None, f"Agent execution failed: {str(e)}", tracker
+        chat.remember(text)
+        return index, text, None, tracker
+
+    async def events():
+        started = time.perf_counter()
+        counts = {"cached": 0, "answered": 0, "failed": 0}
+        for index, chat in enumerate(prepared):
+            if chat.cached_answer is not None:
+                chat.remember(chat.cached_answer)
+                counts["cached"] += 1
+                yield _sse("answer", {"index": index, "question": chat.query, "answer": chat.cached_answer, "cached": True})
+
+        semaphore = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+        tasks = [
+            asyncio.create_task(answer(index, chat, semaphore))
+            for index, chat in enumerate(prepared) if chat.cached_answer is None
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                index, text, error, tracker = await next_done
+                if await http_request.is_disconnected():
+                    print("Client disconnected, cancelling chat batch.")
+                    return
+                question = prepared[index].query
+                if error is not None:
+                    counts["failed"] += 1
+                    yield _sse("error", {"index": index, "question": question, "error": error})
+                    continue
+                counts["answered"] += 1
+                yield _sse("answer", {
+                    "index": index, "question": question, "answer": text, "cached": False, "mode": mode,
+                    "context": prepared[index].context_stats, **tracker.to_dict(),
+                })
+            contexts = len({chat.context for chat in prepared if chat.cached_answer is None})
+            yield _sse("done", {
+                "questions": len(prepared), **counts, "contexts": contexts,
+                "seconds": round(time.perf_counter() - started, 3),
+            })
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# --- Chat sessions ---
+@app.post("/sessions")
+def create_session(current_user: models.User = Depends(get_current_user)):
+    session = session_store.create(current_user.username)
+    return {"session_id": session.id}
+
+@app.get("/sessions/{session_id}")
+def get_session(session_id: str, current_user: models.User = Depends(get_current_user)):
+    session = session_store.get(session_id, current_user.username)
+    if session is None:
+        raise session_not_found()
+    return session.to_dict()
+
+@app.delete("/sessions/{session_id}")
+def delete_session(session_id: str, current_user: models.User = Depends(get_current_user)):
+    if not session_store.delete(session_id, current_user.username):
+        raise session_not_found()
+    return {"message": "Session deleted."}
+
+# --- Health and readiness ---
+@app.get("/health")
+def health():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "serving"}
+
+@app.get("/ready")
+def ready(response: Response):
+    """Readiness: 200 once the startup warm-up (model clients, embeddings client, hot collections) is done, else 503."""
+    state = readiness.status()
+    if not state["warm"]:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return state
+
+# --- Cache statistics ---
+@app.get("/cache_stats")
+def get_cache_stats(current_user: models.User = Depends(get_current_user)):
+    return {
+        "faiss_index": index_cache.stats(),
+        "answers": answer_cache.stats(),
+        "sessions": session_store.stats(),
+        "users": user_cache.stats(),
+    }
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus metrics: request counts by status, per-stage latency histograms, model calls and tokens."""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/catalog_stats")
+def get_catalog_stats(current_user: models.User = Depends(get_current_user)):
+    """Documents, pages, chunks and index bytes per status, for the caller's documents and the public ones."""
+    return {"owners": catalog.stats([current_user.username, "public"])}
 
 # --- Run App ---
 if __name__ == "__main__":
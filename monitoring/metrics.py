@@ -0,0 +1,140 @@
+# monitoring/metrics.py
+
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+
+# Model calls and ingestion stages can take far longer than the default buckets (up to 10s) cover
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+HTTP_REQUESTS = Counter(
+    "clausewise_http_requests_total", "HTTP requests by route and response status", ["method", "route", "status"]
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "clausewise_http_request_seconds", "Time until the response was fully sent", ["method", "route"],
+    buckets=LATENCY_BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    "clausewise_stage_seconds", "Time spent per stage of a chat request or ingestion job", ["pipeline", "stage"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_CALLS = Counter("clausewise_llm_calls_total", "Model calls by outcome", ["model", "status"])
+LLM_CALL_SECONDS = Histogram("clausewise_llm_call_seconds", "Duration of one model call", ["model"], buckets=LATENCY_BUCKETS)
+LLM_TOKENS = Counter("clausewise_llm_tokens_total", "Tokens reported by the model provider", ["model", "type"])
+INGESTION_JOBS = Counter("clausewise_ingestion_jobs_total", "Finished ingestion jobs by outcome", ["status"])
+
+
+class StageTimer:
+    """
+    Durations of the stages of one chat request or ingestion job.
+
+    - A stage entered several times (e.g. parsing batch after batch) accumulates
+    - observe() records every stage in the clausewise_stage_seconds histogram once, when the work is done
+    """
+
+    def __init__(self, pipeline: str):
+        self.pipeline = pipeline
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def observe(self) -> None:
+        for stage, seconds in self.stages.items():
+            STAGE_SECONDS.labels(self.pipeline, stage).observe(seconds)
+
+    def server_timing(self) -> str:
+        """Server-Timing header value: every stage so far plus the total, in milliseconds."""
+        entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.stages.items()]
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+
+# The timer of the request or job running in the current context. Threadpool calls and tasks started
+# from a request inherit it, so stages deep in the vectorstore or parser land on the right request.
+_current_timer: ContextVar[Optional[StageTimer]] = ContextVar("stage_timer", default=None)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a block as a stage of the current request or job (does nothing outside of one)."""
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, time.perf_counter() - start)
+
+
+@contextmanager
+def timed_pipeline(pipeline: str) -> Iterator[StageTimer]:
+    """Time the stages of a unit of work outside of a request (an ingestion job) and record them at the end."""
+    timer = StageTimer(pipeline)
+    token = _current_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _current_timer.reset(token)
+        timer.observe()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting requests by route template and status, timing them until the last
+    body chunk is sent (so streamed chats include the model time), and adding a Server-Timing header
+    with the stages that completed before the response started.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timer = StageTimer(scope["path"])
+        _current_timer.set(timer)  # each request runs in its own context, no reset needed
+        status = "500"
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timer.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            # Label by route template (/jobs/{job_id}), never by raw path, to keep the series bounded
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            timer.pipeline = route
+            method = scope["method"]
+            HTTP_REQUESTS.labels(method, route, status).inc()
+            HTTP_REQUEST_SECONDS.labels(method, route).observe(timer.elapsed())
+            timer.observe()
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Prometheus exposition of this process, or of all workers when PROMETHEUS_MULTIPROC_DIR is set."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
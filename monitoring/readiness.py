@@ -0,0 +1,55 @@
+# monitoring/readiness.py
+
+import threading
+import time
+from typing import Any, Callable, Dict
+
+
+class Readiness:
+    """
+    Tracks the background warm-up steps started at startup, for GET /ready.
+
+    - "serving": the app accepts requests (true as soon as startup returns)
+    - "warm": every warm-up step has finished, so no request pays for a cold model client or index
+    - A failed step still counts as finished; its error is reported instead of blocking readiness forever
+    """
+
+    def __init__(self):
+        self._steps: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def run(self, name: str, func: Callable[..., Any], *args: Any, **kwargs: Any) -> None:
+        """Run func(*args, **kwargs) on a daemon thread and record how it went under name."""
+        with self._lock:
+            self._steps[name] = {"status": "running", "seconds": None, "error": None}
+        threading.Thread(
+            target=self._run, args=(name, func, args, kwargs), name=f"warmup-{name}", daemon=True
+        ).start()
+
+    def _run(self, name: str, func: Callable[..., Any], args: tuple, kwargs: dict) -> None:
+        start = time.perf_counter()
+        status, error = "done", None
+        try:
+            result = func(*args, **kwargs)
+            # Steps that warm several things return {item: error} for the ones that failed
+            if isinstance(result, dict) and result:
+                status, error = "failed", "; ".join(f"{key}: {value}" for key, value in result.items())
+        except Exception as e:
+            status, error = "failed", str(e)
+            print(f"Warm-up step {name} failed: {e}")
+        with self._lock:
+            self._steps[name] = {"status": status, "seconds": round(time.perf_counter() - start, 3), "error": error}
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            steps = {name: dict(step) for name, step in self._steps.items()}
+        return {
+            "serving": True,
+            "warm": all(step["status"] != "running" for step in steps.values()),
+            "uptime_seconds": round(time.time() - self.started_at, 3),
+            "steps": steps,
+        }
+
+
+readiness = Readiness()
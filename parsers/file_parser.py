@@ -1,32 +1,57 @@
 import os
-from typing import List
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterator, List, NamedTuple, Optional, Tuple, Union
 from langchain.docstore.document import Document
-from langchain.document_loaders import (
-    PyPDFLoader,
-    TextLoader,
-    CSVLoader,
-    UnstructuredWordDocumentLoader,
-)
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from monitoring.metrics import stage
+from parsers import pdf_backends
+from parsers.text_cache import TextCacheWriter, file_hash, read_cached, read_header
 
 UPLOAD_DIR = "uploaded_docs"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# Worker processes used to extract pages of large PDFs and multi-file batches. Half the cores, at most 4,
+# so ingestion never takes every core from the requests (/chat) served by the same machine
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(min(4, max(1, (os.cpu_count() or 1) // 2)))))
+# PDFs with at least this many pages are split across the process pool
+PARSE_PARALLEL_MIN_PAGES = int(os.getenv("PARSE_PARALLEL_MIN_PAGES", "32"))
+PARSE_PAGES_PER_TASK = int(os.getenv("PARSE_PAGES_PER_TASK", "16"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
 
 def load_file(file_path: str) -> List[Document]:
     """
     Load documents from a file based on its extension.
     Supports PDF, TXT, CSV, DOC, DOCX.
+    PDFs are read with the configured PDF backend, through the extracted-text cache.
     """
     ext = os.path.splitext(file_path)[1].lower()
 
     if ext == ".pdf":
-        loader = PyPDFLoader(file_path)
+        pages = []
+        for item in _iter_pages([file_path], parallel=False):
+            if isinstance(item, FileEnd):
+                # A PDF that fails part way loads as nothing rather than truncated
+                return pages if item.error is None else []
+            pages.extend(item[1])
+        return pages
+    # The loaders (and the SDKs behind them) are only imported for the formats actually uploaded
     elif ext == ".txt":
+        from langchain_community.document_loaders import TextLoader
+
         loader = TextLoader(file_path)
     elif ext == ".csv":
+        from langchain_community.document_loaders import CSVLoader
+
         loader = CSVLoader(file_path)
     elif ext in [".doc", ".docx"]:
+        from langchain_community.document_loaders import UnstructuredWordDocumentLoader
+
         loader = UnstructuredWordDocumentLoader(file_path)
     else:
         raise ValueError(f"Unsupported file format: {ext}")
@@ -34,25 +59,288 @@ def load_file(file_path: str) -> List[Document]:
     return loader.load()
 
 
-def parse_and_chunk(file_paths: List[str], username: str = None) -> List[Document]:
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the API process runs threads (ingestion queue, threadpool)
+            _pool = ProcessPoolExecutor(
+                max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _page_document(text: str, base_metadata: dict, page_number: int, page_label: str) -> Document:
+    return Document(page_content=text, metadata=dict(base_metadata, page=page_number, page_label=page_label))
+
+
+def _extract_pdf_pages(
+    file_path: str, start: int, base_metadata: dict, page_labels: List[str], backend: str
+) -> List[Document]:
     """
-    Load all files, combine documents, and split into chunks.
-    Returns a list of Document chunks.
-    If username is provided, documents are assumed to be under uploaded_docs/{username}/
+    Extract the pages [start, start + len(page_labels)) of a PDF.
+    Runs in a worker process in parallel mode.
     """
-    all_docs = []
-    for file_path in file_paths:
+    texts = pdf_backends.extract_texts(file_path, start, start + len(page_labels), backend)
+    return [
+        _page_document(text, base_metadata, start + i, label)
+        for i, (text, label) in enumerate(zip(texts, page_labels))
+    ]
+
+
+def _plan_pdf(file_path: str, backend: str) -> Tuple[Optional[TextCacheWriter], Iterator]:
+    """
+    Return (cache writer, work) for one PDF.
+
+    - On a text cache hit the work is the cached pages, in batches, and there is nothing to write
+    - Otherwise the work is page-range extraction tasks and the writer stores their output
+    """
+    content_hash = file_hash(file_path)
+    cached = read_cached(content_hash, backend)
+    if cached is not None:
+        header, cached_pages = cached
+        base_metadata = dict(header["metadata"], source=file_path)
+
+        def replay():
+            batch = []
+            for page_number, (text, label) in enumerate(cached_pages):
+                batch.append(_page_document(text, base_metadata, page_number, label))
+                if len(batch) == PARSE_PAGES_PER_TASK:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+        return None, replay()
+
+    metadata, labels = pdf_backends.read_info(file_path, backend)
+    base_metadata = dict(metadata, source=file_path)
+    writer = TextCacheWriter(content_hash, backend, {"backend": backend, "metadata": metadata})
+
+    # Small PDFs are one task; large ones are cut into page ranges
+    step = PARSE_PAGES_PER_TASK if len(labels) >= PARSE_PARALLEL_MIN_PAGES else max(len(labels), 1)
+    tasks = (
+        (_extract_pdf_pages, (file_path, start, base_metadata, labels[start:start + step], backend))
+        for start in range(0, len(labels), step)
+    )
+    return writer, tasks
+
+
+def _plan_file(file_path: str, backend: str) -> Tuple[Optional[TextCacheWriter], Iterator]:
+    """
+    Return (cache writer, work) for one file. The work is yielded in page order and
+    each item is either a list of already extracted pages or a (func, args) task.
+    """
+    if os.path.splitext(file_path)[1].lower() == ".pdf":
+        return _plan_pdf(file_path, backend)
+    return None, iter([(load_file, (file_path,))])
+
+
+class _Done:
+    """Already computed result with the Future.result() interface."""
+
+    def __init__(self, value):
+        self._value = value
+
+    def result(self):
+        return self._value
+
+
+class _Failed:
+    """Error raised while planning a file, with the Future.result() interface."""
+
+    def __init__(self, error: Exception):
+        self._error = error
+
+    def result(self):
+        raise self._error
+
+
+class FileEnd(NamedTuple):
+    """
+    Yielded after the last pages (or chunks) of a file. error is set when the file failed
+    part way: what was yielded for it before is incomplete and must be thrown away.
+    """
+
+    file_path: str
+    error: Optional[Exception] = None
+
+
+# Marks the end of a file's tasks in the pending queue
+_FILE_END = object()
+
+
+def _iter_pages(
+    file_paths: List[str],
+    parallel: bool,
+    backend: Optional[str] = None,
+    extracted: Optional[Callable[[int], None]] = None,
+) -> Iterator[Union[Tuple[str, List[Document]], FileEnd]]:
+    """
+    Yield (file_path, pages) batches as they are extracted, in document order, and a FileEnd after each file.
+
+    - Pages are passed on as soon as their batch is extracted, never held back for the rest of the file;
+      in parallel mode at most 2 * PARSE_WORKERS batches are in flight, so memory does not grow with the document
+    - A file that fails part way ends with FileEnd(file_path, error) and nothing more is yielded for it
+    - extracted, if given, is called with the number of pages of each batch as it comes in
+    - Freshly extracted PDF pages are written to the text cache, committed once the file is complete
+    """
+    backend = pdf_backends.resolve_backend(backend)
+    pool = _get_pool() if parallel else None
+    window = 2 * PARSE_WORKERS if pool is not None else 1
+    pending = deque()
+    failed = set()
+
+    def collect():
+        file_path, future, writer = pending.popleft()
+        if file_path in failed:
+            return None
+        if future is _FILE_END:
+            if writer is not None:
+                writer.commit()
+            return FileEnd(file_path)
         try:
-            # Adjust file path if user-specific
-            if username and username.lower() != "public":
-                file_path = os.path.join(UPLOAD_DIR, username, os.path.basename(file_path))
-            docs = load_file(file_path)
-            all_docs.extend(docs)
+            pages = future.result()
         except Exception as e:
             print(f"Error loading {file_path}: {e}")
+            failed.add(file_path)
+            if writer is not None:
+                writer.abort()
+            return FileEnd(file_path, e)
+        if writer is not None:
+            writer.add([(page.page_content, page.metadata["page_label"]) for page in pages])
+        if extracted is not None:
+            extracted(len(pages))
+        return file_path, pages
+
+    for file_path in file_paths:
+        writer = None
+        try:
+            writer, work = _plan_file(file_path, backend)
+            for task in work:
+                if isinstance(task, list):
+                    future = _Done(task)
+                elif pool is None:
+                    func, args = task
+                    future = _Done(func(*args))
+                else:
+                    func, args = task
+                    future = pool.submit(func, *args)
+                pending.append((file_path, future, writer))
+
+                while len(pending) >= window:
+                    item = collect()
+                    if item:
+                        yield item
+            pending.append((file_path, _FILE_END, writer))
+        except Exception as e:
+            # Reported in order, after the batches of the file already queued
+            pending.append((file_path, _Failed(e), writer))
+
+    while pending:
+        item = collect()
+        if item:
+            yield item
 
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    chunks = splitter.split_documents(all_docs)
+
+def iter_chunks(
+    file_paths: List[str],
+    username: str = None,
+    progress: Optional[Callable[..., None]] = None,
+    parallel: Optional[bool] = None,
+    backend: Optional[str] = None,
+) -> Iterator[Union[Document, FileEnd]]:
+    """
+    Stream Document chunks as pages are extracted, with a FileEnd after the chunks of each file.
+
+    - Chunks come out in the same order and with the same content as the serial path, file by file;
+      nothing is buffered per file, so memory stays bounded however long the document is
+    - A file that fails part way ends with FileEnd(file_path, error): its chunks yielded so far must be discarded
+    - With parallel (default when PARSE_WORKERS > 1), page extraction runs in a process pool
+    - backend picks the PDF extractor ("pymupdf" or "pypdf", default PDF_BACKEND)
+    - If username is provided, documents are assumed to be under uploaded_docs/{username}/
+    - If progress is provided, it is called with pages_parsed=<n> as pages come in
+    """
+    if username and username.lower() != "public":
+        file_paths = [os.path.join(UPLOAD_DIR, username, os.path.basename(p)) for p in file_paths]
+    if parallel is None:
+        parallel = PARSE_WORKERS > 1
+
+    # Imported here: the splitter package is slow to import and only needed for ingestion
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    # start_index lets the context packer merge overlapping neighbours at chat time
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200, add_start_index=True)
+    pages_parsed = 0
+
+    def extracted(pages: int) -> None:
+        nonlocal pages_parsed
+        pages_parsed += pages
+        if progress is not None:
+            progress(pages_parsed=pages_parsed)
+
+    items = _iter_pages(file_paths, parallel, backend, extracted=extracted)
+    while True:
+        with stage("parse"):
+            item = next(items, None)
+        if item is None:
+            break
+        if isinstance(item, FileEnd):
+            yield item
+            continue
+        _, pages = item
+        # The splitter works page by page, so splitting per batch matches splitting everything at once
+        with stage("chunk"):
+            chunks = splitter.split_documents(pages)
+        yield from chunks
+
+
+def page_count(file_path: str, content_hash: Optional[str] = None) -> Optional[int]:
+    """
+    Pages of a PDF, from the text cache when it has been parsed before, else from the PDF itself.
+    None when the file cannot be read.
+    """
+    backend = pdf_backends.resolve_backend()
+    header = read_header(content_hash or file_hash(file_path), backend)
+    if header is not None and "total_pages" in header["metadata"]:
+        return header["metadata"]["total_pages"]
+    try:
+        metadata, _ = pdf_backends.read_info(file_path, backend)
+    except Exception as e:
+        print(f"Could not count the pages of {file_path}: {e}")
+        return None
+    return metadata["total_pages"]
+
+
+def parse_and_chunk(
+    file_paths: List[str],
+    username: str = None,
+    progress: Optional[Callable[..., None]] = None,
+) -> List[Document]:
+    """
+    Load all files, combine documents, and split into chunks.
+    Returns a list of Document chunks of the files that loaded completely.
+    If username is provided, documents are assumed to be under uploaded_docs/{username}/
+    If progress is provided, it is called with pages_parsed=<n> as pages are extracted.
+    Holds every chunk in memory: ingestion consumes iter_chunks instead.
+    """
+    chunks: List[Document] = []
+    file_chunks: List[Document] = []
+    for item in iter_chunks(file_paths, username=username, progress=progress):
+        if isinstance(item, FileEnd):
+            if item.error is None:
+                chunks.extend(file_chunks)
+            file_chunks = []
+        else:
+            file_chunks.append(item)
 
     print(f"🔍 Total chunks created: {len(chunks)}")
     for i, chunk in enumerate(chunks[:3]):
@@ -0,0 +1,68 @@
+# parsers/pdf_backends.py
+
+import os
+from typing import Dict, List, Optional, Tuple
+
+# "pymupdf" (fast, default) or "pypdf" (pure Python fallback)
+PDF_BACKEND = os.getenv("PDF_BACKEND", "pymupdf").lower()
+BACKENDS = ("pymupdf", "pypdf")
+
+# Document info fields copied into every page's metadata (same names for both backends)
+_INFO_FIELDS = ("title", "author", "subject", "creator", "producer", "creationdate", "moddate")
+
+
+def _import_pymupdf():
+    try:
+        import pymupdf
+    except ImportError:
+        import fitz as pymupdf  # older PyMuPDF releases only ship the fitz module
+    return pymupdf
+
+
+def resolve_backend(backend: Optional[str] = None) -> str:
+    """Return the backend to use, falling back to pypdf when PyMuPDF is not installed."""
+    name = (backend or PDF_BACKEND).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unsupported PDF backend: {name}")
+    if name == "pymupdf":
+        try:
+            _import_pymupdf()
+        except ImportError:
+            print("PyMuPDF is not installed, falling back to pypdf.")
+            return "pypdf"
+    return name
+
+
+def read_info(file_path: str, backend: str) -> Tuple[Dict[str, str], List[str]]:
+    """
+    Return (document metadata, page labels) for a PDF.
+    The metadata holds the document info fields plus total_pages.
+    """
+    if backend == "pymupdf":
+        pymupdf = _import_pymupdf()
+        with pymupdf.open(file_path) as doc:
+            raw = {k.lower(): v for k, v in (doc.metadata or {}).items()}
+            labels = [doc[i].get_label() or str(i + 1) for i in range(doc.page_count)]
+    else:
+        import pypdf
+
+        reader = pypdf.PdfReader(file_path)
+        raw = {k.lstrip("/").lower(): v for k, v in (reader.metadata or {}).items()}
+        labels = list(reader.page_labels)
+
+    metadata = {field: str(raw[field]) for field in _INFO_FIELDS if raw.get(field)}
+    metadata["total_pages"] = len(labels)
+    return metadata, labels
+
+
+def extract_texts(file_path: str, start: int, stop: int, backend: str) -> List[str]:
+    """Return the stripped text of pages [start, stop)."""
+    if backend == "pymupdf":
+        pymupdf = _import_pymupdf()
+        with pymupdf.open(file_path) as doc:
+            return [doc[i].get_text().strip() for i in range(start, stop)]
+
+    import pypdf
+
+    reader = pypdf.PdfReader(file_path)
+    return [reader.pages[i].extract_text(extraction_mode="plain").strip() for i in range(start, stop)]
@@ -0,0 +1,80 @@
+# parsers/text_cache.py
+
+import gzip
+import hashlib
+import json
+import os
+from typing import Iterator, List, Optional, Tuple
+
+# Extracted page text, keyed by the PDF's content hash and the extraction backend
+EXTRACTED_TEXT_CACHE_DIR = os.getenv("EXTRACTED_TEXT_CACHE_DIR", "extracted_text_cache")
+
+
+def file_hash(file_path: str, block_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_path(content_hash: str, backend: str) -> str:
+    return os.path.join(EXTRACTED_TEXT_CACHE_DIR, f"{content_hash}.{backend}.jsonl.gz")
+
+
+def read_header(content_hash: str, backend: str) -> Optional[dict]:
+    """Return the header (backend and document metadata) of a cached document, or None on a miss."""
+    path = cache_path(content_hash, backend)
+    if not os.path.exists(path):
+        return None
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.loads(f.readline())
+
+
+def read_cached(content_hash: str, backend: str) -> Optional[Tuple[dict, Iterator[Tuple[str, str]]]]:
+    """
+    Return (header, pages) for a cached document, or None on a miss.
+    pages lazily yields (text, page_label) so large documents are never fully in memory.
+    """
+    path = cache_path(content_hash, backend)
+    if not os.path.exists(path):
+        return None
+
+    f = gzip.open(path, "rt", encoding="utf-8")
+    header = json.loads(f.readline())
+
+    def pages():
+        with f:
+            for line in f:
+                record = json.loads(line)
+                yield record["text"], record["page_label"]
+
+    return header, pages()
+
+
+class TextCacheWriter:
+    """
+    Writes a document's pages to the cache as they are extracted.
+    The file only becomes visible on commit(), so a failed or partial
+    extraction never leaves a truncated cache entry behind.
+    """
+
+    def __init__(self, content_hash: str, backend: str, header: dict):
+        os.makedirs(EXTRACTED_TEXT_CACHE_DIR, exist_ok=True)
+        self.path = cache_path(content_hash, backend)
+        self._tmp_path = f"{self.path}.{os.getpid()}.{id(self)}.tmp"
+        self._file = gzip.open(self._tmp_path, "wt", encoding="utf-8")
+        self._file.write(json.dumps(header) + "\n")
+
+    def add(self, pages: List[Tuple[str, str]]) -> None:
+        for text, page_label in pages:
+            self._file.write(json.dumps({"text": text, "page_label": page_label}) + "\n")
+
+    def commit(self) -> None:
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self) -> None:
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
@@ -2,10 +2,13 @@ import streamlit as st
 import requests
 import html
 import os
+import time
 
 st.set_page_config(page_title="ClauseWise ⚖️", layout="wide")
 #API_URL = "http://127.0.0.1:8000"
 API_URL = "https://clausewise-backend-140738413424.us-central1.run.app"
+# X-Error-Code the API sends with the 404 of an unknown or expired chat session
+SESSION_NOT_FOUND_CODE = "session_not_found"
 
 # --- Custom Styles ---
 st.markdown("""
@@ -103,7 +106,7 @@ st.markdown("""
 for key, default in {
     "token": None, "username": None, "chat_history": [],
     "last_model": None, "last_pdf": None, "show_signup": False,
-    "pdfs": [], "clear_input": False
+    "pdfs": [], "clear_input": False, "session_id": None
 }.items():
     if key not in st.session_state:
         st.session_state[key] = default
@@ -112,7 +115,7 @@ for key, default in {
 def logout():
     for key in [
         "token", "username", "chat_history",
-        "last_model", "last_pdf", "show_signup", "pdfs"
+        "last_model", "last_pdf", "show_signup", "pdfs", "session_id"
     ]:
         st.session_state[key] = None if key != "chat_history" else []
     st.rerun()
@@ -132,6 +135,31 @@ def get_pdfs():
     except Exception:
         return {"public": [], "user": []}
 
+def wait_for_job(job_id, headers, timeout=600):
+    # Poll the ingestion job until the document is indexed (or failed)
+    progress = st.progress(0, text="Indexing PDF...")
+    deadline = time.time() + timeout
+    job = {}
+    while time.time() < deadline:
+        response = requests.get(f"{API_URL}/jobs/{job_id}", headers=headers)
+        if response.status_code != 200:
+            return {"status": "failed", "error": response.text}
+        job = response.json()
+        if job["status"] in ("completed", "failed"):
+            progress.empty()
+            return job
+        total = job.get("chunks_total") or 0
+        done = job.get("chunks_embedded") or 0
+        text = f"Indexing PDF... {job.get('pages_parsed', 0)} pages parsed, {done}/{total} chunks embedded"
+        progress.progress(min(done / total, 1.0) if total else 0, text=text)
+        time.sleep(1)
+    progress.empty()
+    return {"status": "failed", "error": "Timed out waiting for indexing to finish."}
+
+def start_session(headers):
+    response = requests.post(f"{API_URL}/sessions", headers=headers)
+    return response.json().get("session_id") if response.status_code == 200 else None
+
 def upload_user_pdf(file):
     if not file:
         st.warning("Please upload a valid PDF.")
@@ -144,7 +172,11 @@ def upload_user_pdf(file):
             "file": (file.name, file, "application/pdf")
         }
         response = requests.post(f"{API_URL}/upload_pdf", files=files, headers=headers)
-        if response.status_code == 200:
+        if response.status_code in [200, 202]:
+            job = wait_for_job(response.json()["job_id"], headers)
+            if job["status"] != "completed":
+                st.error(f"Indexing failed: {job.get('error')}")
+                return
             st.success("PDF uploaded and indexed successfully!")
             st.session_state.pdfs = get_pdfs()
             st.rerun()
@@ -176,6 +208,7 @@ def main_ui():
         # Update session state and reset chat if pdf changed
         if selected_pdf != st.session_state.last_pdf:
             st.session_state.chat_history = []
+            st.session_state.session_id = None
             st.session_state.last_pdf = selected_pdf
             st.session_state.clear_input = True
 
@@ -196,6 +229,7 @@ def main_ui():
 
         if selected_model != st.session_state.last_model:
             st.session_state.chat_history = []
+            st.session_state.session_id = None
             st.session_state.last_model = selected_model
             st.session_state.clear_input = True
 
@@ -231,13 +265,26 @@ def main_ui():
             if prompt:
                 try:
                     headers = {"Authorization": f"Bearer {st.session_state.token}"}
-                    payload = {
-                        "model_name": selected_model,
-                        "pdf_name": selected_pdf,
-                        "messages": st.session_state.chat_history + [prompt]
-                    }
-                    res = requests.post(f"{API_URL}/chat", json=payload, headers=headers)
-                    answer = res.json().get("answer", "No answer received.")
+                    # The server keeps the conversation, so only the new message is sent
+                    res = None
+                    for _ in range(2):
+                        if st.session_state.session_id is None:
+                            st.session_state.session_id = start_session(headers)
+                        payload = {
+                            "model_name": selected_model,
+                            "pdf_name": selected_pdf,
+                            "messages": [prompt],
+                            "session_id": st.session_state.session_id,
+                        }
+                        res = requests.post(f"{API_URL}/chat", json=payload, headers=headers)
+                        # Only an unknown or expired session is worth a retry; other errors (e.g. PDF not found) are shown
+                        if res.headers.get("X-Error-Code") != SESSION_NOT_FOUND_CODE:
+                            break
+                        st.session_state.session_id = None  # expired on the server, start a new one
+                    if res.ok:
+                        answer = res.json().get("answer", "No answer received.")
+                    else:
+                        answer = f"Error: {res.json().get('detail', res.text)}"
                 except Exception as e:
                     answer = f"Failed to connect to backend: {e}"
 
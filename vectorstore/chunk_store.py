@@ -0,0 +1,128 @@
+# vectorstore/chunk_store.py
+
+import json
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from langchain.docstore.document import Document
+
+from vectorstore.embedding_cache import _batched, _SQL_BATCH
+
+
+class ChunkStore:
+    """
+    Chunk text and metadata of a collection in SQLite, keyed by FAISS label.
+    Replaces the pickled docstore: nothing is loaded up front, searches only
+    read the rows of their top-k hits, and per-document lookups use an index on pdf_name.
+
+    - read_only stores open the file immutable (no locks, no journal), which is safe because
+      collection files are never modified in place: writers add new segment files and swap them in
+    """
+
+    def __init__(self, path: str, read_only: bool = False):
+        self.path = path
+        self.read_only = read_only
+        self._lock = threading.Lock()
+        if read_only:
+            self._conn = sqlite3.connect(f"file:{path}?immutable=1", uri=True, check_same_thread=False)
+        else:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "label INTEGER PRIMARY KEY, pdf_name TEXT NOT NULL, "
+                "content TEXT NOT NULL, metadata TEXT NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_pdf_name ON chunks (pdf_name)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self._conn.commit()
+
+    def get_meta(self) -> Dict[str, str]:
+        """Return the collection-wide settings (e.g. the embedding backend); empty for stores written before they existed."""
+        with self._lock:
+            try:
+                rows = self._conn.execute("SELECT key, value FROM meta").fetchall()
+            except sqlite3.OperationalError:
+                return {}
+        return dict(rows)
+
+    def set_meta(self, **fields) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                [(key, str(value)) for key, value in fields.items()],
+            )
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def next_label(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(label) + 1, 0) FROM chunks").fetchone()[0]
+
+    def pdf_names(self) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT pdf_name FROM chunks ORDER BY pdf_name").fetchall()
+        return [row[0] for row in rows]
+
+    def chunk_counts(self, labels: Optional[Iterable[int]] = None) -> Dict[str, int]:
+        """Return {pdf_name: number of chunks}, counting only the given labels if any."""
+        with self._lock:
+            if labels is None:
+                rows = self._conn.execute("SELECT pdf_name, COUNT(*) FROM chunks GROUP BY pdf_name").fetchall()
+            else:
+                rows = []
+                for batch in _batched([int(label) for label in labels], _SQL_BATCH):
+                    placeholders = ",".join("?" * len(batch))
+                    rows += self._conn.execute(
+                        f"SELECT pdf_name, COUNT(*) FROM chunks WHERE label IN ({placeholders}) GROUP BY pdf_name", batch
+                    ).fetchall()
+        counts: Dict[str, int] = {}
+        for pdf_name, count in rows:
+            counts[pdf_name] = counts.get(pdf_name, 0) + count
+        return counts
+
+    def labels(self, pdf_names: Optional[List[str]] = None) -> List[int]:
+        """Return the labels of all chunks, or of the given documents' chunks, in label order."""
+        with self._lock:
+            if pdf_names is None:
+                rows = self._conn.execute("SELECT label FROM chunks ORDER BY label").fetchall()
+            else:
+                rows = []
+                for batch in _batched(list(pdf_names), _SQL_BATCH):
+                    placeholders = ",".join("?" * len(batch))
+                    rows += self._conn.execute(
+                        f"SELECT label FROM chunks WHERE pdf_name IN ({placeholders})", batch
+                    ).fetchall()
+                rows.sort()
+        return [row[0] for row in rows]
+
+    def get(self, labels: Iterable[int]) -> Dict[int, Document]:
+        labels = [int(label) for label in labels]
+        found = {}
+        with self._lock:
+            for batch in _batched(labels, _SQL_BATCH):
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT label, content, metadata FROM chunks WHERE label IN ({placeholders})", batch
+                ).fetchall()
+                for label, content, metadata in rows:
+                    found[label] = Document(page_content=content, metadata=json.loads(metadata))
+        return found
+
+    def add(self, rows: List[Tuple[int, str, str, dict]]) -> None:
+        """Insert (label, pdf_name, content, metadata) rows."""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO chunks (label, pdf_name, content, metadata) VALUES (?, ?, ?, ?)",
+                [(label, pdf_name, content, json.dumps(metadata)) for label, pdf_name, content, metadata in rows],
+            )
+
+    def commit(self) -> None:
+        with self._lock:
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
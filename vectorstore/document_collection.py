@@ -0,0 +1,433 @@
+# vectorstore/document_collection.py
+
+import json
+import os
+import threading
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain.docstore.document import Document
+
+from vectorstore import index_types
+from vectorstore.chunk_store import ChunkStore
+from vectorstore.embedding_cache import _batched, _SQL_BATCH
+from vectorstore.embedding_backends import OPENAI_NAMESPACE, EmbeddingMismatchError
+
+INDEX_FILE = "index.faiss"
+CHUNKS_FILE = "chunks.sqlite3"
+# Delta segments and deleted labels written since the base index was last compacted
+MANIFEST_FILE = "segments.json"
+
+# Read-only loads memory-map index.faiss instead of copying it into RAM, so every
+# worker process shares the page-cached vectors
+FAISS_MMAP = os.getenv("FAISS_MMAP", "true").lower() in ("1", "true", "yes")
+
+# A collection is compacted (segments merged, deleted chunks dropped, index type refitted) once it has
+# more than COLLECTION_MAX_DELTAS delta segments, or once the vectors added and deleted since the last
+# compaction exceed COLLECTION_COMPACT_RATIO of its base (and COLLECTION_COMPACT_MIN_VECTORS)
+COLLECTION_MAX_DELTAS = int(os.getenv("COLLECTION_MAX_DELTAS", "8"))
+COLLECTION_COMPACT_RATIO = float(os.getenv("COLLECTION_COMPACT_RATIO", "0.25"))
+COLLECTION_COMPACT_MIN_VECTORS = int(os.getenv("COLLECTION_COMPACT_MIN_VECTORS", "5000"))
+
+
+def export_embeddings(vectorstore):
+    """
+    Return (text_embeddings, metadatas) for the chunks of a LangChain FAISS store, in index order,
+    using the vectors already stored in the index (nothing is re-embedded).
+    Only used to migrate pickled indexes into collections.
+    """
+    text_embeddings, metadatas = [], []
+    for position, doc_id in sorted(vectorstore.index_to_docstore_id.items()):
+        doc = vectorstore.docstore.search(doc_id)
+        text_embeddings.append((doc.page_content, vectorstore.index.reconstruct(int(position)).tolist()))
+        metadatas.append(dict(doc.metadata))
+    return text_embeddings, metadatas
+
+
+class _Segment:
+    """
+    One index file and the chunk store of its vectors: the base of a collection (labels 0..n-1,
+    by position) or a delta segment (an IDMap over labels start..start+n-1 added later).
+    The index is only read when first needed, so writers that just add a delta never load it.
+    """
+
+    def __init__(self, path: str, name: Optional[str], store: ChunkStore, index: Optional[faiss.Index] = None):
+        self.path = path
+        self.name = name
+        self.store = store
+        self._index = index
+        self._lock = threading.Lock()
+
+    @property
+    def index_file(self) -> str:
+        return os.path.join(self.path, f"{self.name}.faiss" if self.name else INDEX_FILE)
+
+    @property
+    def index(self) -> faiss.Index:
+        with self._lock:
+            if self._index is None:
+                flags = faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY if FAISS_MMAP else 0
+                self._index = faiss.read_index(self.index_file, flags)
+            return self._index
+
+    def close(self) -> None:
+        self.store.close()
+
+
+class DocumentCollection:
+    """
+    All chunks of one owner's documents, searched as a single FAISS index.
+
+    - On disk: a base segment, index.faiss (vectors, labelled 0..n) and chunks.sqlite3 (text, metadata and
+      pdf_name per label, see ChunkStore), plus the delta segments and deleted labels listed in segments.json;
+      there is no pickle
+    - Writes never rewrite existing files: added chunks go to a new delta segment (delta.<id>.faiss / .sqlite3)
+      and removed ones become tombstones, so an update costs what changed, not the size of the collection.
+      compact() later merges everything into a new base, dropping the tombstoned vectors
+    - Searches can be limited to a subset of documents; the filter is applied inside
+      FAISS with an ID selector, and small subsets are searched exactly
+    - The base index type (flat, HNSW, IVF-PQ) follows the collection size, see vectorstore.index_types;
+      it is refitted when the collection is compacted
+    - Segment files are immutable once saved (they are memory-mapped and shared by every
+      generation of the collection), only segments.json is replaced by each write
+    - The embedding backend and dimension that built the vectors are recorded with the collection,
+      so a collection is never searched or extended with vectors of another model
+    """
+
+    def __init__(self, path: str, base: _Segment, manifest: dict, deltas: Optional[List[_Segment]] = None):
+        self.path = path
+        self.base = base
+        self.deltas = deltas or []
+        self.manifest = manifest
+        self.tombstones = set(manifest.get("tombstones", []))
+        # Delta segment receiving this write's additions, created on the first add
+        self._delta: Optional[_Segment] = None
+        self._base_dirty = False
+
+    @classmethod
+    def create(cls, path: str, dimension: int, embedding_backend: str) -> "DocumentCollection":
+        """Start an empty collection, for vectors of embedding_backend, in the directory path."""
+        os.makedirs(path, exist_ok=True)
+        store = ChunkStore(os.path.join(path, CHUNKS_FILE))
+        store.set_meta(embedding_backend=embedding_backend, dimension=dimension)
+        manifest = {
+            "index_type": "flat", "dimension": dimension, "embedding_backend": embedding_backend,
+            "base_vectors": 0, "next_label": 0, "deltas": [], "tombstones": [],
+        }
+        collection = cls(path, _Segment(path, None, store, faiss.IndexFlatL2(dimension)), manifest)
+        collection._base_dirty = True
+        return collection
+
+    @classmethod
+    def open(cls, path: str, writable: bool = False) -> "DocumentCollection":
+        """
+        Open a saved collection. Read-only collections load (memory-map, FAISS_MMAP) their indexes up front;
+        writable ones load nothing but the manifest, and their next save adds a delta segment to path.
+        """
+        base = _Segment(path, None, ChunkStore(os.path.join(path, CHUNKS_FILE), read_only=True))
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        else:
+            # Collections from before segments existed are a base segment only
+            meta = base.store.get_meta()
+            manifest = {
+                "index_type": index_types.index_type(base.index), "dimension": base.index.d,
+                "base_vectors": base.index.ntotal, "next_label": base.store.next_label(),
+                "deltas": [], "tombstones": [],
+            }
+            if "embedding_backend" in meta:
+                manifest["embedding_backend"] = meta["embedding_backend"]
+        deltas = [
+            _Segment(path, delta["name"], ChunkStore(os.path.join(path, f"{delta['name']}.sqlite3"), read_only=True))
+            for delta in manifest["deltas"]
+        ]
+        collection = cls(path, base, manifest, deltas)
+        if not writable:
+            for segment in collection.segments:
+                segment.index
+        return collection
+
+    @staticmethod
+    def index_bytes(path: str) -> int:
+        """Size of all the index files of the collection in path."""
+        if not os.path.isdir(path):
+            return 0
+        return sum(
+            os.path.getsize(os.path.join(path, name)) for name in os.listdir(path) if name.endswith(".faiss")
+        )
+
+    @property
+    def segments(self) -> List[_Segment]:
+        return [self.base] + self.deltas + ([self._delta] if self._delta is not None else [])
+
+    @property
+    def ntotal(self) -> int:
+        """Number of live (not deleted) vectors."""
+        added = sum(delta["vectors"] for delta in self.manifest["deltas"])
+        pending = self._delta.index.ntotal if self._delta is not None else 0
+        return self.manifest["base_vectors"] + added + pending - len(self.tombstones)
+
+    @property
+    def dimension(self) -> int:
+        return int(self.manifest["dimension"])
+
+    @property
+    def index_type(self) -> str:
+        """Type of the base index; delta segments are always flat."""
+        return self.manifest["index_type"]
+
+    @property
+    def embedding_backend(self) -> str:
+        # Collections from before the backend was recorded were all embedded with the OpenAI model
+        return self.manifest.get("embedding_backend") or self.base.store.get_meta().get("embedding_backend", OPENAI_NAMESPACE)
+
+    def set_embeddings(self, embedding_backend: str, dimension: int) -> None:
+        """Record the backend and dimension that built the vectors (collections written before they were recorded)."""
+        self.manifest.update(embedding_backend=embedding_backend, dimension=dimension)
+
+    def check_embeddings(self, embedding_backend: str, dimension: Optional[int] = None) -> None:
+        """Raise EmbeddingMismatchError unless the vectors come from embedding_backend (and have the given dimension)."""
+        built_by = self.embedding_backend
+        stored = self.dimension
+        recorded = int(self.base.store.get_meta().get("dimension", stored))
+        if built_by != embedding_backend:
+            raise EmbeddingMismatchError(
+                f"Collection was built with {built_by} ({stored} dimensions), but the configured embedding "
+                f"backend is {embedding_backend}. Re-index its documents or set EMBEDDING_BACKEND back."
+            )
+        if recorded != stored or (dimension is not None and dimension != stored):
+            raise EmbeddingMismatchError(
+                f"Collection holds {stored}-dimensional vectors (recorded: {recorded}), "
+                f"{embedding_backend} produced {dimension or recorded}."
+            )
+
+    def labels(self, pdf_names: Optional[List[str]] = None) -> List[int]:
+        """Return the labels of all live chunks, or of the given documents' chunks, in label order."""
+        labels = [label for segment in self.segments for label in segment.store.labels(pdf_names)]
+        return sorted(label for label in labels if label not in self.tombstones)
+
+    def chunks(self, labels: Iterable[int]) -> Dict[int, Document]:
+        """Return {label: chunk} for the given live labels."""
+        labels = [int(label) for label in labels if label not in self.tombstones]
+        found: Dict[int, Document] = {}
+        for segment in self.segments:
+            if len(found) == len(labels):
+                break
+            found.update(segment.store.get([label for label in labels if label not in found]))
+        return found
+
+    def chunk_counts(self) -> Dict[str, int]:
+        """Return {pdf_name: number of live chunks}."""
+        counts: Dict[str, int] = {}
+        for segment in self.segments:
+            for pdf_name, count in segment.store.chunk_counts().items():
+                counts[pdf_name] = counts.get(pdf_name, 0) + count
+            if self.tombstones:
+                for pdf_name, count in segment.store.chunk_counts(self.tombstones).items():
+                    counts[pdf_name] -= count
+        return {pdf_name: count for pdf_name, count in counts.items() if count > 0}
+
+    def pdf_names(self) -> List[str]:
+        return sorted(self.chunk_counts())
+
+    def vectors(self, labels: List[int]) -> np.ndarray:
+        """Return the stored vectors of the given labels, in order."""
+        vectors = np.zeros((len(labels), self.dimension), dtype=np.float32)
+        bounds = [delta["start"] for delta in self.manifest["deltas"]]
+        if self._delta is not None:
+            bounds.append(self._delta_start)
+        # Labels below the first delta's start are in the base, then each delta covers the labels up to the next
+        segment_of = np.searchsorted(np.array(bounds, dtype=np.int64), np.array(labels, dtype=np.int64), side="right")
+        for position, segment in enumerate(self.segments):
+            rows = np.flatnonzero(segment_of == position)
+            if len(rows):
+                vectors[rows] = segment.index.reconstruct_batch(np.array(labels, dtype=np.int64)[rows])
+        return vectors
+
+    def add(self, pdf_name: str, text_embeddings: List[Tuple[str, List[float]]], metadatas: List[dict]) -> None:
+        """Add a document's chunks to this write's delta segment (after the existing labels)."""
+        vectors = np.array([vector for _, vector in text_embeddings], dtype=np.float32)
+        if self._delta is None:
+            name = f"delta.{uuid.uuid4().hex}"
+            store = ChunkStore(os.path.join(self.path, f"{name}.sqlite3"))
+            self._delta = _Segment(self.path, name, store, faiss.IndexIDMap2(faiss.IndexFlatL2(self.dimension)))
+            self._delta_start = self.manifest["next_label"]
+
+        start = self.manifest["next_label"]
+        labels = list(range(start, start + len(text_embeddings)))
+        self._delta.index.add_with_ids(vectors, np.array(labels, dtype=np.int64))
+        self._delta.store.add([
+            (label, pdf_name, text, dict(metadata, pdf_name=pdf_name))
+            for label, (text, _), metadata in zip(labels, text_embeddings, metadatas)
+        ])
+        self.manifest["next_label"] = start + len(labels)
+
+    def remove(self, pdf_name: str) -> int:
+        """
+        Remove every chunk of a document, returning how many were removed.
+        Their labels become tombstones: filtered out of searches until compact() drops the vectors.
+        """
+        labels = self.labels([pdf_name])
+        self.tombstones.update(labels)
+        return len(labels)
+
+    def needs_compaction(self, configured: str = index_types.FAISS_INDEX_TYPE) -> bool:
+        """Whether the delta segments and tombstones have grown enough (or the size calls for another index type)."""
+        deltas = len(self.manifest["deltas"])
+        changed = sum(delta["vectors"] for delta in self.manifest["deltas"]) + len(self.tombstones)
+        base = self.manifest["base_vectors"]
+        target = index_types.choose_index_type(self.ntotal, current=self.index_type, configured=configured)
+        return (
+            deltas > COLLECTION_MAX_DELTAS
+            or changed > max(COLLECTION_COMPACT_MIN_VECTORS, COLLECTION_COMPACT_RATIO * base)
+            or (target != self.index_type and changed > 0)
+        )
+
+    def compact(
+        self,
+        path: str,
+        configured: str = index_types.FAISS_INDEX_TYPE,
+        original_vectors: Optional[Callable[[List[str]], List[Optional[List[float]]]]] = None,
+    ) -> "DocumentCollection":
+        """
+        Write the live chunks into a new collection in path with a single base segment (labels renumbered
+        0..n-1, index type refitted to the size) and return it, unsaved. Reads every vector: run it
+        in the background, never on the request path.
+
+        original_vectors(texts) returns the embeddings the chunks were indexed with (None where unknown).
+        An IVF-PQ base only keeps compressed codes: rebuilding from their reconstruction would add a new
+        quantization error on top of the old one at every compaction, so the originals are used instead.
+        Chunks without one still fall back to the reconstructed vector.
+        """
+        labels = self.labels()
+        kind = index_types.choose_index_type(len(labels), current=self.index_type, configured=configured)
+        compacted = DocumentCollection.create(path, self.dimension, self.embedding_backend)
+        vectors = np.zeros((len(labels), self.dimension), dtype=np.float32)
+        # Flat and HNSW indexes (and the flat deltas) give back the exact vectors
+        lossy = self.index_type == "ivfpq" and original_vectors is not None
+        reconstructed = 0
+        position = 0
+        for batch in _batched(labels, _SQL_BATCH):
+            vectors[position:position + len(batch)] = self.vectors(batch)
+            chunks = self.chunks(batch)
+            if lossy:
+                originals = original_vectors([chunks[label].page_content for label in batch])
+                for i, vector in enumerate(originals):
+                    if vector is not None and len(vector) == self.dimension:
+                        vectors[position + i] = vector
+                    else:
+                        reconstructed += 1
+            compacted.base.store.add([
+                (position + i, chunks[label].metadata["pdf_name"], chunks[label].page_content, chunks[label].metadata)
+                for i, label in enumerate(batch)
+            ])
+            position += len(batch)
+        if kind != self.index_type:
+            print(f"Rebuilding FAISS collection with {len(labels)} vectors: {self.index_type} -> {kind}")
+        if reconstructed:
+            print(f"{reconstructed} of {len(labels)} vectors rebuilt from their PQ codes (not in the embedding cache).")
+        compacted.base = _Segment(path, None, compacted.base.store, index_types.build_index(kind, vectors))
+        compacted.manifest.update(index_type=kind, base_vectors=len(labels), next_label=len(labels))
+        return compacted
+
+    def search(
+        self,
+        query_embedding: List[float],
+        k: int,
+        pdf_names: Optional[List[str]] = None,
+        ef_search: Optional[int] = None,
+        nprobe: Optional[int] = None,
+    ) -> List[Tuple[Document, float]]:
+        """
+        Return the k closest chunks (with L2 distance), optionally only from the given documents.
+        ef_search / nprobe override the configured HNSW / IVF search breadth.
+        """
+        return self.search_batch([query_embedding], k, pdf_names, ef_search, nprobe)[0]
+
+    def search_batch(
+        self,
+        query_embeddings: List[List[float]],
+        k: int,
+        pdf_names: Optional[List[str]] = None,
+        ef_search: Optional[int] = None,
+        nprobe: Optional[int] = None,
+    ) -> List[List[Tuple[Document, float]]]:
+        """
+        search for several queries at once: one FAISS call per segment with the whole query matrix and
+        one chunk-store read for all the hits. Returns the hits of each query, in query order.
+        """
+        if self.ntotal == 0 or not query_embeddings:
+            return [[] for _ in query_embeddings]
+
+        queries = np.array(query_embeddings, dtype=np.float32)
+        # The inner selector must outlive the search: IDSelectorNot only keeps a pointer to it
+        excluded = selector = None
+        if pdf_names is not None:
+            positions = self.labels(pdf_names)
+            if not positions:
+                return [[] for _ in query_embeddings]
+            if self.index_type != "flat" and len(positions) <= index_types.EXACT_FILTER_MAX_VECTORS:
+                return self._exact_search(queries, k, positions)
+            selector = faiss.IDSelectorBatch(np.array(positions, dtype=np.int64))
+        elif self.tombstones:
+            excluded = faiss.IDSelectorBatch(np.array(sorted(self.tombstones), dtype=np.int64))
+            selector = faiss.IDSelectorNot(excluded)
+
+        rows: List[list] = [[] for _ in query_embeddings]
+        for segment in self.segments:
+            index = segment.index
+            if index.ntotal == 0:
+                continue
+            params = index_types.search_params(index, selector, k=k, ef_search=ef_search, nprobe=nprobe)
+            scores, indices = index.search(queries, min(k, index.ntotal), params=params)
+            for row, row_scores, row_labels in zip(rows, scores, indices):
+                row.extend(zip(row_scores, row_labels))
+        return self._hits([sorted(row, key=lambda hit: hit[0])[:k] for row in rows])
+
+    def save(self, path: str) -> None:
+        """
+        Write what this collection added (its delta segment, or the base of a new or compacted collection)
+        and the manifest to path, which must be the collection's directory.
+        """
+        if self._base_dirty:
+            faiss.write_index(self.base.index, os.path.join(path, INDEX_FILE))
+            self.base.store.commit()
+            self._base_dirty = False
+        if self._delta is not None:
+            faiss.write_index(self._delta.index, os.path.join(path, f"{self._delta.name}.faiss"))
+            self._delta.store.commit()
+            self.manifest["deltas"].append({
+                "name": self._delta.name, "start": self._delta_start, "vectors": self._delta.index.ntotal,
+            })
+            self.deltas.append(self._delta)
+            self._delta = None
+        self.manifest["tombstones"] = sorted(self.tombstones)
+        # A new file replaces the manifest: the previous generation may still share (hardlink) the old one
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        with open(f"{manifest_path}.tmp", "w") as f:
+            json.dump(self.manifest, f)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+
+    def close(self) -> None:
+        for segment in self.segments:
+            segment.close()
+
+    def _exact_search(self, queries: np.ndarray, k: int, positions: List[int]) -> List[List[Tuple[Document, float]]]:
+        labels = np.array(positions, dtype=np.int64)
+        vectors = self.vectors(positions)
+        # Squared L2 for every (query, vector) pair without materializing the differences
+        distances = (
+            (queries ** 2).sum(axis=1)[:, None] - 2 * queries @ vectors.T + (vectors ** 2).sum(axis=1)[None, :]
+        )
+        top = np.argsort(distances, axis=1)[:, :k]
+        return self._hits([zip(row[order], labels[order]) for row, order in zip(distances, top)])
+
+    def _hits(self, rows) -> List[List[Tuple[Document, float]]]:
+        """Turn (score, label) pairs per query into (Document, score) hits, reading every chunk once."""
+        rows = [[(float(score), int(label)) for score, label in row if label != -1] for row in rows]
+        docs = self.chunks({label for row in rows for _, label in row})
+        return [[(docs[label], score) for score, label in row if label in docs] for row in rows]
@@ -0,0 +1,116 @@
+# vectorstore/embedding_backends.py
+
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+
+load_dotenv()
+
+# "openai" (API, default) or "local" (sentence-transformers on the CPU, no network once the model is on disk)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai").lower()
+
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_EMBEDDING_MODEL = "text-embedding-ada-002"
+# Collections written before the backend was recorded were all built with the OpenAI model
+OPENAI_NAMESPACE = f"OpenAIEmbeddings:{OPENAI_EMBEDDING_MODEL}"
+
+# A local directory (e.g. a downloaded sentence-transformers model) or a Hugging Face model id
+LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+# "torch" or "onnx" (needs onnxruntime / optimum, see sentence-transformers' backend docs)
+LOCAL_EMBEDDING_RUNTIME = os.getenv("LOCAL_EMBEDDING_RUNTIME", "torch").lower()
+# "int8" quantizes the torch model's linear layers after loading (dynamic quantization)
+LOCAL_EMBEDDING_QUANTIZE = os.getenv("LOCAL_EMBEDDING_QUANTIZE", "").lower()
+# ONNX file inside the model directory, e.g. onnx/model_qint8_avx512_vnni.onnx for a quantized export
+LOCAL_EMBEDDING_ONNX_FILE = os.getenv("LOCAL_EMBEDDING_ONNX_FILE", "")
+LOCAL_EMBEDDING_BATCH_SIZE = int(os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", "64"))
+# Threads used by one forward pass (torch's intra-op pool); defaults to every core
+LOCAL_EMBEDDING_THREADS = int(os.getenv("LOCAL_EMBEDDING_THREADS", "0")) or os.cpu_count() or 1
+
+
+class EmbeddingMismatchError(Exception):
+    """Raised when a collection was built by another embedding backend (or dimension) than the one configured."""
+
+
+class LocalEmbeddings(Embeddings):
+    """
+    sentence-transformers model running on the CPU of this process.
+
+    - Vectors are L2-normalized, so the L2 distances of the FAISS indexes rank like cosine similarity
+    - Each forward pass uses the torch thread pool (threads, default: every core); passes are
+      serialized, so concurrent requests do not oversubscribe the cores
+    - Large inputs are encoded batch_size texts at a time and the lock is released between batches,
+      so a query waits for at most one batch of an ingestion in progress
+    """
+
+    def __init__(
+        self,
+        model: str = LOCAL_EMBEDDING_MODEL,
+        runtime: str = LOCAL_EMBEDDING_RUNTIME,
+        quantize: str = LOCAL_EMBEDDING_QUANTIZE,
+        onnx_file: str = LOCAL_EMBEDDING_ONNX_FILE,
+        batch_size: int = LOCAL_EMBEDDING_BATCH_SIZE,
+        threads: int = LOCAL_EMBEDDING_THREADS,
+    ):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if runtime not in ("torch", "onnx"):
+            raise ValueError(f"Unsupported LOCAL_EMBEDDING_RUNTIME: {runtime}. Use torch or onnx.")
+        torch.set_num_threads(threads)
+        model_kwargs = {"file_name": onnx_file} if runtime == "onnx" and onnx_file else None
+        self.model = SentenceTransformer(model, device="cpu", backend=runtime, model_kwargs=model_kwargs)
+        if quantize == "int8" and runtime == "torch":
+            self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model.eval()
+        self.dimension = self.model.get_sentence_embedding_dimension()
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for i in range(0, len(texts), self.batch_size):
+            with self._lock:
+                batch = self.model.encode(
+                    texts[i:i + self.batch_size], batch_size=self.batch_size,
+                    normalize_embeddings=True, convert_to_numpy=True, show_progress_bar=False,
+                )
+            vectors.extend(batch.tolist())
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def _openai_embeddings() -> Embeddings:
+    from langchain_community.embeddings import OpenAIEmbeddings
+
+    return OpenAIEmbeddings(model=OPENAI_EMBEDDING_MODEL, openai_api_key=OPENAI_API_KEY)
+
+
+def _local_namespace() -> str:
+    """Identifies the vectors of the local model: its name plus anything that changes them (runtime, quantization)."""
+    namespace = f"SentenceTransformer:{LOCAL_EMBEDDING_MODEL}"
+    if LOCAL_EMBEDDING_RUNTIME == "onnx":
+        namespace += f":onnx:{LOCAL_EMBEDDING_ONNX_FILE or 'model.onnx'}"
+    elif LOCAL_EMBEDDING_QUANTIZE == "int8":
+        namespace += ":int8"
+    return namespace
+
+
+# name -> (factory, namespace). The namespace keys the embedding cache and is recorded in every collection
+EMBEDDING_BACKENDS: Dict[str, Tuple[Callable[[], Embeddings], Callable[[], str]]] = {
+    "openai": (_openai_embeddings, lambda: OPENAI_NAMESPACE),
+    "local": (LocalEmbeddings, _local_namespace),
+}
+
+
+def embedding_backend(name: Optional[str] = None) -> Tuple[Callable[[], Embeddings], str]:
+    """Return (factory, namespace) of the configured (or the named) embedding backend."""
+    name = (name or EMBEDDING_BACKEND).lower()
+    if name not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unsupported EMBEDDING_BACKEND: {name}. Use one of {', '.join(EMBEDDING_BACKENDS)}.")
+    factory, namespace = EMBEDDING_BACKENDS[name]
+    return factory, namespace()
@@ -0,0 +1,203 @@
+# vectorstore/embedding_cache.py
+
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH", os.path.join("vectorstore", "embedding_cache.sqlite3")
+)
+QUERY_EMBEDDING_LRU_SIZE = int(os.getenv("QUERY_EMBEDDING_LRU_SIZE", "4096"))
+
+# SQLite limits the number of bound parameters per statement
+_SQL_BATCH = 500
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _batched(items: List, size: int) -> Iterable[List]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding store in SQLite, keyed by (model, sha256 of the text).
+    Vectors are stored as raw float32 bytes.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        # Opened on first use so importing the vectorstore does not touch the disk
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, hash))"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            for batch in _batched(hashes, _SQL_BATCH):
+                placeholders = ",".join("?" * len(batch))
+                rows = self._connection().execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                    [model, *batch],
+                ).fetchall()
+                for hash_, blob in rows:
+                    found[hash_] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, model: str, items: List[Tuple[str, List[float]]]) -> None:
+        rows = [(model, hash_, np.asarray(vector, dtype=np.float32).tobytes()) for hash_, vector in items]
+        with self._lock:
+            conn = self._connection()
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)", rows
+            )
+            conn.commit()
+
+
+class LazyEmbeddings(Embeddings):
+    """Builds the wrapped model with factory(), and so imports its SDK, on first use instead of at import time."""
+
+    def __init__(self, factory: Callable[[], Embeddings]):
+        self.factory = factory
+        self._embeddings: Optional[Embeddings] = None
+        self._lock = threading.Lock()
+
+    def load(self) -> Embeddings:
+        if self._embeddings is None:
+            with self._lock:
+                if self._embeddings is None:
+                    self._embeddings = self.factory()
+        return self._embeddings
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.load().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.load().embed_query(text)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embedding model so each distinct text is only ever embedded once.
+
+    - embed_documents looks every chunk up in the persistent cache and only sends
+      unseen texts (deduplicated) to the underlying model
+    - embed_query goes through an in-memory LRU in front of the same cache
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        cache: EmbeddingCache = None,
+        lru_size: int = QUERY_EMBEDDING_LRU_SIZE,
+        namespace: Optional[str] = None,
+    ):
+        self.embeddings = embeddings
+        self.cache = cache or EmbeddingCache()
+        # Cached vectors are keyed by model; pass namespace when embeddings is a wrapper (e.g. LazyEmbeddings)
+        self.namespace = namespace or f"{type(embeddings).__name__}:{getattr(embeddings, 'model', '')}"
+        self.lru_size = lru_size
+        self._queries: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [text_hash(t) for t in texts]
+        vectors = self.cache.get_many(self.namespace, list(set(hashes)))
+
+        missing = {}
+        for hash_, text in zip(hashes, texts):
+            if hash_ not in vectors:
+                missing.setdefault(hash_, text)
+
+        if missing:
+            new_vectors = self.embeddings.embed_documents(list(missing.values()))
+            self.cache.put_many(self.namespace, list(zip(missing.keys(), new_vectors)))
+            vectors.update(zip(missing.keys(), new_vectors))
+
+        print(f"Embedding cache: {len(texts) - len(missing)} of {len(texts)} chunks reused, {len(missing)} embedded.")
+        return [vectors[hash_] for hash_ in hashes]
+
+    def cached_documents(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Cached vectors of the texts (None for those never embedded), without calling the model."""
+        hashes = [text_hash(t) for t in texts]
+        vectors = self.cache.get_many(self.namespace, list(set(hashes)))
+        return [vectors.get(hash_) for hash_ in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        hash_ = text_hash(text)
+        with self._lock:
+            vector = self._queries.get(hash_)
+            if vector is not None:
+                self._queries.move_to_end(hash_)
+                return vector
+
+        vector = self.cache.get_many(self.namespace, [hash_]).get(hash_)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.put_many(self.namespace, [(hash_, vector)])
+
+        self._remember_queries([(hash_, vector)])
+        return vector
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed several queries at once: the LRU and the persistent cache first,
+        then a single embeddings request for all the misses.
+        """
+        hashes = [text_hash(t) for t in texts]
+        vectors: Dict[str, List[float]] = {}
+        with self._lock:
+            for hash_ in hashes:
+                vector = self._queries.get(hash_)
+                if vector is not None:
+                    self._queries.move_to_end(hash_)
+                    vectors[hash_] = vector
+
+        unknown = list({hash_ for hash_ in hashes if hash_ not in vectors})
+        if unknown:
+            vectors.update(self.cache.get_many(self.namespace, unknown))
+        missing = {}
+        for hash_, text in zip(hashes, texts):
+            if hash_ not in vectors:
+                missing.setdefault(hash_, text)
+        if missing:
+            # embed_query is one embed_documents call per text for the API models; batch them instead
+            new_vectors = self.embeddings.embed_documents(list(missing.values()))
+            self.cache.put_many(self.namespace, list(zip(missing.keys(), new_vectors)))
+            vectors.update(zip(missing.keys(), new_vectors))
+
+        self._remember_queries([(hash_, vectors[hash_]) for hash_ in dict.fromkeys(hashes)])
+        return [vectors[hash_] for hash_ in hashes]
+
+    def _remember_queries(self, items: List[Tuple[str, List[float]]]) -> None:
+        with self._lock:
+            for hash_, vector in items:
+                self._queries[hash_] = vector
+                self._queries.move_to_end(hash_)
+            while len(self._queries) > self.lru_size:
+                self._queries.popitem(last=False)
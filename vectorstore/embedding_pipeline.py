@@ -0,0 +1,230 @@
+# vectorstore/embedding_pipeline.py
+
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from vectorstore.embedding_cache import CachedEmbeddings, text_hash
+
+# Chunks per embeddings request, and a cap on the tokens sent in one request
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+EMBED_MAX_BATCH_TOKENS = int(os.getenv("EMBED_MAX_BATCH_TOKENS", "100000"))
+# Upper bound on embeddings requests in flight; lowered automatically on 429s
+EMBED_MAX_CONCURRENCY = int(os.getenv("EMBED_MAX_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "6"))
+EMBED_BACKOFF_SECONDS = float(os.getenv("EMBED_BACKOFF_SECONDS", "1.0"))
+EMBED_MAX_BACKOFF_SECONDS = float(os.getenv("EMBED_MAX_BACKOFF_SECONDS", "60"))
+EMBED_TOKEN_ENCODING = os.getenv("EMBED_TOKEN_ENCODING", "cl100k_base")
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Token count with tiktoken, or a 4-chars-per-token estimate if it is unavailable."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding(EMBED_TOKEN_ENCODING)
+        except Exception:
+            _encoding = False
+    if _encoding is False:
+        return len(text) // 4 + 1
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_rate_limited(error: Exception) -> bool:
+    return _status_code(error) == 429 or "rate limit" in str(error).lower()
+
+
+def is_retryable(error: Exception) -> bool:
+    status = _status_code(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    # Connection resets / timeouts surface without a status code
+    return is_rate_limited(error) or type(error).__name__ in ("APIConnectionError", "APITimeoutError", "Timeout")
+
+
+class AdaptiveConcurrency:
+    """
+    Concurrency limit that backs off on rate limits (AIMD):
+    halved on every 429, raised by one after a full window of successes.
+    """
+
+    def __init__(self, max_limit: int):
+        self.max_limit = max(1, max_limit)
+        self.limit = self.max_limit
+        self.active = 0
+        self._successes = 0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self.active >= self.limit:
+                self._cond.wait()
+            self.active += 1
+
+    def release(self, rate_limited: bool = False) -> None:
+        with self._cond:
+            self.active -= 1
+            if rate_limited:
+                self.limit = max(1, self.limit // 2)
+                self._successes = 0
+            else:
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.max_limit:
+                    self.limit += 1
+                    self._successes = 0
+            self._cond.notify_all()
+
+
+class EmbeddingPipeline:
+    """
+    Embeds chunks in token-aware batches with a bounded, adaptive number of requests in flight.
+
+    - Chunks already in the embedding cache are returned first without any request
+    - Unseen texts (deduplicated) are grouped into batches of at most batch_size chunks
+      and max_batch_tokens tokens (counted with tiktoken)
+    - 429 and 5xx responses are retried with exponential backoff (honouring Retry-After),
+      and 429s also lower the concurrency limit
+    - embed() yields (chunk positions, vectors) as each batch finishes, so callers can
+      add vectors to an index while later batches are still in flight
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        batch_size: int = EMBED_BATCH_SIZE,
+        max_batch_tokens: int = EMBED_MAX_BATCH_TOKENS,
+        max_concurrency: int = EMBED_MAX_CONCURRENCY,
+        max_retries: int = EMBED_MAX_RETRIES,
+    ):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+
+    def make_batches(self, texts: List[str]) -> List[List[str]]:
+        batches, batch, batch_tokens = [], [], 0
+        for text in texts:
+            tokens = count_tokens(text)
+            if batch and (len(batch) >= self.batch_size or batch_tokens + tokens > self.max_batch_tokens):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def embed(
+        self, texts: List[str], stats: Optional[Dict[str, float]] = None
+    ) -> Iterator[Tuple[List[int], List[List[float]]]]:
+        """Yield (chunk positions, vectors) batches; stats, if given, is filled with throughput numbers."""
+        started = time.perf_counter()
+        cached = isinstance(self.embeddings, CachedEmbeddings)
+        base = self.embeddings.embeddings if cached else self.embeddings
+
+        # Chunk positions for every distinct text
+        positions: Dict[str, List[int]] = {}
+        hashes = [text_hash(t) for t in texts]
+        for i, hash_ in enumerate(hashes):
+            positions.setdefault(hash_, []).append(i)
+
+        reused = 0
+        if cached:
+            found = self.embeddings.cache.get_many(self.embeddings.namespace, list(positions))
+            if found:
+                ready = [(i, found[h]) for h in found for i in positions.pop(h)]
+                reused = len(ready)
+                yield [i for i, _ in ready], [v for _, v in ready]
+
+        missing_texts = [texts[chunk_positions[0]] for chunk_positions in positions.values()]
+        batches = self.make_batches(missing_texts)
+        limiter = AdaptiveConcurrency(self.max_concurrency)
+        retries = 0
+
+        def run(batch: List[str]) -> Tuple[List[str], List[List[float]], int]:
+            attempt = 0
+            while True:
+                limiter.acquire()
+                try:
+                    vectors = base.embed_documents(batch)
+                except Exception as e:
+                    limiter.release(rate_limited=is_rate_limited(e))
+                    if not is_retryable(e) or attempt >= self.max_retries:
+                        raise
+                    delay = _retry_after(e) or min(EMBED_MAX_BACKOFF_SECONDS, EMBED_BACKOFF_SECONDS * 2 ** attempt)
+                    attempt += 1
+                    print(f"Embedding batch failed ({e}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                    time.sleep(delay * random.uniform(0.8, 1.2))
+                    continue
+                limiter.release()
+                return batch, vectors, attempt
+
+        embedded = 0
+        if batches:
+            with ThreadPoolExecutor(max_workers=max(1, self.max_concurrency), thread_name_prefix="embed") as executor:
+                pending = {executor.submit(run, batch) for batch in batches}
+                try:
+                    while pending:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        # Batches that succeeded are cached and yielded before a failed one is raised
+                        failed = [future for future in done if future.exception() is not None]
+                        for future in done:
+                            if future in failed:
+                                continue
+                            batch, vectors, attempts = future.result()
+                            retries += attempts
+                            batch_hashes = [text_hash(t) for t in batch]
+                            if cached:
+                                self.embeddings.cache.put_many(
+                                    self.embeddings.namespace, list(zip(batch_hashes, vectors))
+                                )
+                            ready = [(i, v) for h, v in zip(batch_hashes, vectors) for i in positions[h]]
+                            embedded += len(ready)
+                            yield [i for i, _ in ready], [v for _, v in ready]
+                        if failed:
+                            failed[0].result()
+                finally:
+                    for future in pending:
+                        future.cancel()
+
+        elapsed = time.perf_counter() - started
+        summary = {
+            "chunks": len(texts),
+            "reused": reused,
+            "embedded": embedded,
+            "requests": len(batches),
+            "retries": retries,
+            "seconds": round(elapsed, 3),
+            "chunks_per_second": round(len(texts) / elapsed, 1) if elapsed else 0.0,
+        }
+        if stats is not None:
+            stats.update(summary)
+        print(
+            f"Embedded {len(texts)} chunks ({reused} from cache, {len(batches)} requests, "
+            f"{retries} retries) in {elapsed:.2f}s: {summary['chunks_per_second']} chunks/s"
+        )
@@ -1,50 +1,579 @@
 # vectorstore/faiss_db.py
 
 import os
-from typing import List, Optional
-from langchain_community.vectorstores import FAISS  # updated import per latest recommendations
-from langchain_community.embeddings import OpenAIEmbeddings
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from typing import Callable, Collection, Dict, List, Optional
+import numpy as np
 from langchain.docstore.document import Document
-from dotenv import load_dotenv
 
-load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+from monitoring.metrics import stage
+from vectorstore.document_collection import CHUNKS_FILE, DocumentCollection, export_embeddings
+from vectorstore.index_cache import index_cache, index_signature
+from vectorstore.embedding_backends import OPENAI_NAMESPACE, LocalEmbeddings, embedding_backend
+from vectorstore.embedding_cache import CachedEmbeddings, LazyEmbeddings
+from vectorstore.embedding_pipeline import EmbeddingPipeline
 
-embedding_model = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
+# Every chunk and query embedding goes through the persistent content-hash cache; the backend
+# (EMBEDDING_BACKEND: the OpenAI API or a local model) is built on the first embedding
+# (or by the startup warm-up), not at import
+_embeddings_factory, EMBEDDING_NAMESPACE = embedding_backend()
+embedding_model = CachedEmbeddings(LazyEmbeddings(_embeddings_factory), namespace=EMBEDDING_NAMESPACE)
+embedding_pipeline = EmbeddingPipeline(embedding_model)
 
 
-def save_to_faiss(docs: List[Document], username: str, pdf_name: str) -> None:
+# One consolidated index per owner (each user, plus "public"), holding all of their documents
+COLLECTIONS_DIR = os.path.join("vectorstore", "collections")
+# Per-PDF indexes from before collections existed; folded into the owner's collection on first use
+LEGACY_INDEX_DIR = os.path.join("vectorstore", "faiss_indexes")
+
+# Finished documents are written to the collection once this many of their chunks are waiting,
+# which bounds the vectors an ingestion holds in memory
+INDEX_FLUSH_CHUNKS = int(os.getenv("INDEX_FLUSH_CHUNKS", "10000"))
+
+# Serializes writers of the same collection; readers keep using the cached copy meanwhile
+_write_locks: Dict[str, threading.Lock] = {}
+_write_locks_guard = threading.Lock()
+# Owners whose collection is being compacted in the background
+_compacting: set = set()
+
+
+def _owner(username: Optional[str]) -> str:
+    return "public" if username in [None, "public"] else username
+
+
+def _write_lock(owner: str) -> threading.Lock:
+    with _write_locks_guard:
+        return _write_locks.setdefault(owner, threading.Lock())
+
+
+def get_collection_path(username: Optional[str]) -> str:
     """
-    Save documents to a FAISS index specific to a user and PDF.
+    Return the collection directory for a user.
 
-    - Public docs (username == "public") saved in vectorstore/faiss_indexes/
-    - User docs saved in vectorstore/faiss_indexes/<username>/
+    - Public docs (username None or "public") live in vectorstore/collections/public/
+    - User docs live in vectorstore/collections/<username>/
     """
-    if username == "public":
-        index_path = os.path.join("vectorstore", "faiss_indexes", pdf_name)
+    return os.path.join(COLLECTIONS_DIR, _owner(username))
+
+
+def get_index_path(username: Optional[str], pdf_name: str) -> str:
+    """Return the legacy per-PDF FAISS index directory for a user and PDF."""
+    if username in [None, "public"]:
+        return os.path.join(LEGACY_INDEX_DIR, pdf_name)
+    return os.path.join(LEGACY_INDEX_DIR, username, pdf_name)
+
+
+def collection_version(username: Optional[str]):
+    """Return a token that changes whenever the user's collection is written."""
+    return index_signature(get_collection_path(username))
+
+
+def embed_query(query: str) -> List[float]:
+    return embedding_model.embed_query(query)
+
+
+def embed_queries(queries: List[str]) -> List[List[float]]:
+    """Embed several queries with one embeddings request for those not cached yet."""
+    return embedding_model.embed_queries(queries)
+
+
+def _collection_exists(owner: str) -> bool:
+    return os.path.exists(os.path.join(get_collection_path(owner), CHUNKS_FILE))
+
+
+def _read_collection(collection_path: str) -> DocumentCollection:
+    collection = DocumentCollection.open(collection_path)
+    try:
+        collection.check_embeddings(embedding_model.namespace)
+    except Exception:
+        collection.close()
+        raise
+    return collection
+
+
+def _read_pickled(index_path: str):
+    # Only for migrating indexes written before collections had their own chunk store
+    from langchain_community.vectorstores import FAISS
+
+    return FAISS.load_local(index_path, embedding_model, allow_dangerous_deserialization=True)
+
+
+def _legacy_indexes(owner: str) -> List[str]:
+    """Return the names of the PDFs that still have a legacy per-PDF index for this owner."""
+    root = LEGACY_INDEX_DIR if owner == "public" else os.path.join(LEGACY_INDEX_DIR, owner)
+    if not os.path.isdir(root):
+        return []
+    return [
+        name for name in sorted(os.listdir(root))
+        if os.path.isfile(os.path.join(root, name, "index.faiss"))
+    ]
+
+
+def _has_pickled(owner: str) -> bool:
+    return os.path.isfile(os.path.join(get_collection_path(owner), "index.pkl")) or bool(_legacy_indexes(owner))
+
+
+def _migrate(owner: str, staging: str) -> Optional[DocumentCollection]:
+    """
+    Build the owner's first collection in staging from pickled indexes: a collection saved
+    in the old format (index.pkl) or else the legacy per-PDF indexes.
+    Their stored vectors are reused, nothing is re-embedded.
+    """
+    pickled_collection = get_collection_path(owner)
+    if os.path.isfile(os.path.join(pickled_collection, "index.pkl")):
+        sources = [(None, pickled_collection)]
     else:
-        index_path = os.path.join("vectorstore", "faiss_indexes", username, pdf_name)
+        sources = [(pdf_name, get_index_path(owner, pdf_name)) for pdf_name in _legacy_indexes(owner)]
+
+    collection = None
+    for pdf_name, index_path in sources:
+        try:
+            legacy = _read_pickled(index_path)
+        except Exception as e:
+            print(f"Skipping pickled FAISS index {index_path} for {owner}: {e}")
+            continue
+        text_embeddings, metadatas = export_embeddings(legacy)
+        if not text_embeddings:
+            continue
+        if collection is None:
+            # Pickled indexes were always built with the OpenAI model
+            collection = DocumentCollection.create(staging, legacy.index.d, OPENAI_NAMESPACE)
 
-    os.makedirs(index_path, exist_ok=True)
-    vectorstore = FAISS.from_documents(docs, embedding_model)
-    vectorstore.save_local(index_path)
-    print(f"FAISS index saved at: {index_path}")
+        # Old-format collections already record pdf_name on every chunk
+        documents: Dict[str, list] = {}
+        for text_embedding, metadata in zip(text_embeddings, metadatas):
+            name = pdf_name or metadata.get("pdf_name", "unknown")
+            documents.setdefault(name, []).append((text_embedding, metadata))
+        for name, items in documents.items():
+            collection.add(name, [te for te, _ in items], [m for _, m in items])
+            print(f"Migrated FAISS index {name} ({len(items)} chunks) into the {owner} collection.")
+    return collection
 
 
-def load_faiss_index(username: Optional[str], pdf_name: str) -> Optional[FAISS]:
+def _link_files(source: str, staging: str) -> None:
+    """Share the files of the current generation with staging as hard links: nothing is copied."""
+    for name in os.listdir(source):
+        file_path = os.path.join(source, name)
+        if not os.path.isfile(file_path) or name.endswith(".tmp"):
+            continue
+        try:
+            os.link(file_path, os.path.join(staging, name))
+        except OSError:
+            shutil.copy2(file_path, os.path.join(staging, name))
+
+
+def _update(
+    owner: str, change: Callable[[Optional[DocumentCollection], str], Optional[DocumentCollection]]
+) -> None:
     """
-    Load the FAISS index specific to a user and PDF.
+    Apply change(collection, staging_dir) to a new generation of the owner's collection and swap it in.
 
-    - Public docs (username None or "public") loaded from vectorstore/faiss_indexes/
-    - User docs loaded from vectorstore/faiss_indexes/<username>/
+    - The new generation shares the current one's files (hard links) and only adds what changed:
+      a delta segment for added chunks and a new segments.json with the tombstones of removed ones,
+      so the cost follows the size of the change, not of the collection
+    - The collection being searched is never modified (it may be memory-mapped and shared with other workers)
+    - collection is None when the owner has none yet; change returns the collection to save, or None to skip
+    - Writers of the same owner are serialized; once enough has changed, the collection is compacted in the background
     """
-    if username in [None, "public"]:
-        index_path = os.path.join("vectorstore", "faiss_indexes", pdf_name)
-    else:
-        index_path = os.path.join("vectorstore", "faiss_indexes", username, pdf_name)
+    with _write_lock(owner):
+        os.makedirs(COLLECTIONS_DIR, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=f".{owner}.", dir=COLLECTIONS_DIR)
+        collection = None
+        try:
+            if _collection_exists(owner):
+                _link_files(get_collection_path(owner), staging)
+                collection = DocumentCollection.open(staging, writable=True)
+            else:
+                collection = _migrate(owner, staging)
 
-    if not os.path.exists(index_path):
-        print(f"FAISS index path '{index_path}' does not exist.")
-        return None
+            collection = change(collection, staging)
+            if collection is None:
+                return
+            collection.save(staging)
+            compact = collection.needs_compaction()
+            collection.close()
+            collection = None
+            _swap(owner, staging)
+        finally:
+            if collection is not None:
+                collection.close()
+            shutil.rmtree(staging, ignore_errors=True)
+    if compact:
+        _schedule_compaction(owner)
 
-    return FAISS.load_local(index_path, embedding_model, allow_dangerous_deserialization=True)
+
+def compact_collection(username: Optional[str], force: bool = False) -> bool:
+    """
+    Merge the owner's delta segments into a new base index, dropping removed chunks and refitting
+    the index type, and swap it in. Only runs when the collection needs it (or with force).
+    Reads every vector, so it runs in the background (see _update); writers of the owner wait for it,
+    searches do not. Returns whether the collection was compacted.
+    """
+    owner = _owner(username)
+    with _write_lock(owner):
+        if not _collection_exists(owner):
+            return False
+        current = DocumentCollection.open(get_collection_path(owner), writable=True)
+        staging = None
+        try:
+            if not force and not current.needs_compaction():
+                return False
+            started = time.perf_counter()
+            staging = tempfile.mkdtemp(prefix=f".{owner}.", dir=COLLECTIONS_DIR)
+            # The embedding cache holds the exact vectors an IVF-PQ base only keeps approximately
+            cached = current.embedding_backend == embedding_model.namespace
+            compacted = current.compact(staging, original_vectors=embedding_model.cached_documents if cached else None)
+            try:
+                compacted.save(staging)
+            finally:
+                compacted.close()
+            _swap(owner, staging)
+            print(
+                f"Compacted the {owner} collection ({compacted.ntotal} vectors, {compacted.index_type}) "
+                f"in {time.perf_counter() - started:.2f}s."
+            )
+            return True
+        finally:
+            current.close()
+            if staging is not None:
+                shutil.rmtree(staging, ignore_errors=True)
+
+
+def _schedule_compaction(owner: str) -> None:
+    with _write_locks_guard:
+        if owner in _compacting:
+            return
+        _compacting.add(owner)
+
+    def run():
+        try:
+            compact_collection(owner)
+        except Exception as e:
+            print(f"Compaction of the {owner} collection failed: {e}")
+        finally:
+            with _write_locks_guard:
+                _compacting.discard(owner)
+
+    threading.Thread(target=run, name=f"compact-{owner}", daemon=True).start()
+
+
+def _swap(owner: str, staging: str) -> None:
+    """
+    Publish staging as the owner's collection in one atomic step.
+
+    - The collection path is a symlink to a generation directory (.<owner>.gen.<id>); a new
+      symlink replaces it with os.replace, so readers see either the old or the new collection
+    - The previous generation is kept until the next write, for readers that resolved the link just before
+    - A collection still stored as a plain directory is moved aside first (once); where symlinks
+      are unavailable the generation directory itself is renamed into place
+    """
+    collection_path = get_collection_path(owner)
+    generation = os.path.join(COLLECTIONS_DIR, f".{owner}.gen.{uuid.uuid4().hex}")
+    os.rename(staging, generation)
+
+    previous = os.readlink(collection_path) if os.path.islink(collection_path) else None
+    retired = None
+    if previous is None and os.path.exists(collection_path):
+        retired = f"{generation}.old"
+        os.rename(collection_path, retired)
+    try:
+        link = f"{generation}.link"
+        os.symlink(os.path.basename(generation), link, target_is_directory=True)
+        os.replace(link, collection_path)
+    except OSError:
+        os.rename(generation, collection_path)
+    if retired is not None:
+        shutil.rmtree(retired, ignore_errors=True)
+    index_cache.invalidate(owner)
+    _retire_generations(owner, keep={os.path.basename(generation), previous})
+
+
+def _retire_generations(owner: str, keep: set) -> None:
+    prefix = f".{owner}.gen."
+    for name in os.listdir(COLLECTIONS_DIR):
+        if name.startswith(prefix) and name not in keep and os.path.isdir(os.path.join(COLLECTIONS_DIR, name)):
+            shutil.rmtree(os.path.join(COLLECTIONS_DIR, name), ignore_errors=True)
+
+
+def _index_fields(owner: str, index_type: str, ntotal: int, chunks: int) -> dict:
+    """Catalog fields of a document: where its chunks are indexed and its share of the index file."""
+    collection_path = get_collection_path(owner)
+    index_size = DocumentCollection.index_bytes(collection_path)
+    return {
+        "chunk_count": chunks,
+        "index_path": collection_path,
+        "index_type": index_type,
+        "index_bytes": round(index_size * chunks / ntotal) if ntotal else 0,
+    }
+
+
+def _write_documents(
+    owner: str, documents: Dict[str, List[Document]], vectors: Dict[str, np.ndarray], append: Collection[str] = ()
+) -> Dict[str, dict]:
+    """
+    Replace the given documents in the owner's collection in one write (those in append are added to
+    the chunks already indexed instead); returns their catalog fields.
+    """
+    written = {}
+    chunk_counts = {}
+
+    def add(collection, staging):
+        dimension = next(iter(vectors.values())).shape[1]
+        if collection is None:
+            collection = DocumentCollection.create(staging, dimension, embedding_model.namespace)
+        else:
+            collection.check_embeddings(embedding_model.namespace, dimension)
+            # Records the backend in collections written before it was recorded
+            collection.set_embeddings(embedding_model.namespace, dimension)
+        for pdf_name, chunks in documents.items():
+            if pdf_name not in append:
+                collection.remove(pdf_name)
+            collection.add(
+                pdf_name,
+                [(doc.page_content, vector) for doc, vector in zip(chunks, vectors[pdf_name])],
+                [doc.metadata for doc in chunks],
+            )
+            chunk_counts[pdf_name] = len(collection.labels([pdf_name]))
+        written.update(index_type=collection.index_type, ntotal=collection.ntotal)
+        return collection
+
+    with stage("index_write"):
+        _update(owner, add)
+    for pdf_name, chunks in documents.items():
+        print(f"Added {len(chunks)} chunks of {pdf_name} to the {owner} collection at: {get_collection_path(owner)}")
+    return {
+        pdf_name: _index_fields(owner, written["index_type"], written["ntotal"], chunk_counts[pdf_name])
+        for pdf_name in documents
+    }
+
+
+def add_documents(
+    username: str,
+    documents: Dict[str, List[Document]],
+    progress: Optional[Callable[..., None]] = None,
+    written: Optional[Callable[[Dict[str, dict]], None]] = None,
+    append: Collection[str] = (),
+) -> Dict[str, dict]:
+    """
+    Add several documents ({pdf_name: chunks}) to the owner's collection, replacing any earlier version of each.
+
+    - Public docs (username == "public") go to vectorstore/collections/public/
+    - User docs go to vectorstore/collections/<username>/
+    - All chunks go through one run of the batched, rate-limit aware embedding pipeline;
+      the other documents of the collection are left untouched (their vectors are not re-embedded)
+    - A document is written as soon as all of its chunks are embedded, together with the other finished
+      documents, once INDEX_FLUSH_CHUNKS chunks are waiting (a single document or a small batch is one write).
+      Vectors are only held in memory until their document is written
+    - If embedding fails part way, the documents already written stay indexed, and the vectors of the
+      others are in the embedding cache, so a retry does not embed them again
+    - progress, if given, is called with chunks_embedded=<n> after each batch and index_written=True at the end;
+      written, if given, is called with {pdf_name: catalog fields} after each write
+    - Documents named in append are added to the chunks already indexed under their name (the next part
+      of a document too long to hold in memory at once) instead of replacing them
+    - Returns the catalog fields of each document (chunk_count, index_path, index_type, index_bytes)
+    """
+    owner = _owner(username)
+    documents = {pdf_name: docs for pdf_name, docs in documents.items() if docs}
+    if not documents:
+        raise ValueError("No chunks to index.")
+
+    pdf_names = list(documents)
+    texts = [doc.page_content for docs in documents.values() for doc in docs]
+    # Position of each chunk -> (document, position within the document)
+    chunk_of = [(pdf_name, i) for pdf_name, docs in documents.items() for i in range(len(docs))]
+    vectors: Dict[str, np.ndarray] = {}
+    remaining = {pdf_name: len(docs) for pdf_name, docs in documents.items()}
+    finished: List[str] = []
+    fields: Dict[str, dict] = {}
+
+    def flush():
+        batch = {pdf_name: documents[pdf_name] for pdf_name in finished}
+        batch_fields = _write_documents(
+            owner, batch, {pdf_name: vectors.pop(pdf_name) for pdf_name in finished}, append
+        )
+        finished.clear()
+        fields.update(batch_fields)
+        if written is not None:
+            written(batch_fields)
+
+    embedded = 0
+    error = None
+    batches = embedding_pipeline.embed(texts)
+    try:
+        while True:
+            # Only the embedding itself is timed as "embed", writes are timed as "index_write"
+            with stage("embed"):
+                try:
+                    batch = next(batches, None)
+                except Exception as e:
+                    error, batch = e, None
+            if batch is None:
+                break
+            positions, batch_vectors = batch
+            for position, vector in zip(positions, batch_vectors):
+                pdf_name, i = chunk_of[position]
+                if pdf_name not in vectors:
+                    vectors[pdf_name] = np.empty((len(documents[pdf_name]), len(vector)), dtype=np.float32)
+                vectors[pdf_name][i] = vector
+                remaining[pdf_name] -= 1
+                if not remaining[pdf_name]:
+                    finished.append(pdf_name)
+            embedded += len(positions)
+            if progress is not None:
+                progress(chunks_embedded=embedded)
+            if sum(len(documents[pdf_name]) for pdf_name in finished) >= INDEX_FLUSH_CHUNKS:
+                flush()
+    finally:
+        batches.close()
+    # Also after an embedding failure, so the documents fully embedded before it are kept
+    if finished:
+        flush()
+    if error is not None:
+        raise error
+
+    if progress is not None:
+        progress(index_written=True)
+    return {pdf_name: fields[pdf_name] for pdf_name in pdf_names}
+
+
+def save_to_faiss(
+    docs: List[Document],
+    username: str,
+    pdf_name: str,
+    progress: Optional[Callable[..., None]] = None,
+) -> dict:
+    """Add one document's chunks to the owner's collection, see add_documents; returns its catalog fields."""
+    if not docs:
+        raise ValueError(f"No chunks to index for {pdf_name}.")
+    return add_documents(username, {pdf_name: docs}, progress=progress)[pdf_name]
+
+
+def remove_documents(username: str, pdf_names: List[str]) -> Dict[str, int]:
+    """
+    Remove documents from the owner's collection in one write, returning {pdf_name: chunks removed}.
+    Nothing is written if none of them is indexed.
+    """
+    removed = {pdf_name: 0 for pdf_name in pdf_names}
+
+    def remove(collection, staging):
+        if collection is None:
+            return None
+        for pdf_name in pdf_names:
+            removed[pdf_name] = collection.remove(pdf_name)
+        return collection if any(removed.values()) else None
+
+    _update(_owner(username), remove)
+    return removed
+
+
+def remove_from_faiss(username: str, pdf_name: str) -> int:
+    """Remove a document's chunks from the owner's collection, returning how many were removed."""
+    return remove_documents(username, [pdf_name])[pdf_name]
+
+
+def load_collection(username: Optional[str]) -> Optional[DocumentCollection]:
+    """
+    Load the collection holding all of a user's documents (or the public ones).
+
+    - Collections are served from the process-wide index cache and reloaded when their files change
+    - The index is memory-mapped read-only and chunk text is read from SQLite only for the hits
+    - On first use, legacy pickled indexes are migrated into the collection
+    """
+    owner = _owner(username)
+    if not _collection_exists(owner):
+        if not _has_pickled(owner):
+            return None
+        # Returning the migrated collection (or None) makes _update save it; no-op if another thread did
+        _update(owner, lambda collection, staging: collection if not _collection_exists(owner) else None)
+        if not _collection_exists(owner):
+            return None
+
+    return index_cache.get(owner, get_collection_path(owner), _read_collection)
+
+
+def warm_up_embeddings() -> None:
+    """Build the embeddings client (importing its SDK), or load the local model, ahead of the first query."""
+    embeddings = embedding_model.embeddings
+    if isinstance(embeddings, LazyEmbeddings):
+        embeddings = embeddings.load()
+    if isinstance(embeddings, LocalEmbeddings):
+        # The first forward pass is slower than the next ones; it costs nothing but CPU here
+        embeddings.embed_query("warm-up")
+
+
+def warm_up_collections(owners: List[str]) -> Dict[str, str]:
+    """
+    Load the owners' collections into the index cache and page their vectors in with one search,
+    so the first chat against them does not pay for it. Returns {owner: error} for failures.
+    """
+    failed = {}
+    for owner in owners:
+        try:
+            collection = load_collection(owner)
+            if collection is None:
+                continue
+            collection.search([0.0] * collection.dimension, k=1)
+            print(f"Warmed up the {owner} collection ({collection.ntotal} vectors).")
+        except Exception as e:
+            print(f"Warm-up failed for the {owner} collection: {e}")
+            failed[owner] = str(e)
+    return failed
+
+
+def document_chunks(username: Optional[str], pdf_name: str) -> List[Document]:
+    """Return a document's indexed chunks, in their original order, without re-parsing it."""
+    collection = load_collection(username)
+    if collection is None:
+        return []
+    labels = collection.labels([pdf_name])
+    chunks = collection.chunks(labels)
+    return [chunks[label] for label in labels if label in chunks]
+
+
+def describe_documents(username: Optional[str]) -> Dict[str, dict]:
+    """Return {pdf_name: catalog fields} for every document in the user's collection."""
+    collection = load_collection(username)
+    if collection is None:
+        return {}
+    owner = _owner(username)
+    return {
+        pdf_name: _index_fields(owner, collection.index_type, collection.ntotal, chunks)
+        for pdf_name, chunks in collection.chunk_counts().items()
+    }
+
+
+def search_documents(
+    documents: Dict[str, Optional[List[str]]], query_embedding: List[float], k: int = 5
+) -> List[Document]:
+    """
+    Return the k chunks closest to the query across several collections.
+
+    documents maps an owner to the pdf_names to search in their collection,
+    or to None to search all of that owner's documents.
+    """
+    return search_documents_batch(documents, [query_embedding], k=k)[0]
+
+
+def search_documents_batch(
+    documents: Dict[str, Optional[List[str]]], query_embeddings: List[List[float]], k: int = 5
+) -> List[List[Document]]:
+    """
+    search_documents for several queries at once: each collection is searched with the whole
+    query matrix in one call. Returns the k closest chunks of each query, in query order.
+    """
+    hits: List[list] = [[] for _ in query_embeddings]
+    for owner, pdf_names in documents.items():
+        with stage("load_index"):
+            collection = load_collection(owner)
+        if collection is None:
+            continue
+        with stage("search"):
+            for query_hits, owner_hits in zip(hits, collection.search_batch(query_embeddings, k, pdf_names)):
+                query_hits.extend(owner_hits)
+    for query_hits in hits:
+        query_hits.sort(key=lambda hit: hit[1])
+    return [[doc for doc, _ in query_hits[:k]] for query_hits in hits]
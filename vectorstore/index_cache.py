@@ -0,0 +1,155 @@
+# vectorstore/index_cache.py
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+# Upper bound for all cached indexes together (defaults to 512 MB)
+INDEX_CACHE_MAX_BYTES = int(os.getenv("FAISS_INDEX_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+Signature = Tuple[Tuple[str, int, int], ...]
+
+
+def index_signature(index_path: str) -> Optional[Signature]:
+    """
+    Return (file name, mtime, size) for every file of an index directory,
+    or None if the directory does not exist or is empty.
+    """
+    if not os.path.isdir(index_path):
+        return None
+
+    signature = []
+    for name in sorted(os.listdir(index_path)):
+        file_path = os.path.join(index_path, name)
+        if not os.path.isfile(file_path):
+            continue
+        stat = os.stat(file_path)
+        signature.append((name, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature) or None
+
+
+class _Entry:
+    __slots__ = ("value", "signature", "size")
+
+    def __init__(self, value: Any, signature: Signature, size: int):
+        self.value = value
+        self.signature = signature
+        self.size = size
+
+
+class IndexCache:
+    """
+    Process-wide LRU cache of loaded FAISS indexes.
+
+    - Entries are keyed by owner (one collection per user, plus "public")
+    - An entry is dropped as soon as the files it was loaded from change on disk (mtime/size)
+    - The on-disk size of the cached indexes is kept under max_bytes, least recently used first
+    """
+
+    def __init__(self, max_bytes: int = INDEX_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._load_locks: Dict[Hashable, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable, index_path: str, loader: Callable[[str], Any]) -> Optional[Any]:
+        """
+        Return the cached index for key, loading it with loader(index_path) on a miss
+        or when the files on disk no longer match the cached copy.
+        """
+        signature = index_signature(index_path)
+        if signature is None:
+            self.invalidate(key)
+            return None
+
+        value = self._lookup(key, signature)
+        if value is not None:
+            return value
+
+        # Only one thread loads a given index, the others wait and reuse it
+        with self._load_lock(key):
+            value = self._lookup(key, signature, count=False)
+            if value is not None:
+                return value
+
+            with self._lock:
+                self.misses += 1
+            value = loader(index_path)
+            if value is not None:
+                self._store(key, value, signature)
+            return value
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drop a single entry, e.g. after its index was rebuilt."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry.size
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _lookup(self, key: Hashable, signature: Signature, count: bool = True) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.signature != signature:
+                # Index was rewritten on disk since we loaded it
+                del self._entries[key]
+                self._bytes -= entry.size
+                self.invalidations += 1
+                return None
+            self._entries.move_to_end(key)
+            if count:
+                self.hits += 1
+            return entry.value
+
+    def _store(self, key: Hashable, value: Any, signature: Signature) -> None:
+        size = sum(file_size for _, _, file_size in signature)
+        if size > self.max_bytes:
+            print(f"Index {key} ({size} bytes) exceeds the cache budget, not caching it.")
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.size
+            self._entries[key] = _Entry(value, signature, size)
+            self._bytes += size
+
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+                self.evictions += 1
+
+    def _load_lock(self, key: Hashable) -> threading.Lock:
+        with self._lock:
+            lock = self._load_locks.get(key)
+            if lock is None:
+                lock = self._load_locks[key] = threading.Lock()
+            return lock
+
+
+index_cache = IndexCache()
@@ -0,0 +1,137 @@
+# vectorstore/index_types.py
+
+import math
+import os
+from typing import Optional
+
+import faiss
+import numpy as np
+
+# "auto" picks the index type from the number of vectors; "flat", "hnsw" or "ivfpq" forces one
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "auto").lower()
+INDEX_TYPES = ("flat", "hnsw", "ivfpq")
+
+# auto: flat below HNSW_MIN_VECTORS, HNSW below IVFPQ_MIN_VECTORS, IVF-PQ above
+HNSW_MIN_VECTORS = int(os.getenv("FAISS_HNSW_MIN_VECTORS", "20000"))
+IVFPQ_MIN_VECTORS = int(os.getenv("FAISS_IVFPQ_MIN_VECTORS", "200000"))
+
+HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("FAISS_HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", "128"))
+
+# 0 means derived from the corpus: nlist ~ 4 * sqrt(n), one PQ sub-quantizer (1 byte) per 8 dimensions
+IVF_NLIST = int(os.getenv("FAISS_IVF_NLIST", "0"))
+IVF_NPROBE = int(os.getenv("FAISS_IVF_NPROBE", "16"))
+PQ_M = int(os.getenv("FAISS_PQ_M", "0"))
+PQ_NBITS = 8
+# Filtered searches over at most this many vectors are done exactly on the stored vectors:
+# approximate indexes can miss most of a small subset (HNSW graph walk, unprobed IVF lists)
+EXACT_FILTER_MAX_VECTORS = int(os.getenv("FAISS_EXACT_FILTER_MAX_VECTORS", "4096"))
+# Training points per IVF list (k-means wants ~39 per centroid, more buys little)
+IVF_TRAIN_POINTS_PER_LIST = 64
+
+
+def index_type(index: faiss.Index) -> str:
+    """Return the type name ("flat", "hnsw" or "ivfpq") of a FAISS index."""
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivfpq"
+    return "flat"
+
+
+def min_ivfpq_vectors(ntotal: int) -> int:
+    # Both the coarse quantizer and the 256-centroid PQ codebooks need enough training points
+    return max(_nlist(ntotal), 2 ** PQ_NBITS) * 4
+
+
+def choose_index_type(ntotal: int, current: Optional[str] = None, configured: str = FAISS_INDEX_TYPE) -> str:
+    """
+    Return the index type a collection of ntotal vectors should use.
+
+    - A configured type is used as is, except IVF-PQ falls back to flat when there are
+      too few vectors to train its codebooks
+    - In auto mode the type follows the size thresholds but never steps back down,
+      so deleting a few documents does not trigger a rebuild
+    """
+    if configured in INDEX_TYPES:
+        if configured == "ivfpq" and ntotal < min_ivfpq_vectors(ntotal):
+            return "flat"
+        return configured
+
+    if ntotal >= IVFPQ_MIN_VECTORS:
+        wanted = "ivfpq"
+    elif ntotal >= HNSW_MIN_VECTORS:
+        wanted = "hnsw"
+    else:
+        wanted = "flat"
+    if current is not None and INDEX_TYPES.index(current) > INDEX_TYPES.index(wanted):
+        return current
+    return wanted
+
+
+def _nlist(ntotal: int) -> int:
+    return IVF_NLIST or max(1, min(65536, int(4 * math.sqrt(ntotal))))
+
+
+def _pq_m(dimension: int) -> int:
+    if PQ_M:
+        return PQ_M
+    m = max(1, dimension // 8)
+    while dimension % m:
+        m -= 1
+    return m
+
+
+def build_index(kind: str, vectors: np.ndarray) -> faiss.Index:
+    """Create an index of the given type holding vectors (labels 0..n-1), training it if needed."""
+    dimension = vectors.shape[1]
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    elif kind == "ivfpq":
+        nlist = _nlist(len(vectors))
+        index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dimension), dimension, nlist, _pq_m(dimension), PQ_NBITS)
+        sample = vectors
+        max_train = nlist * IVF_TRAIN_POINTS_PER_LIST
+        if len(vectors) > max_train:
+            sample = vectors[np.random.default_rng(0).choice(len(vectors), max_train, replace=False)]
+        index.train(sample)
+        index.nprobe = IVF_NPROBE
+        # Lets chunks be removed and reconstructed by label without renumbering the rest
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    else:
+        index = faiss.IndexFlatL2(dimension)
+
+    if len(vectors):
+        if kind == "ivfpq":
+            index.add_with_ids(vectors, np.arange(len(vectors), dtype=np.int64))
+        else:
+            index.add(vectors)
+    return index
+
+
+def search_params(
+    index: faiss.Index, selector=None, k: int = 1, ef_search: Optional[int] = None, nprobe: Optional[int] = None
+) -> Optional[faiss.SearchParameters]:
+    """
+    Return search parameters for an index: the optional ID selector plus
+    efSearch (HNSW, at least k) or nprobe (IVF), defaulting to the configured values.
+    """
+    kind = index_type(index)
+    if kind == "hnsw":
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=max(k, ef_search or HNSW_EF_SEARCH))
+    if kind == "ivfpq":
+        return faiss.SearchParametersIVF(sel=selector, nprobe=nprobe or IVF_NPROBE)
+    if selector is not None:
+        return faiss.SearchParameters(sel=selector)
+    return None
+
+
+def bytes_per_vector(index: faiss.Index) -> float:
+    """Serialized index size divided by the number of vectors it holds."""
+    if index.ntotal == 0:
+        return 0.0
+    return faiss.serialize_index(index).nbytes / index.ntotal